@@ -1,5 +1,4 @@
 from app import cache
-import json
 import time
 from typing import List, Literal
 from psycopg2 import Error, OperationalError
@@ -7,10 +6,18 @@ from psycopg2.extras import DictCursor
 from app.dao.dao_utils import build_where
 from app.database.database_connection import get_connection
 from app.utils.logging_config import app_logger, error_logger
+from data_pipeline.models.dados_referencia import dados_referencia
 
 
-with open('data_pipeline/tabelas_auxiliares/setores.json', 'r', encoding='utf-8') as f:
-    setores: dict = json.load(f)
+def tabela_sh4_setor() -> tuple[str, tuple[str, ...]]:
+    """
+    Correspondência SH4 → setor de setores.json como uma tabela VALUES para JOIN,
+    para somar todos os setores em uma única consulta. Retorna o SQL e os parâmetros.
+    """
+    sh4_setor = dados_referencia().sh4_setor()
+    valores = ', '.join(['(%s, %s)'] * len(sh4_setor))
+    parametros = tuple(valor for linha in sh4_setor.itertuples(index=False) for valor in linha)
+    return f"(VALUES {valores}) AS setores(id_sh4, setor)", parametros
 
 
 def busca_todos_sh4() -> List[dict] | None:
@@ -82,6 +89,44 @@ def busca_vlfob_sh4(
         return None
     
 
+@cache.memoize(timeout=60*60*24)
+def busca_vlfob_setores(
+        anos: tuple[int, ...] | None = None,
+        estados: tuple[int, ...] | None = None
+) -> dict[str, dict] | None:
+    """
+    Versão de busca_vlfob_sh4 para todos os setores de uma vez: {setor: {total_valor_fob_exp, total_valor_fob_imp}}.
+    """
+    try:
+        with get_connection() as conn:
+            with conn.cursor(cursor_factory=DictCursor) as cur:
+                setores_sql, parametros = tabela_sh4_setor()
+                where_statement = build_where(anos=anos, estados=estados)
+                query = f"""
+                    SELECT
+                        setores.setor,
+                        COALESCE(SUM(valor_fob_exp), 0) AS total_valor_fob_exp,
+                        COALESCE(SUM(valor_fob_imp), 0) AS total_valor_fob_imp
+                    FROM mv_vlfob_setores
+                    JOIN {setores_sql} ON setores.id_sh4 = mv_vlfob_setores.id_sh4
+                    {where_statement}
+                    GROUP BY setores.setor
+                """
+                inicio = time.time()
+                cur.execute(query, parametros)
+                por_setor = {row['setor']: dict(row) for row in cur.fetchall()}
+                fim = time.time()
+                app_logger.info(f"Busca de vl_fob por setor realizada com sucesso. Tempo de execução: {fim-inicio :.4f} seg")
+                vazio = {'total_valor_fob_exp': 0, 'total_valor_fob_imp': 0}
+                return {
+                    setor: {chave: por_setor.get(setor, vazio)[chave] for chave in vazio}
+                    for setor in dados_referencia().setores()
+                }
+    except (Error, OperationalError) as e:
+        error_logger.error(f"Erro ao buscar valores por setor. Erro: {str(e)}")
+        return None
+
+
 @cache.memoize(timeout=60*60*24)
 def busca_sh4_info(sh4:str):
     try: 
@@ -187,8 +232,7 @@ def sh4_hist(
 
 @cache.memoize(timeout=60*60*24)
 def busca_info_setor(setor: str, tipo:str, anos:tuple[int,...]|None, pais:int|None, estado:int|None):
-    global setores    
-    sh4_list = tuple(setores.get(setor, {}).get('sh4', []))
+    sh4_list = tuple(dados_referencia().setores().get(setor, {}).get('sh4', []))
     sh4_values = ', '.join(f"'{codigo}'" for codigo in sh4_list)
 
     where_statement = f"""
@@ -222,11 +266,46 @@ def busca_info_setor(setor: str, tipo:str, anos:tuple[int,...]|None, pais:int|No
 
 @cache.memoize(timeout=60*60*24)
 def busca_info_setores(anos:tuple[int,...]|None, pais:int|None, estado:int|None):
-    global setores
+    """
+    Soma exportação e importação de todos os setores com uma consulta por tipo,
+    juntando as transações à tabela SH4 → setor em vez de consultar cada setor separadamente.
+    """
+    setores_sql, parametros = tabela_sh4_setor()
+    where_statement = f"""
+        WHERE TRUE {f"AND id_pais = {pais}" if pais else ""} {f"AND id_estado = {estado}" if estado else ""}
+    """
+    if anos:
+        anos_sql = ', '.join(str(ano) for ano in anos)
+        where_statement += f" AND ano IN ({anos_sql})"
+    por_tipo = {}
+    try:
+        with get_connection() as conn:
+            with conn.cursor(cursor_factory=DictCursor) as cur:
+                for tipo in ('exp', 'imp'):
+                    query = f"""
+                        SELECT
+                            setores.setor,
+                            SUM(valor_fob) as valor_fob_{tipo},
+                            CAST(SUM(valor_fob)/NULLIF(SUM(kg_liquido), 0) AS DECIMAL(15,2)) AS valor_agregado_{tipo}
+                        FROM {tipo}ortacao_estado e
+                        JOIN produto p ON p.id_ncm = e.id_produto
+                        JOIN {setores_sql} ON setores.id_sh4 = p.id_sh4
+                        {where_statement}
+                        GROUP BY setores.setor
+                    """
+                    inicio = time.time()
+                    cur.execute(query, parametros)
+                    por_tipo[tipo] = {row['setor']: dict(row) for row in cur.fetchall()}
+                    fim = time.time()
+                    app_logger.info(f"Busca de dados de {tipo} por setor concluída com sucesso. Tempo: {fim - inicio:.4f} segundos")
+    except (Error, OperationalError) as e:
+        error_logger.error(f"Erro ao buscar informações dos setores no banco de dados: {str(e)}")
+        return
+
     resposta = []
-    for setor in setores.keys():
-        info_exp = busca_info_setor(setor, 'exp', anos, pais, estado)
-        info_imp = busca_info_setor(setor, 'imp', anos, pais, estado)
+    for setor in dados_referencia().setores():
+        info_exp = por_tipo['exp'].get(setor)
+        info_imp = por_tipo['imp'].get(setor)
         resposta.append({
             "setor": setor,
             "valor_fob_exp" : info_exp.get('valor_fob_exp') if info_exp else 0,
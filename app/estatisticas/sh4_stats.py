@@ -3,12 +3,12 @@ from typing import List, Literal
 import pandas as pd
 
 from app.dao import sh4_dao
-from app.estatisticas.stats_utils import filtrar_df
+from app.estatisticas.stats_utils import data_ano_mes, filtrar_df
 from app.models.vidente import Vidente
 
 path = 'data_pipeline/datasets/dados_agregados/mv_sh4_mensal.csv'
 
-# 'CO_SH4,CO_PAIS,SG_UF_NCM,VL_FOB_EXP,KG_LIQUIDO_EXP,VL_FOB_IMP,KG_LIQUIDO_IMP,DATA'
+# 'CO_SH4,CO_PAIS,SG_UF_NCM,VL_FOB_EXP,KG_LIQUIDO_EXP,VL_FOB_IMP,KG_LIQUIDO_IMP,PERIODO'
 
 def hist_sh4 (df:pd.DataFrame, tipo:str, crit=Literal['KG_LIQUIDO', 'VL_FOB', 'balanca', 'valor_agregado']):
     coluna_crit = f"{crit}_{tipo}" if crit != 'balanca' else crit
@@ -63,7 +63,7 @@ def tendencia_sh4(sh4: List[str], estado: List[int] = None, pais: List[int] = No
     df['ano'] = df['ano'].astype(int)
     df['mes'] = df['mes'].astype(int)
 
-    df['DATA'] = pd.to_datetime(df['ano'].astype(str) + '-' + df['mes'].astype(str).str.zfill(2))
+    df['DATA'] = data_ano_mes(df)
     df = df.fillna(0)
     df = df.groupby('DATA').agg({
         'VL_FOB_EXP': 'sum',
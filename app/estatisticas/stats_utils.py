@@ -7,6 +7,7 @@ from app.dao.dao_utils import build_where
 from app.database.database_connection import get_connection
 from app.utils.logging_config import app_logger, error_logger
 from app import cache
+from data_pipeline.models.esquema_comexstat import data_do_periodo, periodo
 
 
 def filtrar_df(
@@ -36,6 +37,13 @@ def filtrar_df(
     return df
 
 
+def data_ano_mes(df: pd.DataFrame) -> pd.Series:
+    """
+    Primeiro dia do mês de cada linha, a partir das colunas ano e mes devolvidas pelo banco.
+    """
+    return data_do_periodo(periodo(df['ano'], df['mes']))
+
+
 def historico_vlfob_dataframe(tipo:str, ncm:List[int]=None, estados:List[int]=None, paises:List[int]=None) -> pd.DataFrame:
     where_statement = build_where(paises=paises, estados=estados, ncm=ncm)
     where_statement = where_statement.replace("produto.id_ncm", "id_produto")
@@ -70,7 +78,7 @@ def historico_vlfob_dataframe(tipo:str, ncm:List[int]=None, estados:List[int]=No
     if not dict_filtrado: return pd.DataFrame(columns=['DATA', f'valor_fob_{tipo}'])
     df = pd.DataFrame(dict_filtrado)
     df[f'valor_fob_{tipo}'] = df[f'valor_fob_{tipo}'].astype(float)
-    df['DATA'] = pd.to_datetime(df['ano'].astype(str) + '-' + df['mes'].astype(str).str.zfill(2))
+    df['DATA'] = data_ano_mes(df)
     df = df.drop(columns=['ano', 'mes'])
     df = df.fillna(0)
     return df if len(df) > 0 else pd.DataFrame(columns=['DATA', f'valor_fob_{tipo}'])
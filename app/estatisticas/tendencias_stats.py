@@ -4,6 +4,7 @@ from psycopg2 import Error, OperationalError
 from psycopg2.extras import DictCursor
 
 from app.database.database_connection import get_connection
+from app.estatisticas.stats_utils import data_ano_mes
 from data_pipeline.models.vidente import Vidente
 
 
@@ -39,9 +40,8 @@ def get_dataframe_ncm(tipo:str, ncm:int=None, estado:int=None, pais:int=None) ->
         df[f'valor_fob_{tipo}'] = df[f'valor_fob_{tipo}'].astype(float)
         df[f'kg_liquido_{tipo}'] = df[f'kg_liquido_{tipo}'].astype(float)
         df[f'valor_agregado_{tipo}'] = df[f'valor_fob_{tipo}'] / df[f'kg_liquido_{tipo}'].replace(0, pd.NA)
-        df['DATA'] = pd.to_datetime(df['ano'].astype(str) + '-' + df['mes'].astype(str).str.zfill(2))
+        df['DATA'] = data_ano_mes(df)
         df = df.drop(columns=['ano', 'mes'])
-        df['DATA'] = pd.to_datetime(df['DATA'])
         print(df.columns)
         return df
     except (Error, OperationalError) as e:
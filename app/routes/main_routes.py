@@ -1,4 +1,4 @@
-from flask import Blueprint, json, jsonify, request
+from flask import Blueprint, jsonify, request
 import psutil
 import os
 from app.dao import sh4_dao, transacao_dao
@@ -42,13 +42,7 @@ def busca_vlfob_setores():
     if not isinstance(args, dict):
         return jsonify({'error': f'Erro na requisição: {args}'}), 400
     
-    with open('app/static/setores.json') as json_file:
-        setores = json.load(json_file)
-    
-    res = {}
-    for setor, codes in setores.items():
-        args['sh4'] = tuple(codes.get('sh4'))
-        res[setor] = sh4_dao.busca_vlfob_sh4(**args)[0]
+    res = sh4_dao.busca_vlfob_setores(**args)
     return routes_utils.return_response(res)
 
 
@@ -0,0 +1,13 @@
+import argparse
+
+from database.init_db import atualiza_mes
+from dotenv_config import variaveis_de_ambiente
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Acrescenta um mês de dados já limpos ao banco e atualiza os agregados afetados")
+    parser.add_argument("ano", type=int)
+    parser.add_argument("mes", type=int)
+    args = parser.parse_args()
+    variaveis_de_ambiente()
+    atualiza_mes(args.ano, args.mes)
@@ -1,20 +1,20 @@
 import pandas as pd
 from tabulate import tabulate
 
+from .tabela_limpa import ler_tabela_limpa
+
 
 class AnaliseBalancaComercial:
     def __init__(self, ano:int):
         self.ano = ano
-        self.exp_df = pd.read_csv(f"./datasets/limpo/{ano}/EXP_{ano}.csv", delimiter=',', encoding='latin1')
-        self.imp_df = pd.read_csv(f"./datasets/limpo/{ano}/IMP_{ano}.csv", delimiter=',', encoding='latin1')
+        self.exp_df: pd.DataFrame | None = None
+        self.imp_df: pd.DataFrame | None = None
+        self.busca_tabelas()
 
 
     def busca_tabelas(self):
-        base_url = f"./datasets/limpo/{self.ano}/"
-        exp_url = base_url + f"EXP_{self.ano}.csv"
-        imp_url = base_url + f"IMP_{self.ano}.csv"
-        self.exp_df = pd.read_csv(exp_url, delimiter=',', encoding='latin1')
-        self.imp_df = pd.read_csv(imp_url, delimiter=',', encoding='latin1')
+        self.exp_df = ler_tabela_limpa(self.ano, f"EXP_{self.ano}", ["VL_FOB"], diretorio="./datasets/limpo")
+        self.imp_df = ler_tabela_limpa(self.ano, f"IMP_{self.ano}", ["VL_FOB"], diretorio="./datasets/limpo")
 
 
     def calcula_balanca_comercial(self):
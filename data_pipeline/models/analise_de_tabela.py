@@ -4,6 +4,8 @@ from tabulate import tabulate
 import matplotlib.pyplot as plt
 
 from .tabelasComexStat import TabelasComexStat
+from .dados_referencia import dados_referencia
+from .tabela_limpa import ler_tabela_limpa
 
 class AnaliseDeTabela:
     def __init__(self, ano:int, tipo:Literal["exp", "imp"], mun:bool):
@@ -11,16 +13,15 @@ class AnaliseDeTabela:
         self.tipo = tipo
         self.mun = mun
         self.tabelas = TabelasComexStat()
-        tabela_url = self.gera_tabela_url()
-        self.df = pd.read_csv(tabela_url, delimiter=',', encoding='latin1')
+        self.referencia = dados_referencia()
+        self.df = ler_tabela_limpa(self.ano, self.gera_nome_arquivo(), diretorio="./datasets/limpo")
     
 
-    def gera_tabela_url(self):
+    def gera_nome_arquivo(self):
         nome_arquivo = f"{self.tipo.upper()}_{self.ano}"
         if self.mun:
             nome_arquivo += f"_MUN"
-        tabela_url = f"./datasets/limpo/{self.ano}/{nome_arquivo}.csv"
-        return tabela_url
+        return nome_arquivo
 
     
     def geral(self):
@@ -45,8 +46,7 @@ class AnaliseDeTabela:
             .nlargest(10)
             .reset_index(name="VALOR_AGREGADO")
         )
-        auxiliar_ncm = self.tabelas.auxiliar('NCM')
-        df_ncm = pd.read_csv(auxiliar_ncm, delimiter=';', encoding='latin1')
+        df_ncm = self.referencia.tabela('NCM')
         top_10_ncm = top_10_ncm.merge(df_ncm, on="CO_NCM", how="left")
         top_10_ncm = top_10_ncm[["NO_NCM_POR", "VALOR_AGREGADO"]]
         top_10_ncm_lista = top_10_ncm.values.tolist()
@@ -56,8 +56,7 @@ class AnaliseDeTabela:
 
     def ncm_por_fob(self):
         top_10_ncm = self.df.groupby("CO_NCM")["VL_FOB"].sum().nlargest(10).reset_index()
-        auxiliar_ncm = self.tabelas.auxiliar('NCM')
-        df_ncm = pd.read_csv(auxiliar_ncm, delimiter=';', encoding='latin1')
+        df_ncm = self.referencia.tabela('NCM')
         top_10_ncm = top_10_ncm.merge(df_ncm, on="CO_NCM", how="left")
         top_10_ncm = top_10_ncm[["NO_NCM_POR", "VL_FOB"]]
         top_10_ncm["VL_FOB"] = top_10_ncm["VL_FOB"].apply(lambda x: f"{x:,.2f}")
@@ -68,8 +67,7 @@ class AnaliseDeTabela:
 
     def ncm_por_kg(self):
         top_10_ncm = self.df.groupby("CO_NCM")["KG_LIQUIDO"].sum().nlargest(10).reset_index()
-        auxiliar_ncm = self.tabelas.auxiliar('NCM')
-        df_ncm = pd.read_csv(auxiliar_ncm, delimiter=';', encoding='latin1')
+        df_ncm = self.referencia.tabela('NCM')
         top_10_ncm = top_10_ncm.merge(df_ncm, on="CO_NCM", how="left")
         top_10_ncm = top_10_ncm[["NO_NCM_POR", "KG_LIQUIDO"]]
         top_10_ncm["KG_LIQUIDO"] = top_10_ncm["KG_LIQUIDO"].apply(lambda x: f"{x:,.2f}")
@@ -80,8 +78,7 @@ class AnaliseDeTabela:
     
     def top_10_paises(self):
         top_10 = self.df['CO_PAIS'].value_counts().head(10).reset_index()
-        auxiliar_pais = self.tabelas.auxiliar('PAIS')
-        df_pais = pd.read_csv(auxiliar_pais, delimiter=';', encoding='latin1')
+        df_pais = self.referencia.tabela('PAIS')
         top_10 = top_10.merge(df_pais, on="CO_PAIS", how="left")
         top_10 = top_10[["NO_PAIS", "count"]]
         top_10["count"] = top_10["count"].apply(lambda x: f"{x:,.2f}")
@@ -101,10 +98,10 @@ class AnaliseDeTabela:
     
     
     def top_estados(self):
-        top_estados = self.df['SG_UF_NCM'].value_counts().reset_index()
+        top_estados = self.df['SG_UF_NCM'].value_counts().loc[lambda contagem: contagem > 0].reset_index()
         top_estados.columns = ['SG_UF_NCM', 'Quantidade de Registros']
 
-        estado_destino = self.df.groupby('SG_UF_NCM')[['VL_FOB', 'KG_LIQUIDO']].sum().reset_index()
+        estado_destino = self.df.groupby('SG_UF_NCM', observed=True)[['VL_FOB', 'KG_LIQUIDO']].sum().reset_index()
         estado_destino['VALOR_AGREGADO'] = estado_destino['VL_FOB'] / estado_destino['KG_LIQUIDO']
 
         estados_completos = top_estados.merge(estado_destino[['SG_UF_NCM', 'VALOR_AGREGADO']], on='SG_UF_NCM', how='left')
@@ -118,8 +115,7 @@ class AnaliseDeTabela:
 
     def top_vias(self):
         top_vias = self.df['CO_VIA'].value_counts().head(10).reset_index()
-        auxiliar_vias = self.tabelas.auxiliar("VIA")
-        df_via = pd.read_csv(auxiliar_vias, delimiter=";", encoding="latin1")
+        df_via = self.referencia.tabela('VIA')
         top_vias = top_vias.merge(df_via, on="CO_VIA", how="left")
         top_vias = top_vias[["NO_VIA", "count"]]
         top_vias["count"] = top_vias["count"].apply(lambda x: f"{x:,.2f}")
@@ -6,6 +6,8 @@ import statsmodels.api as sm
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from datetime import datetime, timedelta
 
+from data_pipeline.models.esquema_comexstat import data_do_periodo
+
 
 def analise_sazonalidade(df: pd.DataFrame, ncm:int|None = None, estado:str|None=None, pais:str|None=None):
     """
@@ -19,8 +21,7 @@ def analise_sazonalidade(df: pd.DataFrame, ncm:int|None = None, estado:str|None=
     if pais:
         df = df[df['CO_PAIS'] == pais]
     df = df.fillna(0)
-    df['DATA'] = pd.to_datetime(df['DATA'])
-    df['mes'] = df['DATA'].dt.month 
+    df['mes'] = df['PERIODO'] % 100
 
     # Filtra valores maiores que zero
     df_export = df[df['VL_FOB_EXP'] > 0]
@@ -85,15 +86,13 @@ def analise_hhi(
     else:
         filtro = "CO_NCM"
 
-    df['DATA'] = pd.to_datetime(df['DATA'])
-
-    df_grouped = df.groupby([pd.Grouper(key='DATA', freq='MS'), filtro]).agg({
+    df_grouped = df.groupby(['PERIODO', filtro]).agg({
         'VL_FOB_EXP': 'sum',
         'VL_FOB_IMP': 'sum'
     }).reset_index()
 
     df_long = df_grouped.melt(
-        id_vars=['DATA', filtro],
+        id_vars=['PERIODO', filtro],
         value_vars=['VL_FOB_EXP', 'VL_FOB_IMP'],
         var_name='tipo',
         value_name='valor'
@@ -104,16 +103,16 @@ def analise_hhi(
         'VL_FOB_IMP': 'importacao'
     })
 
-    df_long['total_mes'] = df_long.groupby(['DATA', 'tipo'])['valor'].transform('sum')
+    df_long['total_mes'] = df_long.groupby(['PERIODO', 'tipo'])['valor'].transform('sum')
     df_long['participacao'] = df_long['valor'] / df_long['total_mes']
 
-    df_hhi = df_long.groupby(['DATA', 'tipo'])['participacao'] \
+    df_hhi = df_long.groupby(['PERIODO', 'tipo'])['participacao'] \
         .apply(lambda x: (x**2).sum()).reset_index(name='hhi')
 
-    df_hhi_pivot = df_hhi.pivot(index='DATA', columns='tipo', values='hhi').reset_index()
-    df_hhi_pivot['mes'] = df_hhi_pivot['DATA'].dt.strftime('%Y-%m')
+    df_hhi_pivot = df_hhi.pivot(index='PERIODO', columns='tipo', values='hhi').reset_index()
+    df_hhi_pivot['mes'] = data_do_periodo(df_hhi_pivot['PERIODO']).dt.strftime('%Y-%m')
 
-    df_hhi_pivot = df_hhi_pivot.fillna(0).sort_values('DATA')
+    df_hhi_pivot = df_hhi_pivot.fillna(0).sort_values('PERIODO')
 
     dados_json = df_hhi_pivot[['mes', 'exportacao', 'importacao']].rename(
         columns={'exportacao': 'hhi_exportacao', 'importacao': 'hhi_importacao'}
@@ -0,0 +1,204 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Mesmos loggers de app.utils.logging_config, obtidos pelo nome para que o módulo
+# também funcione nos scripts executados de dentro de data_pipeline/
+app_logger = logging.getLogger("app")
+error_logger = logging.getLogger("error")
+
+
+DIRETORIO_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datasets', 'cache_comexstat')
+
+# Intervalo em que um arquivo do cache é usado sem consultar o servidor
+TTL_PADRAO = 24 * 60 * 60
+
+# Tempo que um objeto substituído é mantido antes de ser apagado: outro processo pode ter recebido
+# o caminho dele de local() e ainda não tê-lo aberto
+CARENCIA_OBJETOS = 24 * 60 * 60
+
+
+@contextmanager
+def trava_arquivo(caminho:str):
+    '''
+        Trava exclusiva entre processos sobre `caminho` (criado se não existir), liberada ao sair do bloco.
+    '''
+    with open(caminho, 'a+b') as arquivo:
+        if fcntl is not None:
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+        else:
+            arquivo.seek(0)
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+            else:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CacheComexStat:
+    '''
+        Espelho local das tabelas do ComexStat.
+        Cada arquivo baixado é gravado em objetos/{sha256}.csv e o indice.json associa a URL ao hash,
+        ao ETag e ao Last-Modified devolvidos pelo servidor. Depois do TTL, a URL é revalidada com uma
+        requisição condicional, e o arquivo só é baixado de novo se o servidor indicar que ele mudou.
+        Sem acesso ao servidor, a última versão do cache continua sendo usada.
+        Os objetos que deixam de ser referenciados pelo índice são apagados depois de CARENCIA_OBJETOS.
+    '''
+    def __init__(self, diretorio:str = DIRETORIO_CACHE, ttl:float = TTL_PADRAO, timeout:float = 60):
+        self.diretorio = diretorio
+        self.dir_objetos = os.path.join(diretorio, 'objetos')
+        self.caminho_indice = os.path.join(diretorio, 'indice.json')
+        self.caminho_trava = os.path.join(diretorio, 'indice.lock')
+        self.ttl = ttl
+        self.timeout = timeout
+        os.makedirs(self.dir_objetos, exist_ok=True)
+
+
+    def caminho_objeto(self, sha256:str) -> str:
+        return os.path.join(self.dir_objetos, f'{sha256}.csv')
+
+
+    def le_indice(self) -> dict:
+        try:
+            with open(self.caminho_indice, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+
+    def atualiza_indice(self, url:str, registro:dict) -> None:
+        '''
+            Mais de um processo pode usar o cache ao mesmo tempo, então o índice é relido e regravado
+            com a trava de indice.lock, e substituído de forma atômica para que as leituras sem trava
+            nunca vejam um arquivo pela metade. Se nenhuma outra URL referenciar o objeto anterior de `url`,
+            a data de modificação dele passa a marcar quando foi substituído, e limpa_objetos o apaga
+            depois da carência.
+        '''
+        with trava_arquivo(self.caminho_trava):
+            indice = self.le_indice()
+            anterior = indice.get(url)
+            indice[url] = registro
+            self.grava_indice(indice)
+            substituido = anterior is not None and anterior['sha256'] not in {r['sha256'] for r in indice.values()}
+            if substituido:
+                try:
+                    os.utime(self.caminho_objeto(anterior['sha256']))
+                except FileNotFoundError:
+                    pass
+        if substituido:
+            self.limpa_objetos()
+
+
+    def grava_indice(self, indice:dict) -> None:
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as arquivo:
+            json.dump(indice, arquivo, indent=2)
+        os.replace(temporario, self.caminho_indice)
+
+
+    def limpa_objetos(self, carencia:float = CARENCIA_OBJETOS) -> int:
+        '''
+            Apaga os objetos que o índice não referencia (ex: substituídos ou deixados por versões anteriores
+            do cache) e que não foram modificados nos últimos `carencia` segundos.
+            Os downloads em andamento (.part) são mantidos. Retorna a quantidade de objetos apagados.
+        '''
+        limite = time.time() - carencia
+        with trava_arquivo(self.caminho_trava):
+            referenciados = {registro['sha256'] for registro in self.le_indice().values()}
+            orfaos = [
+                caminho for caminho in glob.glob(os.path.join(self.dir_objetos, '*.csv'))
+                if os.path.splitext(os.path.basename(caminho))[0] not in referenciados
+                and os.path.getmtime(caminho) <= limite
+            ]
+            for caminho in orfaos:
+                os.remove(caminho)
+                app_logger.info(f"Objeto {os.path.basename(caminho)[:12]} removido do cache")
+        return len(orfaos)
+
+
+    def local(self, url:str) -> str:
+        '''
+            Retorna o caminho local do arquivo de `url`, baixando-o apenas se ainda não estiver no cache
+            ou se tiver mudado no servidor.
+        '''
+        registro = self.le_indice().get(url)
+        if registro and not os.path.exists(self.caminho_objeto(registro['sha256'])):
+            registro = None
+        if registro and time.time() - registro['verificado_em'] < self.ttl:
+            return self.caminho_objeto(registro['sha256'])
+
+        requisicao = Request(url)
+        if registro and registro.get('etag'):
+            requisicao.add_header('If-None-Match', registro['etag'])
+        if registro and registro.get('last_modified'):
+            requisicao.add_header('If-Modified-Since', registro['last_modified'])
+
+        try:
+            with urlopen(requisicao, timeout=self.timeout) as resposta:
+                sha256 = self.baixa(resposta)
+                registro = {
+                    'sha256': sha256,
+                    'etag': resposta.headers.get('ETag'),
+                    'last_modified': resposta.headers.get('Last-Modified'),
+                    'verificado_em': time.time()
+                }
+            app_logger.info(f"Arquivo {url} baixado para o cache ({sha256[:12]})")
+        except HTTPError as e:
+            if not registro:
+                raise
+            if e.code != 304:
+                error_logger.error(f"Erro {e.code} ao revalidar {url}, usando a versão em cache")
+                return self.caminho_objeto(registro['sha256'])
+            registro['verificado_em'] = time.time()
+        except URLError as e:
+            if not registro:
+                raise
+            error_logger.error(f"Não foi possível revalidar {url}, usando a versão em cache: {str(e.reason)}")
+            return self.caminho_objeto(registro['sha256'])
+
+        self.atualiza_indice(url, registro)
+        return self.caminho_objeto(registro['sha256'])
+
+
+    def baixa(self, resposta) -> str:
+        '''
+            Grava a resposta em um arquivo temporário calculando o sha256 durante a leitura
+            e o move para o caminho endereçado pelo conteúdo.
+        '''
+        sha = hashlib.sha256()
+        fd, temporario = tempfile.mkstemp(dir=self.dir_objetos, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as arquivo:
+                for bloco in iter(lambda: resposta.read(1024 * 1024), b''):
+                    sha.update(bloco)
+                    arquivo.write(bloco)
+            sha256 = sha.hexdigest()
+            destino = self.caminho_objeto(sha256)
+            if os.path.exists(destino):
+                os.remove(temporario)
+            else:
+                os.replace(temporario, destino)
+            return sha256
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
@@ -0,0 +1,133 @@
+import json
+import threading
+from functools import cache
+
+import numpy as np
+import pandas as pd
+
+from .tabelasComexStat import TabelasComexStat
+
+
+CAMINHO_CODIGOS_SH = 'data_pipeline/tabelas_auxiliares/codigos.csv'
+CAMINHO_SETORES = 'data_pipeline/tabelas_auxiliares/setores.json'
+
+# Maior código aceito em nomes_por_codigo; acima disso o vetor ocuparia memória demais (ex: NCM, URF)
+MAIOR_CODIGO_VETOR = 100_000
+
+
+class DadosReferencia:
+    '''
+        Tabelas auxiliares do ComexStat (PAIS, PAIS_BLOCO, UF, VIA, NCM, ...) e as tabelas locais codigos.csv e setores.json,
+        lidas uma única vez por processo e compartilhadas pela limpeza, pelas análises e pela carga do banco.
+        Use dados_referencia() para obter a instância do processo.
+        Os DataFrames devolvidos são compartilhados e não devem ser alterados no lugar.
+    '''
+    def __init__(self, tabelas:TabelasComexStat | None = None):
+        self.tabelas = tabelas or TabelasComexStat()
+        self.lidas: dict[str, pd.DataFrame] = {}
+        self.mapas: dict[tuple[str, str, str], pd.Series] = {}
+        self.vetores: dict[tuple[str, str, str], np.ndarray] = {}
+        self.setores_lidos: dict | None = None
+        # A carga em lotes lê as tabelas a partir de mais de uma thread
+        self.trava = threading.RLock()
+
+
+    def tabela(self, nome:str) -> pd.DataFrame:
+        '''
+            Tabela auxiliar `nome` do ComexStat (ver TabelasComexStat.auxiliar), lida do cache local.
+        '''
+        with self.trava:
+            if nome not in self.lidas:
+                self.lidas[nome] = pd.read_csv(self.tabelas.auxiliar_local(nome), delimiter=';', encoding='latin1')
+            return self.lidas[nome]
+
+
+    def codigos_sh(self) -> pd.DataFrame:
+        '''
+            Correspondência NCM → SH4 → SH2 com as descrições, de data_pipeline/tabelas_auxiliares/codigos.csv.
+        '''
+        with self.trava:
+            if 'codigos_sh' not in self.lidas:
+                self.lidas['codigos_sh'] = pd.read_csv(
+                    CAMINHO_CODIGOS_SH, delimiter=';', encoding='utf-8', dtype={'CO_SH4': str, 'CO_SH2': str}
+                )
+            return self.lidas['codigos_sh']
+
+
+    def setores(self) -> dict:
+        '''
+            Conteúdo de data_pipeline/tabelas_auxiliares/setores.json: {setor: {'sh4': [...], 'sh2': [...], 'cgce': [...]}}.
+        '''
+        with self.trava:
+            if self.setores_lidos is None:
+                with open(CAMINHO_SETORES, 'r', encoding='utf-8') as arquivo:
+                    self.setores_lidos = json.load(arquivo)
+            return self.setores_lidos
+
+
+    def sh4_setor(self) -> pd.DataFrame:
+        '''
+            Tabela de correspondência SH4 → setor (colunas CO_SH4 e setor, com os nomes de setores.json),
+            para somar por setor com um merge em vez de filtrar os dados uma vez por setor.
+            Um SH4 presente em mais de um setor aparece uma vez para cada setor.
+        '''
+        with self.trava:
+            if 'sh4_setor' not in self.lidas:
+                self.lidas['sh4_setor'] = pd.DataFrame(
+                    [(sh4, setor) for setor, codigos in self.setores().items() for sh4 in codigos.get('sh4', [])],
+                    columns=['CO_SH4', 'setor']
+                ).astype({'CO_SH4': str, 'setor': str})
+            return self.lidas['sh4_setor']
+
+
+    def mapa(self, nome:str, coluna_chave:str, coluna_valor:str) -> pd.Series:
+        '''
+            Series indexada por `coluna_chave` com o `coluna_valor` correspondente, para uso com Series.map.
+            Chaves repetidas mantêm o primeiro valor.
+        '''
+        chave = (nome, coluna_chave, coluna_valor)
+        with self.trava:
+            if chave not in self.mapas:
+                df = self.codigos_sh() if nome == 'codigos_sh' else self.tabela(nome)
+                df = df.drop_duplicates(subset=[coluna_chave])
+                self.mapas[chave] = df.set_index(coluna_chave)[coluna_valor]
+            return self.mapas[chave]
+
+
+    def nomes_por_codigo(self, nome:str, coluna_codigo:str, coluna_nome:str) -> np.ndarray:
+        '''
+            Vetor em que a posição `codigo` guarda o nome correspondente (None para códigos ausentes),
+            para tabelas de códigos inteiros pequenos como VIA e PAIS. nomeia usa o vetor para traduzir
+            uma coluna inteira de códigos sem merge.
+        '''
+        chave = (nome, coluna_codigo, coluna_nome)
+        with self.trava:
+            if chave not in self.vetores:
+                mapa = self.mapa(nome, coluna_codigo, coluna_nome)
+                maior = int(mapa.index.max())
+                if maior > MAIOR_CODIGO_VETOR:
+                    raise ValueError(f"Códigos de {nome}.{coluna_codigo} vão até {maior}; use mapa()")
+                vetor = np.full(maior + 1, None, dtype=object)
+                vetor[mapa.index.to_numpy(dtype=np.int64)] = mapa.to_numpy()
+                self.vetores[chave] = vetor
+            return self.vetores[chave]
+
+
+    def nomeia(self, codigos:pd.Series, nome:str, coluna_codigo:str, coluna_nome:str) -> pd.Series:
+        '''
+            Traduz a coluna `codigos` para os nomes de `coluna_nome`; códigos desconhecidos viram None.
+        '''
+        vetor = self.nomes_por_codigo(nome, coluna_codigo, coluna_nome)
+        posicoes = codigos.to_numpy(dtype=np.int64)
+        validos = (posicoes >= 0) & (posicoes < len(vetor))
+        nomes = np.full(len(posicoes), None, dtype=object)
+        nomes[validos] = vetor[posicoes[validos]]
+        return pd.Series(nomes, index=codigos.index, name=coluna_nome)
+
+
+@cache
+def dados_referencia() -> DadosReferencia:
+    '''
+        Instância de DadosReferencia compartilhada pelo processo.
+    '''
+    return DadosReferencia()
@@ -0,0 +1,85 @@
+import pandas as pd
+
+
+# Siglas da tabela UF do ComexStat: as 27 unidades da federação e os códigos especiais
+# (exterior, consumo de bordo, mercadoria nacionalizada, reexportação, estados diversos, não declarada, zona não declarada)
+UFS = [
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO',
+    'EX', 'CB', 'MN', 'RE', 'ED', 'ND', 'ZN',
+]
+TIPO_UF = pd.CategoricalDtype(UFS)
+
+# Tipos das colunas das tabelas do ComexStat. Os códigos usam o menor inteiro que comporta seus valores;
+# as medidas continuam em int64/float64 porque são somadas nos agregados.
+# Operações aritméticas com os códigos (ex: CO_ANO * 100) devem converter para int32/int64 antes.
+TIPOS_COLUNAS = {
+    'CO_ANO': 'int16',
+    'CO_MES': 'int8',
+    'CO_NCM': 'int32',
+    'CO_UNID': 'int16',
+    'CO_PAIS': 'int16',
+    'CO_VIA': 'int8',
+    'CO_URF': 'int32',
+    'CO_MUN': 'int32',
+    'SH4': 'int16',
+    'SG_UF_NCM': TIPO_UF,
+    'SG_UF_MUN': TIPO_UF,
+    'QT_ESTAT': 'int64',
+    'KG_LIQUIDO': 'int64',
+    'VL_FOB': 'int64',
+    'VL_FRETE': 'int64',
+    'VL_SEGURO': 'int64',
+    'VALOR_AGREGADO': 'float64',
+    # Mês dos agregados no formato aaaamm (ex: 202403), ver periodo()
+    'PERIODO': 'int32',
+}
+
+# Na leitura de CSV as siglas entram como categoria livre; aplica_tipos as converte para TIPO_UF,
+# acusando siglas fora da lista em vez de transformá-las em NaN.
+TIPOS_LEITURA = {
+    coluna: 'category' if tipo is TIPO_UF else tipo
+    for coluna, tipo in TIPOS_COLUNAS.items()
+}
+
+
+def aplica_tipos(df:pd.DataFrame) -> pd.DataFrame:
+    '''
+        Converte as colunas conhecidas de `df` para os tipos de TIPOS_COLUNAS.
+    '''
+    tipos = {coluna: tipo for coluna, tipo in TIPOS_COLUNAS.items() if coluna in df.columns and df[coluna].dtype != tipo}
+    for coluna, tipo in tipos.items():
+        if tipo is TIPO_UF:
+            desconhecidas = set(df[coluna].dropna().unique()) - set(UFS)
+            if desconhecidas:
+                raise ValueError(f"Siglas desconhecidas em {coluna}: {sorted(desconhecidas)}")
+    return df.astype(tipos) if tipos else df
+
+
+def le_csv_comexstat(caminho:str, **read_kwargs):
+    '''
+        pd.read_csv com os tipos de TIPOS_LEITURA para as colunas do ComexStat presentes no arquivo.
+        Com `chunksize`, retorna o leitor em lotes e aplica_tipos deve ser aplicado a cada lote.
+    '''
+    tipos = {**TIPOS_LEITURA, **read_kwargs.pop('dtype', {})}
+    resultado = pd.read_csv(caminho, dtype=tipos, **read_kwargs)
+    if read_kwargs.get('chunksize'):
+        return resultado
+    return aplica_tipos(resultado)
+
+
+def periodo(ano:pd.Series, mes:pd.Series) -> pd.Series:
+    '''
+        Mês no formato inteiro aaaamm (ex: 202403), calculado sem passar por texto.
+        Os agregados usam PERIODO em vez de uma coluna de datas; a conversão para data fica para quem
+        apresenta o resultado, com data_do_periodo, já sobre as linhas agrupadas.
+    '''
+    return (ano.astype('int32') * 100 + mes.astype('int32')).astype('int32')
+
+
+def data_do_periodo(periodo:pd.Series) -> pd.Series:
+    '''
+        Primeiro dia do mês de cada PERIODO (aaaamm).
+    '''
+    periodo = periodo.astype('int32')
+    return pd.to_datetime(pd.DataFrame({'year': periodo // 100, 'month': periodo % 100, 'day': 1}))
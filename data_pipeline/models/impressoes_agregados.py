@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from .cache_comexstat import CacheComexStat
+from .tabelasComexStat import TabelasComexStat
+
+
+# Módulos cujo código determina o conteúdo dos agregados; qualquer mudança neles invalida todos os agregados
+ARQUIVOS_CODIGO = (
+    'pre_processamento_tendencias.py', 'gera_dataframes.py', 'tabela_limpa.py', 'esquema_comexstat.py', 'dados_referencia.py'
+)
+
+
+def impressao_arquivo(caminho:str | None, tamanho_bloco:int = 1024 * 1024) -> str | None:
+    '''
+        sha256 do conteúdo do arquivo, ou None se ele não existir.
+    '''
+    if caminho is None or not os.path.exists(caminho):
+        return None
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def impressao_auxiliar(tabela:str) -> str | None:
+    '''
+        sha256 da tabela auxiliar no cache do ComexStat, que já é endereçado pelo conteúdo.
+        Não consulta o servidor; None se a tabela ainda não foi baixada.
+    '''
+    registro = CacheComexStat().le_indice().get(TabelasComexStat().auxiliar(tabela))
+    return registro['sha256'] if registro else None
+
+
+def versao_codigo() -> str:
+    '''
+        sha256 do código de ARQUIVOS_CODIGO, gravado junto de cada agregado.
+    '''
+    sha = hashlib.sha256()
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    for nome in ARQUIVOS_CODIGO:
+        with open(os.path.join(diretorio, nome), "rb") as arquivo:
+            sha.update(arquivo.read())
+    return sha.hexdigest()
+
+
+def caminho_impressao(caminho_saida:str) -> str:
+    '''
+        A impressão de data_pipeline/datasets/dados_agregados/mv_x.csv fica em mv_x.json, ao lado do CSV.
+    '''
+    return f'{os.path.splitext(caminho_saida)[0]}.json'
+
+
+def le_impressao(caminho_saida:str) -> dict | None:
+    try:
+        with open(caminho_impressao(caminho_saida), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def grava_impressao(caminho_saida:str, impressao:dict) -> None:
+    caminho = caminho_impressao(caminho_saida)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho) or '.', suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as arquivo:
+        json.dump(impressao, arquivo, indent=2)
+    os.replace(temporario, caminho)
+
+
+def remove_impressao(caminho_saida:str) -> None:
+    '''
+        Chamado antes de regravar o agregado: se a gravação for interrompida, o CSV fica sem impressão
+        e é gerado de novo por completo na próxima execução.
+    '''
+    caminho = caminho_impressao(caminho_saida)
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def anos_a_recalcular(anterior:dict | None, atual:dict, existe_saida:bool) -> list[int] | None:
+    '''
+        Compara a impressão gravada com a atual e retorna:
+            []            se o agregado está atualizado;
+            [anos]        se só as transações desses anos mudaram;
+            None          se o agregado precisa ser gerado por completo.
+        Impressões têm a forma {'versao_codigo', 'anos', 'transacoes': {'EXP_2014': sha, ...}, 'outras': {...}}.
+    '''
+    if not existe_saida or anterior is None:
+        return None
+    for chave in ('versao_codigo', 'anos', 'outras'):
+        if anterior.get(chave) != atual[chave]:
+            return None
+    transacoes_anteriores = anterior.get('transacoes', {})
+    return sorted({
+        int(nome.rsplit('_', 1)[1])
+        for nome, impressao in atual['transacoes'].items()
+        if transacoes_anteriores.get(nome) != impressao
+    })
@@ -1,34 +1,188 @@
+import hashlib
+import json
 import os
+from contextlib import nullcontext
+from typing import Iterator
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from .tabelasComexStat import TabelasComexStat
+from .dados_referencia import dados_referencia
+from .esquema_comexstat import UFS, aplica_tipos, le_csv_comexstat
+from .tabela_limpa import caminho_tabela_limpa, escritor_tabela_limpa, localiza_tabela_limpa, salvar_tabela_limpa
+from .registros_excluidos import escritor_registros_excluidos, salvar_registros_excluidos
+
+
+# Blocos econômicos (CO_BLOCO):
+#   51 - africa
+#   105 - am central e caribe
+#   107 - am do norte
+#   48 - am do sul
+#   39 - asia
+#   53 - sudeste asiatico
+#   112 - europa
+#   111 - mercosul
+#   61 - oceania
+#   41 - oriente medio
+#   22 - uniao europeia
+# Dicionário de compatibilidade entre vias de transporte e blocos econômicos
+VIAS_BLOCOS_INVALIDOS = {
+    6: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Ferroviária
+    7: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Rodoviária
+    2: [51, 39, 53, 112, 61, 41, 22],  # Fluvial
+    3: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Lacustre
+    13: [51, 105, 107, 39, 53, 112, 61, 41, 22], # Reboque
+    14: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Dutos: Oceania (não há dutos transoceânicos ligando a outros países)
+    15: [51, 105, 107, 39, 53, 112, 61, 41, 22], # Vicinal fronteiriço
+    8: [105, 107, 39, 53, 112, 61, 41, 22] # conduto/rede de transmissão
+}
+
+
+def gera_matriz_rotas_invalidas(pais_bloco:pd.DataFrame) -> np.ndarray:
+    '''
+        Cruza a matriz via × bloco de VIAS_BLOCOS_INVALIDOS com a tabela PAIS_BLOCO,
+        gerando a matriz via × país usada para filtrar as rotas absurdas.
+    '''
+    vias_blocos = pd.DataFrame(
+        [(via, bloco) for via, blocos in VIAS_BLOCOS_INVALIDOS.items() for bloco in blocos],
+        columns=['CO_VIA', 'CO_BLOCO']
+    )
+    pares = vias_blocos.merge(pais_bloco[['CO_PAIS', 'CO_BLOCO']], on='CO_BLOCO')
+    matriz = np.zeros((vias_blocos['CO_VIA'].max() + 1, pais_bloco['CO_PAIS'].max() + 1), dtype=bool)
+    matriz[pares['CO_VIA'].to_numpy(), pares['CO_PAIS'].to_numpy()] = True
+    return matriz
+
+
+def rotas_invalidas_mask(df:pd.DataFrame, matriz:np.ndarray) -> pd.Series:
+    '''
+        Consulta a matriz via × país para cada linha; códigos fora da matriz são rotas válidas.
+    '''
+    vias = df['CO_VIA'].to_numpy(dtype=np.int64)
+    paises = df['CO_PAIS'].to_numpy(dtype=np.int64)
+    dentro = (vias >= 0) & (vias < matriz.shape[0]) & (paises >= 0) & (paises < matriz.shape[1])
+    invalida = np.zeros(len(df), dtype=bool)
+    invalida[dentro] = matriz[vias[dentro], paises[dentro]]
+    return pd.Series(invalida, index=df.index)
+
+
+VIAS_VALIDAS = [1, 2, 3, 4, 5, 6, 7, 8, 13, 11, 15, 14]
+PAISES_INVALIDOS = [0, 990, 994, 995, 997, 998, 999]
+MUNICIPIOS_INVALIDOS = [9999999]
+URFS_INVALIDAS = [0, 9999999, 8110000, 1010109, 815400]
+ESTADOS_INVALIDOS = ['EX', 'CB', 'MN', 'RE', 'ED', 'ND', 'ZN']
+# Siglas fora de UFS (ex: um código novo do ComexStat) também são rejeitadas por estado_invalido,
+# já que aplica_tipos não as aceita na tabela limpa
+
+# Regras de limpeza, na ordem do relatório: (nome, coluna necessária, critério do relatório, máscara).
+# A máscara recebe o limpador e o DataFrame e marca as linhas que violam a regra.
+# O bit de cada regra em MOTIVOS é 1 << posição; a regra é ignorada se a tabela não tiver a coluna.
+REGRAS = [
+    ('peso_zero', 'KG_LIQUIDO', 'Registros inválidos por KG Líquido = 0',
+        lambda limpador, df: df['KG_LIQUIDO'] <= 0),
+    ('qt_estat_zero', 'QT_ESTAT', 'Registros inválidos por Quantidade Estatística = 0',
+        lambda limpador, df: df['QT_ESTAT'] <= 0),
+    ('sigla_nd', None, 'Registros inválidos por Siglas ND',
+        lambda limpador, df: df.select_dtypes(include=['object', 'category']).isin(["ND"]).any(axis=1)),
+    ('vl_fob_zero', 'VL_FOB', 'Registros inválidos por Valor FOB = 0',
+        lambda limpador, df: df['VL_FOB'] <= 0),
+    ('va_nan_inf', 'VALOR_AGREGADO', 'Registros inválidos por Valores Infinitos/NaN',
+        lambda limpador, df: ~np.isfinite(df['VALOR_AGREGADO'])),
+    ('via_invalida', 'CO_VIA', 'Registros inválidos por Vias de transporte inválidas',
+        lambda limpador, df: ~df['CO_VIA'].isin(VIAS_VALIDAS)),
+    ('rotas_absurdas', 'CO_VIA', 'Registros inválidos por Rotas absurdas',
+        lambda limpador, df: rotas_invalidas_mask(df, limpador.matriz_rotas_invalidas())),
+    ('pais_invalido', 'CO_PAIS', 'Registros inválidos por Países não definidos',
+        lambda limpador, df: df['CO_PAIS'].isin(PAISES_INVALIDOS)),
+    ('estado_invalido', 'SG_UF_NCM', 'Registros inválidos por Estados não definidos',
+        lambda limpador, df: df['SG_UF_NCM'].isin(ESTADOS_INVALIDOS) | ~df['SG_UF_NCM'].isin(UFS)),
+    ('municipio_invalido', 'CO_MUN', 'Registros inválidos por Município não declarado',
+        lambda limpador, df: df['CO_MUN'].isin(MUNICIPIOS_INVALIDOS)),
+    ('urf_invalido', 'CO_URF', 'Registros inválidos por URF não informada',
+        lambda limpador, df: df['CO_URF'].isin(URFS_INVALIDAS)),
+]
+BIT_MOTIVO = {regra[0]: 1 << posicao for posicao, regra in enumerate(REGRAS)}
+
+
+# Módulos cujo código determina o resultado da limpeza (ver LimpadorDeTabela.configuracao_limpeza)
+ARQUIVOS_LIMPEZA = ('limpador_de_tabela.py', 'esquema_comexstat.py')
+
+
+# Colunas somadas na agregação no grão; todas as demais (exceto VALOR_AGREGADO) formam o grão
+MEDIDAS = ['QT_ESTAT', 'KG_LIQUIDO', 'VL_FOB', 'VL_FRETE', 'VL_SEGURO']
+
+
+def agrega_grao(df:pd.DataFrame) -> pd.DataFrame:
+    '''
+        Junta as linhas que compartilham ano, mês, NCM, país, UF, via e URF (ou SH4, país, UF e município
+        nas tabelas por município), somando as medidas e recalculando VALOR_AGREGADO.
+    '''
+    medidas = [coluna for coluna in MEDIDAS if coluna in df.columns]
+    chaves = [coluna for coluna in df.columns if coluna not in medidas and coluna != 'VALOR_AGREGADO']
+    agregado = df.groupby(chaves, observed=True, sort=False, dropna=False, as_index=False)[medidas].sum()
+    if 'VALOR_AGREGADO' in df.columns:
+        agregado['VALOR_AGREGADO'] = agregado['VL_FOB'] / agregado['KG_LIQUIDO']
+    return agregado[df.columns]
+
+
+def regras_aplicaveis(df:pd.DataFrame) -> list[tuple]:
+    '''
+        Regras de REGRAS cujas colunas existem em `df`.
+    '''
+    return [regra for regra in REGRAS if regra[1] is None or regra[1] in df.columns]
 
 
 class LimpadorDeTabela:
-    def __init__(self):
+    def __init__(self, exportar_csv:bool = False, agregar_grao:bool = False):
+        '''
+            As tabelas limpas são gravadas em Parquet; `exportar_csv` grava também uma cópia em CSV.
+            Com `agregar_grao`, as linhas limpas que compartilham o mesmo grão são somadas (agrega_grao).
+        '''
         self.tabelas_cs = TabelasComexStat()
+        self.exportar_csv = exportar_csv
+        self.agregar_grao = agregar_grao
         self.ano:int
         self.tipo:str
-        self.df_raw: pd.DataFrame
-        self.df: pd.DataFrame
+        self.url: str
+        self.df_raw: pd.DataFrame | None = None
+        self.df: pd.DataFrame | None = None
         self.nome_arquivo: str
-        self.peso_zero: pd.DataFrame = pd.DataFrame({})
-        self.qt_estat_zero: pd.DataFrame = pd.DataFrame({})
-        self.sigla_nd:pd.DataFrame = pd.DataFrame({})
-        self.vl_fob_zero: pd.DataFrame = pd.DataFrame({})
-        self.va_nan_inf: pd.DataFrame = pd.DataFrame({})
-        self.co_via_invalida:pd.DataFrame = pd.DataFrame({})
-        self.rotas_absurdas:pd.DataFrame = pd.DataFrame({})
-        self.pais_invalido:pd.DataFrame = pd.DataFrame({})
-        self.municipio_invalido:pd.DataFrame = pd.DataFrame({})
-        self.estado_invalido:pd.DataFrame = pd.DataFrame({})
-        self.urf_invalido:pd.DataFrame = pd.DataFrame({})
+        self.rejeitados: pd.DataFrame = pd.DataFrame({})
+        self.linhas_iniciais: int = 0
+        self.linhas_finais: int = 0
+        self.linhas_agregadas: int = 0
+        self.contagem_motivos: dict[str, int] = {}
+        self.rotas_invalidas:np.ndarray | None = None
+
+
+    def configuracao_limpeza(self) -> str:
+        '''
+            Opções da limpeza e sha256 do código de ARQUIVOS_LIMPEZA, gravados no carga_manifest junto com
+            o hash do arquivo bruto para que uma mudança nas regras ou no agregar_grao recarregue o ano.
+        '''
+        sha = hashlib.sha256()
+        diretorio = os.path.dirname(os.path.abspath(__file__))
+        for nome in ARQUIVOS_LIMPEZA:
+            with open(os.path.join(diretorio, nome), "rb") as arquivo:
+                sha.update(arquivo.read())
+        return json.dumps({'agregar_grao': self.agregar_grao, 'codigo': sha.hexdigest()}, sort_keys=True)
 
 
     def gerar_dataframe(self, ano:int, tipo:str):
         '''
             - tipos suportados: 'exp', 'exp_mun', 'imp', 'imp_mun'
         '''
+        if not self.preparar_fonte(ano, tipo):
+            return False
+        self.df_raw = le_csv_comexstat(self.tabelas_cs.local(self.url), delimiter=';', encoding='latin1')
+        self.df = self.df_raw
+        return True
+
+
+    def preparar_fonte(self, ano:int, tipo:str) -> bool:
+        '''
+            Define a tabela de origem sem carregá-la.
+            Retorna False se a tabela limpa correspondente já existir.
+        '''
         tipo = tipo.lower()
         self.ano = ano
         if tipo == 'exp':
@@ -48,136 +202,59 @@ class LimpadorDeTabela:
             self.nome_arquivo = f'IMP_{ano}_MUN'
             self.tipo = tipo
         
+        self.url = url
         print(f'Buscando tabela {self.nome_arquivo}.csv')
 
-        if os.path.exists(f'data_pipeline/datasets/limpo/{self.ano}/{self.nome_arquivo}.csv'):
+        if localiza_tabela_limpa(self.ano, self.nome_arquivo):
             return False
-        
-        self.df_raw = pd.read_csv(url, delimiter=';', encoding='latin1')
-        self.df = self.df_raw
         return True
 
 
     def criar_valor_agregado(self):
         # Criar coluna de valor agregado (VL_FOB por KG_LIQUIDO)
         self.df_raw['VALOR_AGREGADO'] = self.df_raw['VL_FOB'] / self.df_raw['KG_LIQUIDO']
-        self.df['VALOR_AGREGADO'] = self.df['VL_FOB'] / self.df['KG_LIQUIDO']
-
-
-    def remover_peso_zero(self):
-        self.peso_zero = self.df[self.df['KG_LIQUIDO'] <= 0]
-        self.df = self.df[self.df['KG_LIQUIDO'] > 0]
-
-
-    def remover_qt_zero(self):
-        self.qt_estat_zero = self.df_raw[self.df_raw['QT_ESTAT'] <= 0]
-        self.df = self.df[self.df['QT_ESTAT'] > 0]
-
-
-    def remover_vl_fob_zero(self):
-        self.vl_fob_zero = self.df_raw[self.df_raw['VL_FOB'] <= 0]
-        self.df = self.df[self.df['VL_FOB'] > 0]
-    
-
-    def remover_sigla_nd(self):
-        self.sigla_nd = self.df_raw[self.df_raw.isin(["ND"]).any(axis=1)]
-        self.df = self.df[~self.df.isin(["ND"]).any(axis=1)].copy()
-
-
-    # def remover_sigla_nd(self):
-    #     if 'MUN' in self.nome_arquivo:
-    #         self.sigla_nd = self.df_raw[self.df_raw['SG_UF_MUN'] == 'ND']
-    #         self.df = self.df[self.df['SG_UF_MUN'] != 'ND'].copy()
-    #     else:
-    #         self.sigla_nd = self.df_raw[self.df_raw['SG_UF_NCM'] == 'ND']
-    #         self.df = self.df[self.df['SG_UF_NCM'] != 'ND'].copy()
-
-
-    def remover_va_inf_nan(self):
-        self.va_nan_inf = self.df_raw[self.df_raw['VALOR_AGREGADO'].isna() | self.df_raw['VALOR_AGREGADO'].isin([float('inf'), float('-inf')])]
-        self.df = self.df.dropna(subset=['VALOR_AGREGADO'])
-        self.df = self.df[~self.df['VALOR_AGREGADO'].isin([float('inf'), float('-inf')])]
 
 
-    def remover_via_invalida(self):
-        vias_validas = [1, 2, 3, 4, 5, 6, 7, 8, 13, 11, 15, 14]
-        vias_invalidas = [0, 9, 10, 99, 12]
-        self.co_via_invalida = self.df_raw[self.df_raw['CO_VIA'].isin(vias_invalidas)]
-        self.df = self.df[self.df['CO_VIA'].isin(vias_validas)]
-
-
-    def remover_pais_nao_definido(self):
-        paises_invalidos = [0, 990, 994, 995, 997, 998, 999]
-        self.pais_invalido = self.df_raw[self.df_raw['CO_PAIS'].isin(paises_invalidos)]
-        self.df = self.df[~self.df['CO_PAIS'].isin(paises_invalidos)].copy()
-    
-
-    def remover_municipio_nao_definido(self):
-        municipios_invalidos = [9999999]
-        self.municipio_invalido = self.df_raw[self.df_raw['CO_MUN'].isin(municipios_invalidos)]
-        self.df = self.df[~self.df['CO_MUN'].isin(municipios_invalidos)].copy()
+    def calcular_motivos(self, df:pd.DataFrame) -> np.ndarray:
+        '''
+            Avalia todas as regras sobre `df` e retorna, para cada linha, a soma dos bits
+            das regras violadas (0 para as linhas válidas).
+        '''
+        motivos = np.zeros(len(df), dtype=np.uint16)
+        for nome, _, _, mascara in regras_aplicaveis(df):
+            motivos[np.asarray(mascara(self, df), dtype=bool)] |= BIT_MOTIVO[nome]
+        return motivos
 
-    
-    def remover_urf_nao_definido(self):
-        urf_invalidos = [0, 9999999, 8110000, 1010109, 815400]
-        self.urf_invalido = self.df_raw[self.df_raw['CO_URF'].isin(urf_invalidos)]
-        self.df = self.df[~self.df['CO_URF'].isin(urf_invalidos)].copy()
-    
-    def remover_estado_nao_definido(self):
-        estados_invalidos = ['EX', 'CB', 'MN', 'RE', 'ED', 'ND', 'ZN']
-        self.estado_invalido = self.df_raw[self.df_raw['SG_UF_NCM'].isin(estados_invalidos)]
-        self.df = self.df[~self.df['SG_UF_NCM'].isin(estados_invalidos)].copy()
 
-    def remover_rotas_absurdas(self):
-        paises_url = self.tabelas_cs.auxiliar('PAIS_BLOCO')
-        pais_bloco = pd.read_csv(paises_url, delimiter=';', encoding='latin1')
+    def conta_motivos(self, motivos:np.ndarray) -> dict[str, int]:
+        return {nome: int(np.count_nonzero(motivos & bit)) for nome, bit in BIT_MOTIVO.items()}
 
-        df_merged = self.df.merge(pais_bloco[['CO_PAIS', 'CO_BLOCO', 'NO_BLOCO']], on='CO_PAIS', how='left')
 
+    def registros_por_motivo(self, nome:str) -> pd.DataFrame:
         '''
-            51 - africa
-            105 - am central e caribe
-            107 - am do norte
-            48 - am do sul
-            39 - asia
-            53 - sudeste asiatico
-            112 - europa
-            111 - mercosul
-            61 - oceania
-            41 - oriente medio
-            22 - uniao europeia
+            Registros excluídos pela regra `nome`, incluindo os que também violam outras regras.
         '''
-        # Dicionário atualizado de compatibilidade entre vias de transporte e blocos econômicos
-        vias_invalidas = {
-            6: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Ferroviária
-            7: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Rodoviária
-            2: [51, 39, 53, 112, 61, 41, 22],  # Fluvial
-            3: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Lacustre
-            13: [51, 105, 107, 39, 53, 112, 61, 41, 22], # Reboque
-            14: [51, 105, 107, 39, 53, 112, 61, 41, 22],  # Dutos: Oceania (não há dutos transoceânicos ligando a outros países)
-            15: [51, 105, 107, 39, 53, 112, 61, 41, 22], # Vicinal fronteiriço
-            8: [105, 107, 39, 53, 112, 61, 41, 22] # conduto/rede de transmissão
-        }
+        if self.rejeitados.empty:
+            return self.rejeitados
+        return self.rejeitados[(self.rejeitados['MOTIVOS'] & BIT_MOTIVO[nome]) != 0]
 
-        df_merged['via_invalida'] = df_merged.apply(
-            lambda row: row['CO_BLOCO'] in vias_invalidas.get(row['CO_VIA'], []),
-            axis=1
-        )
-        
-        self.rotas_absurdas = df_merged[df_merged['via_invalida']].drop(columns=['via_invalida','CO_BLOCO','NO_BLOCO']).copy()
 
-        # Filtrando os registros de df_maior que não estão em df_menor
-        # diferenca_df = df_maior[~df_maior.isin(df_menor)].dropna()
-        self.df = self.df[~self.df.isin(self.rotas_absurdas)].dropna()
+    def matriz_rotas_invalidas(self) -> np.ndarray:
+        '''
+            Matriz booleana [CO_VIA, CO_PAIS] que indica se o país pertence a algum bloco
+            incompatível com a via de transporte. É calculada uma vez por instância.
+        '''
+        if self.rotas_invalidas is None:
+            self.rotas_invalidas = gera_matriz_rotas_invalidas(dados_referencia().tabela('PAIS_BLOCO'))
+        return self.rotas_invalidas
 
 
     def gerar_grafico_vias_invalidas(self):
-        if not 'CO_VIA' in self.df.columns or len(self.co_via_invalida) <= 0:
+        co_via_invalida = self.registros_por_motivo('via_invalida')
+        if len(co_via_invalida) <= 0 or not 'CO_VIA' in self.df.columns:
             return
-        rotas_url = self.tabelas_cs.auxiliar('VIA')
-        rotas = pd.read_csv(rotas_url, delimiter=';', encoding='latin1')
-        df_merged = self.co_via_invalida.merge(rotas[['CO_VIA', 'NO_VIA']], on='CO_VIA', how='left')
-        contagem_por_via = df_merged.groupby('NO_VIA').size().reset_index(name='Quantidade')
+        nomes_vias = dados_referencia().nomeia(co_via_invalida['CO_VIA'], 'VIA', 'CO_VIA', 'NO_VIA')
+        contagem_por_via = nomes_vias.groupby(nomes_vias).size().reset_index(name='Quantidade')
 
         plt.figure(figsize=(10, 6))
         plt.bar(contagem_por_via['NO_VIA'], contagem_por_via['Quantidade'], color='skyblue')
@@ -192,12 +269,11 @@ class LimpadorDeTabela:
 
 
     def gerar_grafico_paises_invalidos(self):
-        if not 'CO_PAIS' in self.df.columns or len(self.pais_invalido) <= 0:
+        pais_invalido = self.registros_por_motivo('pais_invalido')
+        if len(pais_invalido) <= 0 or not 'CO_PAIS' in self.df.columns:
             return
-        paises_url = self.tabelas_cs.auxiliar('PAIS')
-        paises = pd.read_csv(paises_url, delimiter=';', encoding='latin1')
-        df_merged = self.pais_invalido.merge(paises[['CO_PAIS', 'NO_PAIS']], on='CO_PAIS', how='left')
-        contagem_por_pais = df_merged.groupby('NO_PAIS').size().reset_index(name='Quantidade')
+        nomes_paises = dados_referencia().nomeia(pais_invalido['CO_PAIS'], 'PAIS', 'CO_PAIS', 'NO_PAIS')
+        contagem_por_pais = nomes_paises.groupby(nomes_paises).size().reset_index(name='Quantidade')
         plt.figure(figsize=(10, 6))
         plt.bar(contagem_por_pais['NO_PAIS'], contagem_por_pais['Quantidade'], color='skyblue')
 
@@ -211,12 +287,10 @@ class LimpadorDeTabela:
 
 
     def gerar_grafico_estados_invalidos(self):
-        if not 'SG_UF_NCM' in self.df.columns or len(self.estado_invalido) <= 0:
+        estado_invalido = self.registros_por_motivo('estado_invalido')
+        if len(estado_invalido) <= 0 or not 'SG_UF_NCM' in self.df.columns:
             return
-        estados_url = self.tabelas_cs.auxiliar('UF')
-        estados = pd.read_csv(estados_url, delimiter=';', encoding='latin1')
-        df_merged = self.estado_invalido.merge(estados[['SG_UF', 'NO_UF']], left_on='SG_UF_NCM', right_on='SG_UF', how='left')
-        contagem_por_estado = df_merged.groupby('SG_UF_NCM').size().reset_index(name='Quantidade')
+        contagem_por_estado = estado_invalido.groupby('SG_UF_NCM', observed=True).size().reset_index(name='Quantidade')
         plt.figure(figsize=(10, 6))
         plt.bar(contagem_por_estado['SG_UF_NCM'], contagem_por_estado['Quantidade'], color='skyblue')
 
@@ -230,28 +304,22 @@ class LimpadorDeTabela:
 
 
     def gerar_relatorio_registros_excluidos(self):
-        len_df_raw = len(self.df_raw)
-        len_df = len(self.df)
+        len_df_raw = self.linhas_iniciais
+        len_df = self.linhas_finais
         linhas_invalidas = {
             'Quantidade de linhas iniciais': len_df_raw,
-            'Registros inválidos por KG Líquido = 0': len(getattr(self, 'peso_zero', [])),
-            'Registros inválidos por Quantidade Estatística = 0': len(getattr(self, 'qt_estat_zero', [])),
-            'Registros inválidos por Siglas ND': len(getattr(self, 'sigla_nd', [])),
-            'Registros inválidos por Valor FOB = 0': len(getattr(self, 'vl_fob_zero', [])),
-            'Registros inválidos por Valores Infinitos/NaN': len(getattr(self, 'va_nan_inf', [])),
-            'Registros inválidos por Vias de transporte inválidas': len(getattr(self, 'co_via_invalida', [])),
-            'Registros inválidos por Rotas absurdas': len(getattr(self, 'rotas_absurdas', [])),
-            'Registros inválidos por Países não definidos': len(getattr(self, 'pais_invalido', [])),
-            'Registros inválidos por Estados não definidos': len(getattr(self, 'estado_invalido', [])),
-            'Registros inválidos por Município não declarado': len(getattr(self, 'municipio_invalido', [])),
-            'Registros inválidos por URF não informada': len(getattr(self, 'urf_invalido', [])),
+            **{criterio: self.contagem_motivos.get(nome, 0) for nome, _, criterio, _ in REGRAS},
             'Quantidade de linhas finais': len_df,
             'Total de linhas excluídas': len_df_raw - len_df
         }
-        print(f"\n📊 Estatísticas dos Dados Brutos (Ano: {self.ano})")
-        print(self.df_raw.describe())
-        print(f"\n📊 Estatísticas dos Dados Limpos (Ano: {self.ano})")
-        print(self.df.describe())
+        if self.agregar_grao:
+            linhas_invalidas['Linhas após agregação no grão'] = self.linhas_agregadas
+        # Na limpeza em lotes as tabelas não ficam em memória
+        if self.df_raw is not None and self.df is not None:
+            print(f"\n📊 Estatísticas dos Dados Brutos (Ano: {self.ano})")
+            print(self.df_raw.describe())
+            print(f"\n📊 Estatísticas dos Dados Limpos (Ano: {self.ano})")
+            print(self.df.describe())
         
         from tabulate import tabulate
         print("\n📌 Resumo das Linhas Excluídas:\n")
@@ -272,57 +340,126 @@ class LimpadorDeTabela:
 
 
     def salvar_registros_excluidos(self):
-        def salvar_tabela(df:pd.DataFrame, nome:str):
-            try:
-                output_dir = f'data_pipeline/datasets/registros_excluidos/{self.ano}'
-                os.makedirs(output_dir, exist_ok=True)
-                path = f'{output_dir}/{self.tipo}_{self.ano}_{nome}.csv'
-                df.to_csv(path, index=False, encoding='latin1')
-                print(f'tabela {nome} salva em {path}')
-            except AttributeError as e:
-                print(e.name)
-                pass
-        mapa = {
-            'qt_estat_zero': self.qt_estat_zero,
-            'sigla_nd': self.sigla_nd,
-            'vl_fob_zero':self.vl_fob_zero,
-            'va_nan_inf': self.va_nan_inf,
-            'via_invalida': self.co_via_invalida,
-            'rotas_absurdas': self.rotas_absurdas,
-            'pais_invalido': self.pais_invalido,
-            'estado_invalido': self.estado_invalido,
-            'municipio_invalido': self.municipio_invalido,
-            'urf_invalido': self.urf_invalido
-        }
-        for key, value in mapa.items():
-            salvar_tabela(value, key)
+        '''
+            Grava os registros rejeitados na partição (ano, tipo) do dataset de registros excluídos.
+            Cada linha aparece uma única vez, com a coluna MOTIVOS indicando todas as regras violadas;
+            as consultas por motivo são feitas com registros_excluidos.ler_registros_excluidos.
+        '''
+        path = salvar_registros_excluidos(self.rejeitados, self.ano, self.tipo, BIT_MOTIVO)
+        print(f'{len(self.rejeitados)} registros excluídos salvos em {path}')
 
 
     def salvar_tabela_limpa(self):
-        output_dir = f'data_pipeline/datasets/limpo/{self.ano}'
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = f'{output_dir}/{self.nome_arquivo}.csv'
-        self.df.to_csv(output_path, index=False, encoding='latin1')
+        output_path = salvar_tabela_limpa(self.df, self.ano, self.nome_arquivo, self.exportar_csv)
         print(f"Dados limpos salvos em: {output_path}")
 
 
     def limpar(self):
-        colunas = self.df.columns
+        '''
+            Avalia todas as regras de REGRAS de uma vez sobre df_raw.
+            As linhas válidas vão para df e as demais para rejeitados, com a coluna MOTIVOS
+            indicando os bits de todas as regras que cada linha violou.
+        '''
         print(f'Iniciando limpeza da tabela {self.nome_arquivo}')
         self.criar_valor_agregado()
-        self.remover_peso_zero()
-        if 'QT_ESTAT' in colunas: self.remover_qt_zero() 
-        self.remover_vl_fob_zero()
-        self.remover_sigla_nd()
-        self.remover_va_inf_nan()
-        if 'CO_VIA' in colunas: 
-            self.remover_via_invalida()
-            self.remover_rotas_absurdas()
-        self.remover_pais_nao_definido()
-        if 'CO_MUN' in colunas: self.remover_municipio_nao_definido()
-        if 'SG_UF_NCM' in colunas: self.remover_estado_nao_definido()
-        if 'CO_URF' in colunas: self.remover_urf_nao_definido()
-        
+        motivos = self.calcular_motivos(self.df_raw)
+        validas = motivos == 0
+        self.df = self.df_raw[validas]
+        self.rejeitados = self.df_raw[~validas].assign(MOTIVOS=motivos[~validas])
+        self.linhas_iniciais = len(self.df_raw)
+        self.linhas_finais = len(self.df)
+        self.contagem_motivos = self.conta_motivos(motivos)
+        if self.agregar_grao:
+            self.df = agrega_grao(self.df)
+            self.linhas_agregadas = len(self.df)
+            self.informa_agregacao()
+
+
+    def informa_agregacao(self):
+        reducao = 1 - self.linhas_agregadas / self.linhas_finais if self.linhas_finais else 0
+        print(f'Agregação no grão de {self.nome_arquivo}: {self.linhas_finais} -> {self.linhas_agregadas} linhas ({reducao:.1%} a menos)')
+
+
+    def limpar_em_lotes(self, linhas_por_lote:int = 500_000, salvar_excluidos:bool = True):
+        '''
+            Limpa a tabela definida em preparar_fonte lendo-a em lotes de `linhas_por_lote` linhas.
+            Cada lote passa pelas mesmas regras de limpar e é acrescentado à tabela limpa e, com
+            `salvar_excluidos`, à partição (ano, tipo) dos registros excluídos (com MOTIVOS).
+            Apenas um lote fica em memória por vez; do restante são mantidas só as contagens usadas no relatório.
+        '''
+        print(f'Iniciando limpeza em lotes da tabela {self.nome_arquivo}')
+        caminho = caminho_tabela_limpa(self.ano, self.nome_arquivo)
+        for _ in self.lotes_limpos(linhas_por_lote, salvar_excluidos):
+            pass
+        print(f"Dados limpos salvos em: {caminho} ({self.linhas_finais} de {self.linhas_iniciais} linhas)")
+        if self.agregar_grao:
+            self.informa_agregacao()
+
+
+    def lotes_limpos(
+        self,
+        linhas_por_lote:int = 500_000,
+        salvar_excluidos:bool = True,
+        salvar_limpa:bool = True
+    ) -> Iterator[pd.DataFrame]:
+        '''
+            Gera os lotes limpos da tabela definida em preparar_fonte, para quem os consome diretamente
+            (ex: a carga no banco), sem passar por um arquivo intermediário.
+            Com `salvar_limpa` os lotes também são gravados na tabela limpa (e no CSV, se exportar_csv).
+            Os arquivos só são finalizados se todos os lotes forem consumidos; se o consumidor parar antes,
+            nenhum arquivo parcial é deixado.
+            Com agregar_grao as linhas limpas de cada lote são somadas no grão e juntadas às somas dos lotes
+            anteriores, que são recombinadas (a soma é associativa); a tabela agregada só é gravada e entregue,
+            em lotes de `linhas_por_lote` linhas, depois do último lote. Assim cada grão aparece uma única vez,
+            e a memória usada passa a ser proporcional à quantidade de grãos distintos.
+        '''
+        self.df_raw = None
+        self.df = None
+        self.rejeitados = pd.DataFrame({})
+        self.linhas_iniciais = 0
+        self.linhas_finais = 0
+        self.linhas_agregadas = 0
+        self.contagem_motivos = dict.fromkeys(BIT_MOTIVO, 0)
+        with (
+            escritor_tabela_limpa(self.ano, self.nome_arquivo, self.exportar_csv) if salvar_limpa else nullcontext() as limpo,
+            escritor_registros_excluidos(self.ano, self.tipo, BIT_MOTIVO) if salvar_excluidos else nullcontext() as excluidos,
+            le_csv_comexstat(self.tabelas_cs.local(self.url), delimiter=';', encoding='latin1', chunksize=linhas_por_lote) as leitor
+        ):
+            parciais: list[pd.DataFrame] = []
+            linhas_parciais = 0
+            for lote in leitor:
+                lote['VALOR_AGREGADO'] = lote['VL_FOB'] / lote['KG_LIQUIDO']
+                motivos = self.calcular_motivos(lote)
+                validas = motivos == 0
+                limpas = aplica_tipos(lote[validas])
+                if salvar_excluidos:
+                    excluidos.escreve(lote[~validas].assign(MOTIVOS=motivos[~validas]))
+                for nome, quantidade in self.conta_motivos(motivos).items():
+                    self.contagem_motivos[nome] += quantidade
+                self.linhas_iniciais += len(lote)
+                self.linhas_finais += int(validas.sum())
+                if self.agregar_grao:
+                    parciais.append(agrega_grao(limpas))
+                    linhas_parciais += len(parciais[-1])
+                    # Recombina quando as parciais novas passam do tamanho da já combinada, para não
+                    # reagrupar a tabela inteira a cada lote
+                    if linhas_parciais > 2 * max(len(parciais[0]), linhas_por_lote):
+                        parciais = [agrega_grao(pd.concat(parciais, ignore_index=True))]
+                        linhas_parciais = len(parciais[0])
+                    continue
+                if salvar_limpa:
+                    limpo.escreve(limpas)
+                yield limpas
+
+            if self.agregar_grao and parciais:
+                agregadas = agrega_grao(pd.concat(parciais, ignore_index=True)) if len(parciais) > 1 else parciais[0]
+                self.linhas_agregadas = len(agregadas)
+                for inicio in range(0, len(agregadas), linhas_por_lote):
+                    limpas = agregadas.iloc[inicio:inicio + linhas_por_lote]
+                    if salvar_limpa:
+                        limpo.escreve(limpas)
+                    yield limpas
+
 
     def limpar_e_salvar_tabelas(self):
         self.limpar()
@@ -1,37 +1,212 @@
-import json
-from threading import Thread
-from typing import Callable, List, Literal
+import copy
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack
+from typing import Callable, Iterator, List, Literal
 import pandas as pd
 from psycopg2 import Error
 import os
+from tabulate import tabulate
 
 from data_pipeline.models.gera_dataframes import GeradorDeDataFrames
+from data_pipeline.models.esquema_comexstat import le_csv_comexstat, periodo
+from data_pipeline.models.tabela_limpa import iterar_tabela_limpa, ler_tabela_limpa, localiza_tabela_limpa
+from data_pipeline.models.dados_referencia import CAMINHO_CODIGOS_SH, CAMINHO_SETORES, dados_referencia
+from data_pipeline.models.impressoes_agregados import (
+    anos_a_recalcular, grava_impressao, impressao_arquivo, impressao_auxiliar, le_impressao, remove_impressao, versao_codigo
+)
 
 from .tabelasComexStat import TabelasComexStat
 from app.utils.logging_config import app_logger, error_logger
 
 
+# Colunas das tabelas limpas usadas nos agregados
+COLUNAS_TRANSACOES = ['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_PAIS', 'SG_UF_NCM', 'KG_LIQUIDO', 'VL_FOB']
+
+# Setores de setores.json incluídos em mv_setores_mensal, com o nome usado no agregado
+SETORES_PADRAO = {
+    'Agronegócio': 'agronegocio',
+    'Indústria': 'industria',
+    'Mineração': 'mineracao',
+    'Setor Florestal': 'setor florestal',
+    'Tecnologia': 'tecnologia',
+    'Bens de consumo': 'bens de consumo'
+}
+
+# Agregados gerados por salvar_dados_agregados, pelo nome do arquivo:
+#   metodo/args: como gerar o agregado
+#   dependencias: agregados cujos arquivos ele lê
+#   transacoes: tabelas limpas lidas (EXP_{ano}, IMP_{ano}); esses agregados são separáveis por ano
+#   auxiliares/arquivos: tabelas auxiliares do ComexStat e arquivos locais lidos
+AGREGADOS = {
+    "mv_balanca_comercial": {"metodo": "balanca_comercial_mensal_estado_pais", "transacoes": ("EXP", "IMP")},
+    "mv_ncm_mensal_exp": {"metodo": "mv_ncm_mensal_estado_pais", "args": ('EXP',), "transacoes": ("EXP",)},
+    "mv_ncm_mensal_imp": {"metodo": "mv_ncm_mensal_estado_pais", "args": ('IMP',), "transacoes": ("IMP",)},
+    "mv_sh4_mensal": {
+        "metodo": "mv_sh4_mensal_estado_pais",
+        "transacoes": ("EXP", "IMP"),
+        "auxiliares": ("NCM", "NCM_UNIDADE"),
+        "arquivos": (CAMINHO_CODIGOS_SH,)
+    },
+    "mv_setores_mensal": {
+        "metodo": "mv_setores_mensal_estado_pais",
+        "dependencias": ("mv_sh4_mensal",),
+        "arquivos": (CAMINHO_SETORES,)
+    },
+    "mv_ncm_mensal": {"metodo": "mv_ncm_mensal", "dependencias": ("mv_ncm_mensal_exp", "mv_ncm_mensal_imp")},
+}
+
+
+def combina_parciais(parciais:list[pd.DataFrame], chaves:list[str]) -> pd.DataFrame:
+    '''
+        Junta somas parciais calculadas sobre partes diferentes das transações.
+        Como a soma é associativa, somar de novo as parciais pelas mesmas chaves dá o mesmo resultado
+        que agrupar todas as transações de uma vez.
+    '''
+    if len(parciais) == 1:
+        return parciais[0]
+    return pd.concat(parciais, ignore_index=True).groupby(chaves, as_index=False, observed=True).sum()
+
+
+def _gera_agregado(processador:"PreProcessador", nome:str, metodo:str, args:tuple, anos:list[int] | None = None) -> float:
+    '''
+        Com `anos`, recalcula apenas esses anos e substitui as linhas deles no arquivo existente.
+    '''
+    inicio = time.perf_counter()
+    if anos:
+        # Cópia para não alterar o PreProcessador do processo, reutilizado pelos próximos agregados
+        processador = copy.copy(processador)
+        processador.somente_anos = anos
+    df = getattr(processador, metodo)(*args)
+    if anos:
+        df = processador.substitui_anos(nome, df, anos)
+    processador.salvar_tabela(df, nome)
+    return time.perf_counter() - inicio
+
+
+# PreProcessador de cada processo do salvar_dados_agregados, criado por _inicia_processo
+_processador: "PreProcessador | None" = None
+
+
+def _inicia_processo(em_lotes:bool, linhas_por_lote:int | None, anos:range, output_dir:str) -> None:
+    global _processador
+    _processador = PreProcessador(em_lotes=em_lotes, linhas_por_lote=linhas_por_lote, anos=anos)
+    _processador.output_dir = output_dir
+
+
+def _gera_agregado_no_processo(nome:str, metodo:str, args:tuple, anos:list[int] | None) -> float:
+    return _gera_agregado(_processador, nome, metodo, args, anos)
+
+
 class PreProcessador:
-    def __init__(self):
+    def __init__(self, em_lotes:bool = False, linhas_por_lote:int | None = None, anos:range = range(2014, 2025)):
+        '''
+            Por padrão as transações de EXP e IMP ficam em memória, carregadas apenas quando o primeiro agregado
+            que as lê tem anos a recalcular; se todos os agregados estiverem atualizados, nada é lido.
+            Com `em_lotes`, cada agregado é calculado um ano por vez (ou em lotes de `linhas_por_lote` linhas
+            dentro do ano) e as somas parciais são combinadas, então apenas um ano e os agregados parciais
+            ficam em memória. Os agregados gerados são os mesmos nos dois modos.
+        '''
         self.tabelas = TabelasComexStat()
         self.base_df = GeradorDeDataFrames()
         self.output_dir:str = "data_pipeline/datasets/dados_agregados"
-        self.transacoes_exp = pd.DataFrame({})
-        self.transacoes_imp = pd.DataFrame({})
-
-        t1 = Thread(target=self.init_transacoes, args=("EXP", False))
-        t2 = Thread(target=self.init_transacoes, args=("IMP", False))
-        t1.start()
-        t2.start()
-        t1.join()
-        t2.join()
-    
+        self.em_lotes = em_lotes
+        self.linhas_por_lote = linhas_por_lote
+        self.anos = anos
+        # Restringe os agregados a estes anos (usado na atualização incremental)
+        self.somente_anos: list[int] | None = None
+        # Transações carregadas, por tipo; compartilhado com as cópias feitas em _gera_agregado
+        self._transacoes: dict[str, pd.DataFrame] = {}
+
+
     def init_transacoes(self, tipo: Literal["EXP", "IMP"], mun:bool) -> None:
-        tx = self.base_df.gera_transacoes_df(tipo, mun)
-        if tipo == "EXP":
-            self.transacoes_exp = tx
+        self._transacoes[tipo] = self.base_df.gera_transacoes_df(tipo, mun, COLUNAS_TRANSACOES)
+
+
+    def transacoes(self, tipo: Literal["EXP", "IMP"]) -> pd.DataFrame:
+        '''
+            Transações de `tipo` no modo em memória, lidas na primeira chamada.
+        '''
+        if tipo not in self._transacoes:
+            self.init_transacoes(tipo, False)
+        return self._transacoes[tipo]
+
+
+    def lotes_transacoes(self, tipo: Literal["EXP", "IMP"], ano:int) -> Iterator[pd.DataFrame]:
+        nome = f"{tipo}_{ano}"
+        app_logger.info(f"Lendo transações {nome}")
+        if self.linhas_por_lote:
+            yield from iterar_tabela_limpa(ano, nome, self.linhas_por_lote, COLUNAS_TRANSACOES)
         else:
-            self.transacoes_imp = tx
+            yield ler_tabela_limpa(ano, nome, COLUNAS_TRANSACOES)
+
+
+    def agrega_transacoes(
+        self,
+        tipo: Literal["EXP", "IMP"],
+        chaves:list[str],
+        somas:dict[str, str],
+        prepara:Callable[[pd.DataFrame], pd.DataFrame] | None = None
+    ) -> pd.DataFrame:
+        '''
+            Agrupa as transações de `tipo` por `chaves`, somando as colunas de `somas` ({coluna_saida: coluna}).
+            `prepara` é aplicado às transações antes do agrupamento (ex: filtros ou merge com o NCM).
+            No modo em_lotes o agrupamento é feito em cada lote e as parciais de cada ano são combinadas
+            ao fim do ano; as parciais anuais são combinadas ao final.
+        '''
+        def agrega(df:pd.DataFrame) -> pd.DataFrame:
+            if prepara is not None:
+                df = prepara(df)
+            return df.groupby(chaves, as_index=False, observed=True).agg(
+                **{saida: (coluna, 'sum') for saida, coluna in somas.items()}
+            )
+
+        if not self.em_lotes:
+            df = self.transacoes(tipo)
+            if self.somente_anos:
+                df = df[df['CO_ANO'].isin(self.somente_anos)]
+            return agrega(df)
+        parciais_anuais = []
+        for ano in self.somente_anos or self.anos:
+            parciais = [agrega(lote) for lote in self.lotes_transacoes(tipo, ano)]
+            if parciais:
+                parciais_anuais.append(combina_parciais(parciais, chaves))
+        return combina_parciais(parciais_anuais, chaves)
+
+
+    def substitui_anos(self, nome:str, df:pd.DataFrame, anos:list[int]) -> pd.DataFrame:
+        '''
+            Troca as linhas de `anos` do agregado salvo em `nome`.csv pelas de `df`, recalculadas.
+        '''
+        salvo = le_csv_comexstat(f"{self.output_dir}/{nome}.csv", encoding='latin1', dtype={'CO_SH4': str})
+        salvo = salvo[~(salvo['PERIODO'] // 100).isin(anos)]
+        return pd.concat([salvo, df], ignore_index=True).sort_values(by=['PERIODO'], kind='stable')
+
+
+    def impressao_entradas(self, nome:str, impressoes:dict[str, str | None]) -> dict:
+        '''
+            Impressão das entradas do agregado `nome` e do código que o gera, no formato de anos_a_recalcular.
+            `impressoes` guarda os hashes já calculados nesta execução, pelo caminho do arquivo.
+        '''
+        def impressao(caminho:str | None) -> str | None:
+            if caminho not in impressoes:
+                impressoes[caminho] = impressao_arquivo(caminho)
+            return impressoes[caminho]
+
+        agregado = AGREGADOS[nome]
+        transacoes = {
+            f"{tipo}_{ano}": impressao(localiza_tabela_limpa(ano, f"{tipo}_{ano}"))
+            for tipo in agregado.get("transacoes", ()) for ano in self.anos
+        }
+        outras = {tabela: impressao_auxiliar(tabela) for tabela in agregado.get("auxiliares", ())}
+        outras.update({caminho: impressao(caminho) for caminho in agregado.get("arquivos", ())})
+        outras.update({dep: impressao(f"{self.output_dir}/{dep}.csv") for dep in agregado.get("dependencias", ())})
+        return {
+            'versao_codigo': versao_codigo(),
+            'anos': list(self.anos),
+            'transacoes': transacoes,
+            'outras': outras,
+        }
 
 
     def salvar_tabela(self, tabela:pd.DataFrame, file_name:str) -> None:
@@ -45,28 +220,18 @@ class PreProcessador:
         app_logger.info("Criando agregado anual unificado de exportação e importação por estado, país e NCM.")
 
         # Dados de exportação
-        df_export = self.transacoes_exp.groupby(
+        df_export = self.agrega_transacoes(
+            "EXP",
             ['SG_UF_NCM', 'CO_ANO', 'CO_NCM', 'CO_PAIS'],
-            as_index=False
-        ).agg({
-            'VL_FOB': 'sum',
-            'KG_LIQUIDO': 'sum'
-        }).rename(columns={
-            'VL_FOB': 'VL_FOB_EXP',
-            'KG_LIQUIDO': 'KG_LIQUIDO_EXP'
-        })
+            {'VL_FOB_EXP': 'VL_FOB', 'KG_LIQUIDO_EXP': 'KG_LIQUIDO'}
+        )
 
         # Dados de importação
-        df_import = self.transacoes_imp.groupby(
+        df_import = self.agrega_transacoes(
+            "IMP",
             ['SG_UF_NCM', 'CO_ANO', 'CO_NCM', 'CO_PAIS'],
-            as_index=False
-        ).agg({
-            'VL_FOB': 'sum',
-            'KG_LIQUIDO': 'sum'
-        }).rename(columns={
-            'VL_FOB': 'VL_FOB_IMP',
-            'KG_LIQUIDO': 'KG_LIQUIDO_IMP'
-        })
+            {'VL_FOB_IMP': 'VL_FOB', 'KG_LIQUIDO_IMP': 'KG_LIQUIDO'}
+        )
 
         # Fazer a junção (merge) pelos campos em comum
         df_final = pd.merge(
@@ -87,13 +252,11 @@ class PreProcessador:
     
     def balanca_comercial_mensal_estado_pais(self) -> pd.DataFrame:
         app_logger.info("Criando balanca comercial por estado")
-        df_exp_grouped = self.transacoes_exp.groupby(['CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'], as_index=False).agg(
-            VL_FOB_EXP=('VL_FOB', 'sum'),
-            KG_LIQUIDO_EXP=('KG_LIQUIDO', 'sum')
+        df_exp_grouped = self.agrega_transacoes(
+            "EXP", ['CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'], {'VL_FOB_EXP': 'VL_FOB', 'KG_LIQUIDO_EXP': 'KG_LIQUIDO'}
         )
-        df_imp_grouped = self.transacoes_imp.groupby(['CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'], as_index=False).agg(
-            VL_FOB_IMP=('VL_FOB', 'sum'),
-            KG_LIQUIDO_IMP=('KG_LIQUIDO', 'sum')
+        df_imp_grouped = self.agrega_transacoes(
+            "IMP", ['CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'], {'VL_FOB_IMP': 'VL_FOB', 'KG_LIQUIDO_IMP': 'KG_LIQUIDO'}
         )
         df_balanca = pd.merge(
             df_exp_grouped, 
@@ -101,10 +264,7 @@ class PreProcessador:
             on=['CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'], 
             how='outer'
         )
-        df_balanca['CO_ANO'] = df_balanca['CO_ANO'].astype(int)
-        df_balanca['CO_MES'] = df_balanca['CO_MES'].astype(int)
-        df_balanca['DATA'] = pd.to_datetime(df_balanca['CO_ANO'].astype(str) + '-' + df_balanca['CO_MES'].astype(str).str.zfill(2))
-        df_balanca = df_balanca.drop(columns=['CO_ANO', 'CO_MES'])
+        df_balanca['PERIODO'] = periodo(df_balanca.pop('CO_ANO'), df_balanca.pop('CO_MES'))
 
         df_balanca['VL_FOB_EXP'] = df_balanca['VL_FOB_EXP'].fillna(0)
         df_balanca['VL_FOB_IMP'] = df_balanca['VL_FOB_IMP'].fillna(0)
@@ -112,7 +272,7 @@ class PreProcessador:
         df_balanca['KG_LIQUIDO_IMP'] = df_balanca['KG_LIQUIDO_IMP'].fillna(0)
         df_balanca['balanca_comercial'] = df_balanca['VL_FOB_EXP'] - df_balanca['VL_FOB_IMP']
 
-        df_balanca = df_balanca.sort_values(by=['DATA'])
+        df_balanca = df_balanca.sort_values(by=['PERIODO'])
         app_logger.info(f"Fim da criação de balanca comercial mensal por estado: {len(df_balanca)} linhas")
         return df_balanca
     
@@ -120,39 +280,29 @@ class PreProcessador:
     def mv_ncm_mensal_estado_pais(self, tipo: Literal['EXP', 'IMP']) -> pd.DataFrame:
         app_logger.info("Criando agregado mensal de NCM por estado e por pais")
 
-        if tipo == 'EXP':
-            df_ncm = self.transacoes_exp.groupby(['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_PAIS', 'SG_UF_NCM'], as_index=False).agg(
-                VL_FOB_EXP=('VL_FOB', 'sum'),
-            )
-        elif tipo == 'IMP':
-            df_ncm = self.transacoes_imp.groupby(['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_PAIS', 'SG_UF_NCM'], as_index=False).agg(
-                VL_FOB_IMP=('VL_FOB', 'sum'),
-            )
-        else:
+        if tipo not in ('EXP', 'IMP'):
             raise Error
-        df_ncm['CO_ANO'] = df_ncm['CO_ANO'].astype(int)
-        df_ncm['CO_MES'] = df_ncm['CO_MES'].astype(int)
-        df_ncm['DATA'] = pd.to_datetime(df_ncm['CO_ANO'].astype(str) + '-' + df_ncm['CO_MES'].astype(str).str.zfill(2))
-        df_ncm = df_ncm.drop(columns=['CO_ANO', 'CO_MES'])
+        df_ncm = self.agrega_transacoes(
+            tipo, ['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_PAIS', 'SG_UF_NCM'], {f'VL_FOB_{tipo}': 'VL_FOB'}
+        )
+        df_ncm['PERIODO'] = periodo(df_ncm.pop('CO_ANO'), df_ncm.pop('CO_MES'))
 
         df_ncm[f'VL_FOB_{tipo}'] = df_ncm[f'VL_FOB_{tipo}'].fillna(0)
-        df_ncm = df_ncm.sort_values(by=['DATA'])
+        df_ncm = df_ncm.sort_values(by=['PERIODO'])
         app_logger.info(f"Fim da criação de agregado mensal de {tipo} por NCM por estado e por pais: {len(df_ncm)} linhas")
         return df_ncm
 
 
     def mv_sh4_mensal_estado_pais(self) -> pd.DataFrame:
         app_logger.info("Criando agregado por sh4")
-        ncm_df = self.base_df.gera_ncm_df()
-        df_exp_merged = self.transacoes_exp.merge(ncm_df[['CO_NCM', 'CO_SH4']], left_on='CO_NCM', right_on='CO_NCM')
-        df_exp_grouped = df_exp_merged.groupby(['CO_SH4', 'CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'], as_index=False).agg(
-            VL_FOB_EXP = ('VL_FOB', 'sum'),
-            KG_LIQUIDO_EXP = ('KG_LIQUIDO', 'sum')
+        ncm_sh4 = self.base_df.gera_ncm_df()[['CO_NCM', 'CO_SH4']]
+        chaves = ['CO_SH4', 'CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM']
+        com_sh4 = lambda df: df.merge(ncm_sh4, left_on='CO_NCM', right_on='CO_NCM')
+        df_exp_grouped = self.agrega_transacoes(
+            "EXP", chaves, {'VL_FOB_EXP': 'VL_FOB', 'KG_LIQUIDO_EXP': 'KG_LIQUIDO'}, com_sh4
         )
-        df_imp_merged = self.transacoes_imp.merge(ncm_df[['CO_NCM', 'CO_SH4']], left_on='CO_NCM', right_on='CO_NCM')
-        df_imp_grouped = df_imp_merged.groupby(['CO_SH4', 'CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'], as_index=False).agg(
-            VL_FOB_IMP = ('VL_FOB', 'sum'),
-            KG_LIQUIDO_IMP = ('KG_LIQUIDO', 'sum')
+        df_imp_grouped = self.agrega_transacoes(
+            "IMP", chaves, {'VL_FOB_IMP': 'VL_FOB', 'KG_LIQUIDO_IMP': 'KG_LIQUIDO'}, com_sh4
         )
         df = pd.merge(
             df_exp_grouped,
@@ -160,10 +310,7 @@ class PreProcessador:
             on=['CO_SH4', 'CO_ANO', 'CO_MES', 'CO_PAIS', 'SG_UF_NCM'],
             how='outer'
         )
-        df['CO_ANO'] = df['CO_ANO'].astype(int)
-        df['CO_MES'] = df['CO_MES'].astype(int)
-        df['DATA'] = pd.to_datetime(df['CO_ANO'].astype(str) + '-' + df['CO_MES'].astype(str).str.zfill(2))
-        df = df.drop(columns=['CO_ANO', 'CO_MES'])
+        df['PERIODO'] = periodo(df.pop('CO_ANO'), df.pop('CO_MES'))
 
         for col in ['VL_FOB_EXP', 'VL_FOB_IMP', 'KG_LIQUIDO_EXP', 'KG_LIQUIDO_IMP']:
             df[col] = df[col].fillna(0)
@@ -174,35 +321,22 @@ class PreProcessador:
     def mv_setores_mensal_estado_pais(self):
         app_logger.info("Iniciando criação do agregado mensal por setor por estado por país")
 
-        with open('data_pipeline/tabelas_auxiliares/setores.json', 'r', encoding='utf-8') as f:
-            setores = json.load(f)
-        df = pd.read_csv(f'{self.output_dir}/mv_sh4_mensal.csv')
-        df['CO_SH4'] = df['CO_SH4'].astype(str)
+        sh4_setor = dados_referencia().sh4_setor()
+        sh4_setor = sh4_setor[sh4_setor['setor'].isin(SETORES_PADRAO)]
+        sh4_setor = sh4_setor.assign(setor=sh4_setor['setor'].map(SETORES_PADRAO))
+        for nome_original, nome_padrao in SETORES_PADRAO.items():
+            if nome_padrao not in sh4_setor['setor'].values:
+                app_logger.warning(f"Setor '{nome_original}' não possui códigos SH4 definidos.")
+
+        df = le_csv_comexstat(f'{self.output_dir}/mv_sh4_mensal.csv', dtype={'CO_SH4': str})
 
         colunas_agregadas = ['VL_FOB_EXP', 'VL_FOB_IMP', 'KG_LIQUIDO_EXP', 'KG_LIQUIDO_IMP']
-        colunas_grupo = ['setor', 'DATA', 'SG_UF_NCM', 'CO_PAIS']
-        setores_padrao = {
-            'Agronegócio': 'agronegocio',
-            'Indústria': 'industria',
-            'Mineração': 'mineracao',
-            'Setor Florestal': 'setor florestal',
-            'Tecnologia': 'tecnologia',
-            'Bens de consumo': 'bens de consumo'
-        }
-        dfs_setores = []
-        for nome_original, nome_padrao in setores_padrao.items():
-            sh4_list = setores.get(nome_original, {}).get('sh4', [])
-            if not sh4_list:
-                app_logger.warning(f"Setor '{nome_original}' não possui códigos SH4 definidos.")
-                continue
-            df_setor = df[df['CO_SH4'].isin(sh4_list)].copy()
-            if df_setor.empty:
+        colunas_grupo = ['setor', 'PERIODO', 'SG_UF_NCM', 'CO_PAIS']
+        # Cada linha de SH4 é somada a todos os setores que o contêm, em uma única passada
+        df_final = df.merge(sh4_setor, on='CO_SH4').groupby(colunas_grupo, as_index=False, observed=True)[colunas_agregadas].sum()
+        for nome_original, nome_padrao in SETORES_PADRAO.items():
+            if nome_padrao in sh4_setor['setor'].values and nome_padrao not in df_final['setor'].values:
                 app_logger.warning(f"Setor '{nome_original}' está vazio após filtro.")
-                continue
-            df_setor['setor'] = nome_padrao
-            df_setor = df_setor.groupby(colunas_grupo, as_index=False)[colunas_agregadas].sum()
-            dfs_setores.append(df_setor)
-        df_final = pd.concat(dfs_setores, ignore_index=True)
         app_logger.info(f"Fim da criação do agregado mensal por setor por estado por país : {len(df_final)} linhas")
         return df_final
 
@@ -220,25 +354,21 @@ class PreProcessador:
     ) -> pd.DataFrame:
         app_logger.info("criando ranking de ncm por estados")
         df_ncm: pd.DataFrame = self.base_df.gera_ncm_df()
-        if tipo == 'EXP': 
-            df = self.transacoes_exp
-        else:
-            df = self.transacoes_imp
-
-        if anos:
-            print("filtering")
-            df = df[df['CO_ANO'].isin(anos)]
-        if meses:
-            df = df[df['CO_MES'].isin(meses)]
-        if paises:
-            df = df[df['CO_PAIS'].isin(paises)]
-        if estados:
-            df = df[df['SG_UF_NCM'].isin(estados)]
-
-        df = df.groupby('CO_NCM', as_index=False).agg({
-            'VL_FOB': 'sum',
-            'KG_LIQUIDO': 'sum'
-        })
+
+        def filtra(df:pd.DataFrame) -> pd.DataFrame:
+            if anos:
+                df = df[df['CO_ANO'].isin(anos)]
+            if meses:
+                df = df[df['CO_MES'].isin(meses)]
+            if paises:
+                df = df[df['CO_PAIS'].isin(paises)]
+            if estados:
+                df = df[df['SG_UF_NCM'].isin(estados)]
+            return df
+
+        df = self.agrega_transacoes(
+            'EXP' if tipo == 'EXP' else 'IMP', ['CO_NCM'], {'VL_FOB': 'VL_FOB', 'KG_LIQUIDO': 'KG_LIQUIDO'}, filtra
+        )
 
         df['valor_agregado'] = df['VL_FOB'] / df['KG_LIQUIDO'].replace(0, pd.NA)
 
@@ -261,17 +391,17 @@ class PreProcessador:
 
     def mv_ncm_mensal(self):
         def carregar_df(tipo, path:str):
-            df = pd.read_csv(path)
-            df = df[['DATA', 'CO_NCM', 'CO_PAIS', 'SG_UF_NCM', f'VL_FOB_{tipo.upper()}']]
-            df = df.groupby(['DATA','CO_NCM', 'CO_PAIS', 'SG_UF_NCM'], as_index=False).agg({f'VL_FOB_{tipo.upper()}': 'sum'}).reset_index()
+            df = le_csv_comexstat(path)
+            df = df[['PERIODO', 'CO_NCM', 'CO_PAIS', 'SG_UF_NCM', f'VL_FOB_{tipo.upper()}']]
+            df = df.groupby(['PERIODO','CO_NCM', 'CO_PAIS', 'SG_UF_NCM'], as_index=False, observed=True).agg({f'VL_FOB_{tipo.upper()}': 'sum'}).reset_index()
             return df
             
-        df_exp = carregar_df('exp', 'data_pipeline/datasets/dados_agregados/mv_ncm_mensal_exp.csv')
-        df_imp = carregar_df('imp', 'data_pipeline/datasets/dados_agregados/mv_ncm_mensal_imp.csv')
+        df_exp = carregar_df('exp', f'{self.output_dir}/mv_ncm_mensal_exp.csv')
+        df_imp = carregar_df('imp', f'{self.output_dir}/mv_ncm_mensal_imp.csv')
         print("EXP:", df_exp.shape)
         print("IMP:", df_imp.shape)
         df = pd.concat([df_exp, df_imp], ignore_index=True)
-        df = df.groupby(['DATA','CO_NCM', 'CO_PAIS', 'SG_UF_NCM']).agg({
+        df = df.groupby(['PERIODO','CO_NCM', 'CO_PAIS', 'SG_UF_NCM'], observed=True).agg({
             'VL_FOB_EXP': 'sum',
             'VL_FOB_IMP': 'sum'
         }).reset_index()
@@ -279,33 +409,96 @@ class PreProcessador:
         return df
 
 
-    def salvar_dados_agregados(self):
-        def gerar_e_salvar(func:Callable, nome:str, *args, **kwargs):
-            df = func(*args, **kwargs)
-            self.salvar_tabela(df, nome)
-
-        tarefas = [
-            ("mv_balanca_comercial", self.balanca_comercial_mensal_estado_pais, ()),
-            ("mv_ncm_mensal_exp", self.mv_ncm_mensal_estado_pais, ('EXP',)),
-            ("mv_ncm_mensal_imp", self.mv_ncm_mensal_estado_pais, ('IMP',)),
-            ("mv_sh4_mensal", self.mv_sh4_mensal_estado_pais, ()),
-            ("mv_setores_mensal", self.mv_setores_mensal_estado_pais, ()),
-            ("mv_ncm_mensal", self.mv_ncm_mensal, ())
-        ]
-
+    def salvar_dados_agregados(self, workers:int | None = None) -> list[list]:
+        '''
+            Gera os agregados de AGREGADOS desatualizados em `output_dir`, em paralelo, respeitando as
+            dependências: um agregado só começa depois que os arquivos que ele lê foram gerados.
+            Cada agregado grava ao lado do CSV a impressão (sha256) das suas entradas e do código que o gerou.
+            Se nada mudou, o agregado é mantido; se mudaram apenas tabelas limpas de alguns anos, só esses anos
+            são recalculados; caso contrário, ou sem impressão gravada, ele é gerado por completo.
+            A falha de um agregado impede apenas os que dependem dele; os demais continuam.
+            Cada agregado roda em um dos `workers` processos. No modo em_lotes o processo lê as tabelas limpas
+            ano a ano. No modo em memória os agregados que leem transações rodam um por vez em um único processo,
+            que carrega cada tipo uma vez e o mantém para os seguintes, como antes do paralelismo;
+            os demais agregados rodam nos outros processos.
+            Ao final imprime e retorna o resumo de cada agregado, com a duração e o erro dos que falharam.
+        '''
+        inicio = time.perf_counter()
         os.makedirs(self.output_dir, exist_ok=True)
+        situacao: dict[str, str] = {}
+        duracoes: dict[str, float] = {}
+        erros: dict[str, str] = {}
+        recalculados: dict[str, str] = {}
+        impressoes_novas: dict[str, dict] = {}
+        impressoes_arquivos: dict[str, str | None] = {}
+        pendentes = list(AGREGADOS)
+
+        def cria_executor(max_workers:int | None) -> ProcessPoolExecutor:
+            return ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_inicia_processo,
+                initargs=(self.em_lotes, self.linhas_por_lote, self.anos, self.output_dir)
+            )
 
-        for nome, func, args in tarefas:
-            output_path = f"{self.output_dir}/{nome}.csv"
-
-            if os.path.exists(output_path):
-                print(f"[IGNORADO] Arquivo já existe: {nome}.csv")
-                continue
-
-            try:
-                print(f"[INFO] Executando: {nome}")
-                gerar_e_salvar(func, nome, *args)
-                print(f"[SUCESSO] Salvo: {nome}.csv")
-            except Exception as e:
-                print(f"[ERRO] Falha em {nome}: {e}")
-                return
+        with ExitStack() as executores:
+            executor = executores.enter_context(cria_executor(workers))
+            executor_transacoes = executor if self.em_lotes else executores.enter_context(cria_executor(1))
+            futuros = {}
+            while pendentes or futuros:
+                for nome in list(pendentes):
+                    agregado = AGREGADOS[nome]
+                    metodo, args = agregado["metodo"], agregado.get("args", ())
+                    dependencias = agregado.get("dependencias", ())
+                    falhas = [dep for dep in dependencias if situacao.get(dep) in ('falhou', 'não executado')]
+                    if falhas:
+                        situacao[nome] = 'não executado'
+                        erros[nome] = f"dependência sem arquivo: {', '.join(falhas)}"
+                        pendentes.remove(nome)
+                        continue
+                    if not all(situacao.get(dep) in ('gerado', 'atualizado') for dep in dependencias):
+                        continue
+                    pendentes.remove(nome)
+
+                    caminho_saida = f"{self.output_dir}/{nome}.csv"
+                    impressao = self.impressao_entradas(nome, impressoes_arquivos)
+                    anos = anos_a_recalcular(le_impressao(caminho_saida), impressao, os.path.exists(caminho_saida))
+                    if anos == []:
+                        print(f"[IGNORADO] Agregado atualizado: {nome}.csv")
+                        situacao[nome] = 'atualizado'
+                        continue
+                    impressoes_novas[nome] = impressao
+                    remove_impressao(caminho_saida)
+                    recalculados[nome] = ', '.join(map(str, anos)) if anos else 'todos'
+                    print(f"[INFO] Executando: {nome} (anos: {recalculados[nome]})")
+                    executor_agregado = executor_transacoes if agregado.get("transacoes") else executor
+                    futuros[executor_agregado.submit(_gera_agregado_no_processo, nome, metodo, args, anos)] = nome
+                if not futuros:
+                    break
+                prontos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    nome = futuros.pop(futuro)
+                    try:
+                        duracoes[nome] = futuro.result()
+                        grava_impressao(f"{self.output_dir}/{nome}.csv", impressoes_novas[nome])
+                        situacao[nome] = 'gerado'
+                        print(f"[SUCESSO] Salvo: {nome}.csv")
+                    except Exception as e:
+                        situacao[nome] = 'falhou'
+                        erros[nome] = f'{type(e).__name__}: {e}'
+                        print(f"[ERRO] Falha em {nome}: {e}")
+                        error_logger.error(f"Falha ao gerar o agregado {nome}: {e}")
+
+        # Dependências fora de AGREGADOS nunca ficam prontas
+        for nome in pendentes:
+            situacao[nome] = 'não executado'
+            erros[nome] = 'dependência desconhecida'
+
+        resumo = [
+            [nome, situacao[nome], recalculados.get(nome, ''), duracoes.get(nome), erros.get(nome, '')]
+            for nome in AGREGADOS
+        ]
+        print(tabulate(
+            resumo, headers=["Agregado", "Situação", "Anos recalculados", "Tempo (s)", "Erro"], tablefmt="grid", floatfmt=".2f"
+        ))
+        print(f"Agregados concluídos em {time.perf_counter() - inicio:.2f}s")
+        return resumo
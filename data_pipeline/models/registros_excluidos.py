@@ -0,0 +1,149 @@
+import glob
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .esquema_comexstat import aplica_tipos
+from .tabela_limpa import EscritorParquet
+
+
+DIRETORIO_EXCLUIDOS = 'data_pipeline/datasets/registros_excluidos'
+
+# Chave dos metadados do Parquet com o bit de cada motivo, para que o arquivo
+# possa ser interpretado sem depender da ordem atual de REGRAS
+CHAVE_MOTIVOS = 'motivos'
+
+
+def caminho_registros_excluidos(ano:int, tipo:str, diretorio:str = DIRETORIO_EXCLUIDOS) -> str:
+    '''
+        Os registros excluídos formam um único dataset particionado por ano e tipo (estilo hive),
+        ex: registros_excluidos/ano=2020/tipo=exp/excluidos.parquet
+    '''
+    return f'{diretorio}/ano={ano}/tipo={tipo}/excluidos.parquet'
+
+
+def escritor_registros_excluidos(
+    ano:int,
+    tipo:str,
+    bit_motivo:dict[str, int],
+    diretorio:str = DIRETORIO_EXCLUIDOS
+) -> EscritorParquet:
+    '''
+        Escritor em lotes da partição (ano, tipo). Os DataFrames escritos devem ter a coluna MOTIVOS
+        com os bits de `bit_motivo`, que também é gravado nos metadados do arquivo.
+    '''
+    return EscritorParquet(
+        caminho_registros_excluidos(ano, tipo, diretorio),
+        metadados={CHAVE_MOTIVOS: json.dumps(bit_motivo)}
+    )
+
+
+def salvar_registros_excluidos(
+    df:pd.DataFrame,
+    ano:int,
+    tipo:str,
+    bit_motivo:dict[str, int],
+    diretorio:str = DIRETORIO_EXCLUIDOS
+) -> str:
+    '''
+        Grava os registros excluídos de (ano, tipo) de uma vez, substituindo a partição anterior.
+    '''
+    with escritor_registros_excluidos(ano, tipo, bit_motivo, diretorio) as escritor:
+        escritor.escreve(df)
+    return escritor.caminho
+
+
+def _particoes(
+    diretorio:str,
+    anos:list[int] | None = None,
+    tipos:list[str] | None = None
+) -> list[tuple[int, str, str]]:
+    '''
+        (ano, tipo, caminho) de cada arquivo nas partições ano=/tipo= que passa pelos filtros.
+        CSVs e Parquets gravados no formato antigo (registros_excluidos/{ano}/...) são ignorados.
+    '''
+    arquivos = sorted(glob.glob(f'{diretorio}/ano=*/tipo=*/*.parquet'))
+    if not arquivos:
+        raise FileNotFoundError(f'Nenhum registro excluído em {diretorio}')
+    particoes = []
+    for caminho in arquivos:
+        pasta_tipo = os.path.dirname(caminho)
+        ano = int(os.path.basename(os.path.dirname(pasta_tipo)).removeprefix('ano='))
+        tipo = os.path.basename(pasta_tipo).removeprefix('tipo=')
+        if (anos is None or ano in anos) and (tipos is None or tipo in tipos):
+            particoes.append((ano, tipo, caminho))
+    return particoes
+
+
+def _bits_motivos(caminho:str) -> dict[str, int]:
+    metadados = pq.read_schema(caminho).metadata or {}
+    return json.loads(metadados.get(CHAVE_MOTIVOS.encode(), b'{}'))
+
+
+def le_bits_motivos(diretorio:str = DIRETORIO_EXCLUIDOS) -> dict[tuple[int, str], dict[str, int]]:
+    '''
+        Bits dos motivos de cada partição (ano, tipo). Cada arquivo guarda os bits da ordem de REGRAS
+        em que foi gravado, então partições gravadas em momentos diferentes podem divergir.
+    '''
+    return {(ano, tipo): _bits_motivos(caminho) for ano, tipo, caminho in _particoes(diretorio)}
+
+
+def ler_registros_excluidos(
+    motivos:list[str] | None = None,
+    anos:list[int] | None = None,
+    tipos:list[str] | None = None,
+    colunas:list[str] | None = None,
+    diretorio:str = DIRETORIO_EXCLUIDOS
+) -> pd.DataFrame:
+    '''
+        Lê os registros excluídos que violaram ao menos uma das regras em `motivos`
+        (ex: ['rotas_absurdas', 'via_invalida']), restritos às partições de `anos` e `tipos`.
+        Apenas os arquivos dessas partições são abertos. Cada um é lido com o próprio esquema e o
+        próprio mapa de bits dos motivos, e as tabelas são unidas no final: as colunas exclusivas
+        de imp (VL_FRETE, VL_SEGURO) e de mun (SH4, CO_MUN, SG_UF_MUN) ficam nulas nas demais linhas.
+    '''
+    particoes = _particoes(diretorio, anos, tipos)
+    esquemas = {caminho: pq.read_schema(caminho) for _, _, caminho in particoes}
+    if colunas is not None:
+        existentes = {'ano', 'tipo'}.union(*(esquema.names for esquema in esquemas.values()))
+        desconhecidas = set(colunas) - existentes
+        if desconhecidas:
+            raise ValueError(f"Colunas desconhecidas: {sorted(desconhecidas)}")
+    bits = {caminho: _bits_motivos(caminho) for _, _, caminho in particoes}
+    if motivos is not None:
+        desconhecidos = set(motivos) - set().union(*bits.values())
+        if desconhecidos:
+            raise ValueError(f"Motivos desconhecidos: {sorted(desconhecidos)}")
+
+    tabelas = []
+    for ano, tipo, caminho in particoes:
+        filtro = None
+        if motivos is not None:
+            mascara = sum(bits[caminho][nome] for nome in motivos if nome in bits[caminho])
+            if not mascara:
+                continue
+            filtro = pc.bit_wise_and(ds.field('MOTIVOS'), pa.scalar(mascara, pa.uint16())) != pa.scalar(0, pa.uint16())
+        lidas = None if colunas is None else [coluna for coluna in colunas if coluna in esquemas[caminho].names]
+        tabela = ds.dataset(caminho, format='parquet').to_table(columns=lidas, filter=filtro)
+        if colunas is None or 'ano' in colunas:
+            tabela = tabela.append_column('ano', pa.array([ano] * tabela.num_rows, pa.int32()))
+        if colunas is None or 'tipo' in colunas:
+            tabela = tabela.append_column('tipo', pa.array([tipo] * tabela.num_rows, pa.string()))
+        tabelas.append(tabela.replace_schema_metadata(None))
+    if not tabelas:
+        return pd.DataFrame(columns=colunas or [])
+
+    df = pa.concat_tables(tabelas, promote_options='permissive').to_pandas()
+    if colunas is not None:
+        df = df.reindex(columns=colunas)
+    # Colunas ausentes em parte das partições têm nulos e continuam em float
+    completas = [coluna for coluna in df.columns if not df[coluna].isna().any()]
+    tipadas = aplica_tipos(df[completas])
+    for coluna in completas:
+        df[coluna] = tipadas[coluna]
+    return df
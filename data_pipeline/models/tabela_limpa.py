@@ -0,0 +1,205 @@
+import os
+from typing import Any, Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .esquema_comexstat import aplica_tipos, le_csv_comexstat
+
+
+DIRETORIO_LIMPO = 'data_pipeline/datasets/limpo'
+
+Filtro = tuple[str, str, Any]
+
+
+def caminho_tabela_limpa(ano:int, nome_arquivo:str, formato:str = "parquet", diretorio:str = DIRETORIO_LIMPO) -> str:
+    return f'{diretorio}/{ano}/{nome_arquivo}.{formato}'
+
+
+def localiza_tabela_limpa(ano:int, nome_arquivo:str, diretorio:str = DIRETORIO_LIMPO) -> str | None:
+    '''
+        Retorna o caminho da tabela limpa, preferindo o Parquet.
+        O CSV só é usado quando é o único disponível (tabelas limpas antes da adoção do Parquet).
+    '''
+    for formato in ("parquet", "csv"):
+        caminho = caminho_tabela_limpa(ano, nome_arquivo, formato, diretorio)
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+
+def salvar_tabela_limpa(
+    df:pd.DataFrame,
+    ano:int,
+    nome_arquivo:str,
+    exportar_csv:bool = False,
+    diretorio:str = DIRETORIO_LIMPO
+) -> str:
+    '''
+        Grava a tabela limpa em Parquet com os tipos de esquema_comexstat.
+        Com `exportar_csv` também grava a versão CSV (latin1) usada antes do Parquet.
+    '''
+    os.makedirs(f'{diretorio}/{ano}', exist_ok=True)
+    df = aplica_tipos(df)
+    caminho = caminho_tabela_limpa(ano, nome_arquivo, "parquet", diretorio)
+    df.to_parquet(caminho, index=False, engine="pyarrow")
+    if exportar_csv:
+        df.to_csv(caminho_tabela_limpa(ano, nome_arquivo, "csv", diretorio), index=False, encoding='latin1')
+    return caminho
+
+
+class EscritorParquet:
+    '''
+        Grava um Parquet em lotes, para tabelas que não cabem inteiras em memória.
+        O arquivo é escrito em um caminho temporário e só assume o nome final quando o bloco `with`
+        termina sem erro, então uma gravação interrompida nunca parece uma tabela completa.
+        Com `caminho_csv`, os mesmos lotes também são acrescentados a um CSV (latin1).
+        `metadados` é gravado no schema do Parquet, junto dos metadados do pandas.
+    '''
+    def __init__(self, caminho:str, caminho_csv:str | None = None, metadados:dict[str, str] | None = None):
+        self.caminho = caminho
+        self.caminho_csv = caminho_csv
+        self.metadados = metadados or {}
+        self.escritor: pq.ParquetWriter | None = None
+        self.schema: pa.Schema | None = None
+        self.linhas = 0
+
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        return self
+
+
+    def escreve(self, df:pd.DataFrame) -> None:
+        if df.empty:
+            return
+        df = aplica_tipos(df)
+        if self.escritor is None:
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+            self.schema = tabela.schema.with_metadata({**(tabela.schema.metadata or {}), **self.metadados})
+            tabela = tabela.replace_schema_metadata(self.schema.metadata)
+            self.escritor = pq.ParquetWriter(f'{self.caminho}.part', self.schema)
+        else:
+            tabela = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.escritor.write_table(tabela)
+        if self.caminho_csv:
+            df.to_csv(f'{self.caminho_csv}.part', mode='a', header=self.linhas == 0, index=False, encoding='latin1')
+        self.linhas += len(df)
+
+
+    def __exit__(self, tipo_excecao, excecao, traceback):
+        if self.escritor is not None:
+            self.escritor.close()
+        temporarios = [(f'{self.caminho}.part', self.caminho)]
+        if self.caminho_csv:
+            temporarios.append((f'{self.caminho_csv}.part', self.caminho_csv))
+        for temporario, final in temporarios:
+            if not os.path.exists(temporario):
+                # Nenhuma linha escrita: não deixa para trás a versão anterior do arquivo
+                if tipo_excecao is None and os.path.exists(final):
+                    os.remove(final)
+                continue
+            if tipo_excecao is None:
+                os.replace(temporario, final)
+            else:
+                os.remove(temporario)
+        return False
+
+
+def escritor_tabela_limpa(
+    ano:int,
+    nome_arquivo:str,
+    exportar_csv:bool = False,
+    diretorio:str = DIRETORIO_LIMPO
+) -> EscritorParquet:
+    '''
+        Versão em lotes de salvar_tabela_limpa.
+    '''
+    caminho_csv = caminho_tabela_limpa(ano, nome_arquivo, "csv", diretorio) if exportar_csv else None
+    return EscritorParquet(caminho_tabela_limpa(ano, nome_arquivo, "parquet", diretorio), caminho_csv)
+
+
+def _aplica_filtros(df:pd.DataFrame, filtros:list[Filtro] | None) -> pd.DataFrame:
+    '''
+        Aplica ao DataFrame os mesmos filtros aceitos pelo pyarrow, para a leitura de CSV.
+    '''
+    operacoes = {
+        '=': lambda coluna, valor: coluna == valor,
+        '==': lambda coluna, valor: coluna == valor,
+        '!=': lambda coluna, valor: coluna != valor,
+        '<': lambda coluna, valor: coluna < valor,
+        '<=': lambda coluna, valor: coluna <= valor,
+        '>': lambda coluna, valor: coluna > valor,
+        '>=': lambda coluna, valor: coluna >= valor,
+        'in': lambda coluna, valor: coluna.isin(valor),
+        'not in': lambda coluna, valor: ~coluna.isin(valor),
+    }
+    for coluna, operacao, valor in filtros or []:
+        df = df[operacoes[operacao](df[coluna], valor)]
+    return df
+
+
+def _colunas_com_filtros(colunas:list[str] | None, filtros:list[Filtro] | None) -> list[str] | None:
+    '''
+        No CSV as colunas usadas apenas nos filtros precisam ser lidas e descartadas depois.
+    '''
+    if colunas is None:
+        return None
+    return list(dict.fromkeys(colunas + [coluna for coluna, _, _ in filtros or []]))
+
+
+def _le_csv(caminho:str, colunas:list[str] | None, **read_kwargs):
+    return le_csv_comexstat(caminho, delimiter=',', encoding='latin1', usecols=colunas, **read_kwargs)
+
+
+def ler_tabela_limpa(
+    ano:int,
+    nome_arquivo:str,
+    colunas:list[str] | None = None,
+    filtros:list[Filtro] | None = None,
+    diretorio:str = DIRETORIO_LIMPO
+) -> pd.DataFrame:
+    '''
+        Lê a tabela limpa do ano trazendo apenas `colunas`.
+        `filtros` segue o formato do pyarrow, ex: [('CO_MES', '==', 3)], e no Parquet é aplicado
+        durante a leitura, descartando row groups inteiros pelas estatísticas do arquivo.
+    '''
+    caminho = localiza_tabela_limpa(ano, nome_arquivo, diretorio)
+    if caminho is None:
+        raise FileNotFoundError(caminho_tabela_limpa(ano, nome_arquivo, "parquet", diretorio))
+    if caminho.endswith(".parquet"):
+        return aplica_tipos(pd.read_parquet(caminho, columns=colunas, filters=filtros, engine="pyarrow"))
+    colunas_lidas = _colunas_com_filtros(colunas, filtros)
+    df = _aplica_filtros(_le_csv(caminho, colunas_lidas), filtros)
+    return df[colunas] if colunas else df
+
+
+def iterar_tabela_limpa(
+    ano:int,
+    nome_arquivo:str,
+    linhas_por_lote:int,
+    colunas:list[str] | None = None,
+    filtros:list[Filtro] | None = None,
+    diretorio:str = DIRETORIO_LIMPO
+) -> Iterator[pd.DataFrame]:
+    '''
+        Versão em lotes de ler_tabela_limpa, para ler anos que não cabem inteiros em memória.
+    '''
+    caminho = localiza_tabela_limpa(ano, nome_arquivo, diretorio)
+    if caminho is None:
+        raise FileNotFoundError(caminho_tabela_limpa(ano, nome_arquivo, "parquet", diretorio))
+    if caminho.endswith(".parquet"):
+        expressao = pq.filters_to_expression(filtros) if filtros else None
+        for lote in ds.dataset(caminho, format="parquet").to_batches(columns=colunas, filter=expressao, batch_size=linhas_por_lote):
+            if lote.num_rows:
+                yield aplica_tipos(lote.to_pandas())
+        return
+    colunas_lidas = _colunas_com_filtros(colunas, filtros)
+    with _le_csv(caminho, colunas_lidas, chunksize=linhas_por_lote) as leitor:
+        for lote in leitor:
+            lote = _aplica_filtros(aplica_tipos(lote), filtros)
+            if not lote.empty:
+                yield lote[colunas] if colunas else lote
+
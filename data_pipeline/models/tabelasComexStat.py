@@ -1,8 +1,12 @@
+from .cache_comexstat import CacheComexStat
+
+
 class TabelasComexStat:
     def __init__(self):
         self.link_base_ncm = "https://balanca.economia.gov.br/balanca/bd/comexstat-bd/ncm/"
         self.link_base_mun = "https://balanca.economia.gov.br/balanca/bd/comexstat-bd/mun/"
         self.link_base_aux = "https://balanca.economia.gov.br/balanca/bd/tabelas/"
+        self.cache: CacheComexStat | None = None
 
 
     def exportacao_ncm(self, ano:str) -> str:
@@ -59,6 +63,23 @@ class TabelasComexStat:
         return f"{self.link_base_aux}{tabela}.csv"
 
 
+    def local(self, url:str) -> str:
+        '''
+            Recebe o link de uma tabela do ComexStat e retorna o caminho do arquivo no cache local,
+            que só é baixado novamente quando muda no servidor.
+        '''
+        if self.cache is None:
+            self.cache = CacheComexStat()
+        return self.cache.local(url)
+
+
+    def auxiliar_local(self, tabela) -> str:
+        '''
+            Equivalente a auxiliar, mas retorna o caminho da tabela no cache local.
+        '''
+        return self.local(self.auxiliar(tabela))
+
+
 # Base de dados detalhada por NCM
 link_base_ncm = "https://balanca.economia.gov.br/balanca/bd/comexstat-bd/ncm/"
 
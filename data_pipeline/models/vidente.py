@@ -11,12 +11,23 @@ from pandas.tseries.offsets import MonthEnd
 import warnings
 
 from data_pipeline.models.gera_dataframes import GeradorDeDataFrames
+from data_pipeline.models.esquema_comexstat import data_do_periodo
 from app.utils.logging_config import app_logger, error_logger
 
 
 warnings.filterwarnings("ignore")
 
 
+def soma_mensal(df:pd.DataFrame, colunas:List[str]) -> pd.DataFrame:
+    '''
+        Soma `colunas` por mês. O agrupamento usa o PERIODO (aaaamm) dos agregados e apenas as linhas
+        já agrupadas são convertidas para data, na coluna DATA.
+    '''
+    df = df.groupby('PERIODO')[colunas].sum().reset_index()
+    df.insert(0, 'DATA', data_do_periodo(df.pop('PERIODO')))
+    return df
+
+
 class Vidente():
     def __init__(self):
         self.gd = GeradorDeDataFrames()
@@ -106,7 +117,7 @@ class Vidente():
         if pais:
             df = df[df['CO_PAIS'] == pais]
 
-        df = df.groupby('DATA')[['balanca_comercial']].sum().reset_index()
+        df = soma_mensal(df, ['balanca_comercial'])
         df_prophet = df[['DATA', 'balanca_comercial']].rename(columns={'DATA': 'ds', 'balanca_comercial': 'y'})
         df_prophet['y'] = df_prophet['y'].fillna(0)
 
@@ -124,8 +135,7 @@ class Vidente():
             df = df[df['SG_UF_NCM'] == estado]
         if pais:
             df = df[df['CO_PAIS'] == pais]
-        df = df.groupby('DATA')[[f'balanca_comercial']].sum().reset_index()
-        df['DATA'] = pd.to_datetime(df['DATA'])
+        df = soma_mensal(df, [f'balanca_comercial'])
         df = df.sort_values('DATA')
         df['timestamp'] = df['DATA'].map(pd.Timestamp.timestamp)
         X = df[['timestamp']]
@@ -153,8 +163,7 @@ class Vidente():
             df = df[df['SG_UF_NCM'] == estado]
         if pais:
             df = df[df['CO_PAIS'] == pais]
-        df = df.groupby('DATA')[[f'balanca_comercial']].sum().reset_index()
-        df['DATA'] = pd.to_datetime(df['DATA'])
+        df = soma_mensal(df, [f'balanca_comercial'])
         df = df.sort_values('DATA')
         df['crescimento'] = df[f'balanca_comercial'].pct_change().fillna(0) * 100
         df_resultado = df[['DATA', 'crescimento']].rename(columns={'DATA': 'ds', 'crescimento': 'y'})
@@ -175,8 +184,7 @@ class Vidente():
             df = df[df['SG_UF_NCM'] == estado]
         if pais:
             df = df[df['CO_PAIS'] == pais]
-        df = df.groupby('DATA')[[f'balanca_comercial']].sum().reset_index()
-        df['DATA'] = pd.to_datetime(df['DATA'])
+        df = soma_mensal(df, [f'balanca_comercial'])
         df = df.sort_values('DATA')
         df['volatilidade'] = df[f'balanca_comercial'].rolling(window=6).std().fillna(0)
         df_resultado = df[['DATA', 'volatilidade']].rename(columns={'DATA': 'ds', 'volatilidade': 'y'})
@@ -205,7 +213,7 @@ class Vidente():
         if pais:
             df = df[df['CO_PAIS'] == pais]
 
-        df = df.groupby('DATA')[[f'VL_FOB_{tipo}']].sum().reset_index()
+        df = soma_mensal(df, [f'VL_FOB_{tipo}'])
         df_prophet = df[['DATA', f'VL_FOB_{tipo}']].rename(columns={'DATA': 'ds', f'VL_FOB_{tipo}': 'y'})
         df_prophet['y'] = df_prophet['y'].fillna(0)
 
@@ -224,8 +232,7 @@ class Vidente():
             df = df[df['SG_UF_NCM'] == estado]
         if pais:
             df = df[df['CO_PAIS'] == pais]
-        df = df.groupby('DATA')[[f'VL_FOB_{tipo}']].sum().reset_index()
-        df['DATA'] = pd.to_datetime(df['DATA'])
+        df = soma_mensal(df, [f'VL_FOB_{tipo}'])
         df = df.sort_values('DATA')
         df['crescimento'] = df[f'VL_FOB_{tipo}'].pct_change().fillna(0) * 100
         df_resultado = df[['DATA', 'crescimento']].rename(columns={'DATA': 'ds', 'crescimento': 'y'})
@@ -246,8 +253,7 @@ class Vidente():
             df = df[df['SG_UF_NCM'] == estado]
         if pais:
             df = df[df['CO_PAIS'] == pais]
-        df = df.groupby('DATA')[[f'VL_FOB_{tipo}']].sum().reset_index()
-        df['DATA'] = pd.to_datetime(df['DATA'])
+        df = soma_mensal(df, [f'VL_FOB_{tipo}'])
         df = df.sort_values('DATA')
         df['volatilidade'] = df[f'VL_FOB_{tipo}'].rolling(window=6).std().fillna(0)
         df_resultado = df[['DATA', 'volatilidade']].rename(columns={'DATA': 'ds', 'volatilidade': 'y'})
@@ -268,8 +274,7 @@ class Vidente():
             df = df[df['SG_UF_NCM'] == estado]
         if pais:
             df = df[df['CO_PAIS'] == pais]
-        df = df.groupby('DATA')[[f'VL_FOB_{tipo}']].sum().reset_index()
-        df['DATA'] = pd.to_datetime(df['DATA'])
+        df = soma_mensal(df, [f'VL_FOB_{tipo}'])
         df = df.sort_values('DATA')
         df['timestamp'] = df['DATA'].map(pd.Timestamp.timestamp)
         X = df[['timestamp']]
@@ -304,7 +309,7 @@ class Vidente():
         if pais:
             df = df[df['CO_PAIS'] == pais]
 
-        df = df.groupby('DATA')[[f'VL_FOB_{tipo}', f'KG_LIQUIDO_{tipo}']].sum().reset_index()
+        df = soma_mensal(df, [f'VL_FOB_{tipo}', f'KG_LIQUIDO_{tipo}'])
         df['valor_agregado'] = df[f'VL_FOB_{tipo}'] / df[f'KG_LIQUIDO_{tipo}']
         df_prophet = df[['DATA', 'valor_agregado']].rename(columns={'DATA': 'ds', 'valor_agregado': 'y'})
         df_prophet['y'] = df_prophet['y'].fillna(0)
@@ -332,7 +337,7 @@ class Vidente():
         df = df[df['CO_NCM'] == str(ncm)]
 
         coluna_valor = f"VL_FOB_{tipo}"
-        df = df.groupby('DATA')[[coluna_valor]].sum().reset_index()
+        df = soma_mensal(df, [coluna_valor])
         df_prophet = df.rename(columns={'DATA': 'ds', coluna_valor: 'y'})
         df_prophet['y'] = df_prophet['y'].fillna(0)
 
@@ -351,7 +356,7 @@ class Vidente():
         df = df[df['CO_SH4'] == str(sh4)]
 
         coluna_valor = f"VL_FOB_{tipo}"
-        df = df.groupby('DATA')[[coluna_valor]].sum().reset_index()
+        df = soma_mensal(df, [coluna_valor])
         df_prophet = df.rename(columns={'DATA': 'ds', coluna_valor: 'y'})
         df_prophet['y'] = df_prophet['y'].fillna(0)
 
@@ -367,7 +372,7 @@ class Vidente():
         df = pd.read_csv(caminho_csv)
 
         coluna_valor = f"VL_FOB_{tipo}"
-        df = df.groupby('DATA')[[coluna_valor]].sum().reset_index()
+        df = soma_mensal(df, [coluna_valor])
         df_prophet = df.rename(columns={'DATA': 'ds', coluna_valor: 'y'})
         df_prophet['y'] = df_prophet['y'].fillna(0)
 
@@ -387,12 +392,13 @@ class Vidente():
         df = pd.read_csv(caminho)
         coluna_valor = f'VL_FOB_{tipo}'
 
-        df = df.groupby(['DATA', 'CO_NCM'])[coluna_valor].sum().reset_index()
+        df = df.groupby(['PERIODO', 'CO_NCM'])[coluna_valor].sum().reset_index()
         df['tipo'] = tipo
 
-        df_resultado = df.groupby(['DATA', 'tipo']).apply(
+        df_resultado = df.groupby(['PERIODO', 'tipo']).apply(
             lambda x: x.sort_values(coluna_valor, ascending=False).head(10)
         ).reset_index(drop=True)
+        df_resultado.insert(0, 'DATA', data_do_periodo(df_resultado.pop('PERIODO')).dt.strftime('%Y-%m-%d'))
 
         return df_resultado.to_dict(orient='records')
     
@@ -402,12 +408,13 @@ class Vidente():
         df = pd.read_csv(caminho_csv)
         coluna_valor = f'VL_FOB_{tipo}'
 
-        df = df.groupby(['DATA', 'CO_SH4'])[coluna_valor].sum().reset_index()
+        df = df.groupby(['PERIODO', 'CO_SH4'])[coluna_valor].sum().reset_index()
         df['tipo'] = tipo
 
-        df_resultado = df.groupby(['DATA', 'tipo']).apply(
+        df_resultado = df.groupby(['PERIODO', 'tipo']).apply(
             lambda x: x.sort_values(coluna_valor, ascending=False).head(10)
         ).reset_index(drop=True)
+        df_resultado.insert(0, 'DATA', data_do_periodo(df_resultado.pop('PERIODO')).dt.strftime('%Y-%m-%d'))
 
         return df_resultado.to_dict(orient='records')
 
@@ -423,7 +430,7 @@ class Vidente():
         df = pd.read_csv(caminho)
         coluna_valor = f'VL_FOB_{tipo}'
 
-        df_pivot = df.groupby(['CO_NCM', 'DATA'])[coluna_valor].sum().unstack().fillna(0)
+        df_pivot = df.groupby(['CO_NCM', 'PERIODO'])[coluna_valor].sum().unstack().fillna(0)
         variacao = ((df_pivot.iloc[:, -1] - df_pivot.iloc[:, 0]) / df_pivot.iloc[:, 0].replace(0, 1)).sort_values(ascending=False)
 
         return {
@@ -438,7 +445,7 @@ class Vidente():
         df = pd.read_csv(caminho)
         coluna_valor = f'VL_FOB_{tipo}'
 
-        df_pivot = df.groupby(['CO_SH4', 'DATA'])[coluna_valor].sum().unstack().fillna(0)
+        df_pivot = df.groupby(['CO_SH4', 'PERIODO'])[coluna_valor].sum().unstack().fillna(0)
         variacao = ((df_pivot.iloc[:, -1] - df_pivot.iloc[:, 0]) / df_pivot.iloc[:, 0].replace(0, 1)).sort_values(ascending=False)
 
         return {
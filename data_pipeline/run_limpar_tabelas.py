@@ -1,33 +1,71 @@
 from .models.limpador_de_tabela import LimpadorDeTabela
-import http.client
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
+from tabulate import tabulate
 
 # limpa_comex_stat.dataframe
-def executar_limpador_ano(ano:int):
-    tipos = ['exp', 'imp'] # + ['exp_mun', 'imp_mun']
-    limpador = LimpadorDeTabela()
-    resolved = True
-    for tipo in tipos:
-        try:
-            gerar = limpador.gerar_dataframe(ano, tipo)
-            if gerar:
-                limpador.limpar_e_salvar_tabelas()
-            else:
-                print(f'tabela {limpador.nome_arquivo} já foi tratada.\n')
-        except http.client.IncompleteRead as e:
-            resolved = False
-            print(f'Não foi possível acessar a tabela {limpador.nome_arquivo} por {e}')
-            pass
-    return resolved
-
-
-def start():
-    not_resolved = []
-    for ano in range(2014, 2026):
-        operation = executar_limpador_ano(ano)
-        if not operation: not_resolved.append(ano)
-    
-    print('As operações não foram resolvidas para os anos:', not_resolved)
+def limpar_tabela(ano:int, tipo:str, exportar_csv:bool = False, linhas_por_lote:int | None = None, agregar_grao:bool = False) -> str:
+    '''
+        Limpa uma tabela (ano, tipo) com um LimpadorDeTabela próprio, para que nenhum estado
+        seja compartilhado entre tabelas. Retorna 'limpa' ou 'já tratada'.
+        Com `linhas_por_lote` a tabela é limpa em lotes, com uso de memória constante.
+        Com `agregar_grao` as linhas do mesmo grão são somadas antes de gravar a tabela limpa.
+    '''
+    limpador = LimpadorDeTabela(exportar_csv, agregar_grao)
+    if linhas_por_lote:
+        gerar = limpador.preparar_fonte(ano, tipo)
+        if gerar: limpador.limpar_em_lotes(linhas_por_lote)
+    else:
+        gerar = limpador.gerar_dataframe(ano, tipo)
+        if gerar: limpador.limpar_e_salvar_tabelas()
+    if not gerar:
+        print(f'tabela {limpador.nome_arquivo} já foi tratada.\n')
+        return 'já tratada'
+    return 'limpa'
+
+
+def _executa_tarefa(ano:int, tipo:str, exportar_csv:bool, linhas_por_lote:int | None, agregar_grao:bool) -> tuple[str, float]:
+    inicio = time.perf_counter()
+    situacao = limpar_tabela(ano, tipo, exportar_csv, linhas_por_lote, agregar_grao)
+    return situacao, time.perf_counter() - inicio
+
+
+def start(
+    exportar_csv:bool = False,
+    linhas_por_lote:int | None = None,
+    workers:int | None = None,
+    anos:range = range(2014, 2026),
+    tipos:tuple[str, ...] = ('exp', 'imp'), # + ('exp_mun', 'imp_mun')
+    agregar_grao:bool = False
+) -> list[list]:
+    '''
+        Distribui as tabelas (ano, tipo) entre `workers` processos (por padrão, um por CPU).
+        Cada processo carrega um ano inteiro em memória, a não ser que `linhas_por_lote` seja informado.
+        Ao final imprime e retorna o resumo de cada tabela, com a mensagem de erro das que falharam.
+    '''
+    inicio = time.perf_counter()
+    resumo = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = {
+            executor.submit(_executa_tarefa, ano, tipo, exportar_csv, linhas_por_lote, agregar_grao): (ano, tipo)
+            for ano in anos for tipo in tipos
+        }
+        for futuro in as_completed(futuros):
+            ano, tipo = futuros[futuro]
+            try:
+                situacao, duracao = futuro.result()
+                erro = ''
+            except Exception as e:
+                situacao, duracao, erro = 'falhou', None, f'{type(e).__name__}: {e}'
+                print(f'Não foi possível limpar a tabela {tipo} de {ano} por {erro}')
+            resumo.append([ano, tipo, situacao, duracao, erro])
+
+    resumo.sort(key=lambda linha: (linha[0], linha[1]))
+    print(tabulate(resumo, headers=["Ano", "Tipo", "Situação", "Tempo (s)", "Erro"], tablefmt="grid", floatfmt=".2f"))
+    anos_com_falha = sorted({ano for ano, _, situacao, _, _ in resumo if situacao == 'falhou'})
+    print(f'Limpeza concluída em {time.perf_counter() - inicio:.2f}s. Anos com falha: {anos_com_falha or "nenhum"}')
+    return resumo
 
 
 if __name__ == '__main__':
-    start()
\ No newline at end of file
+    start()
@@ -0,0 +1,226 @@
+'''
+    Mede a etapa de limpeza (LimpadorDeTabela) regra a regra: tempo, linhas/s e pico de memória.
+    A entrada é sintética, com `--linhas` linhas no formato da tabela `--tipo`, ou um CSV bruto do ComexStat
+    (`--arquivo`). O resultado é gravado em JSON; com `--referencia`, as etapas são comparadas a um JSON
+    anterior e o comando termina com erro se alguma ficar mais lenta que a tolerância.
+
+    Uso (a partir da raiz do projeto):
+        python -m data_pipeline.scripts.benchmark_limpeza --linhas 1000000 --saida limpeza.json
+        python -m data_pipeline.scripts.benchmark_limpeza --arquivo EXP_2024.csv --tipo exp --pais-bloco-real
+        python -m data_pipeline.scripts.benchmark_limpeza --linhas 1000000 --referencia limpeza.json
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from data_pipeline.models.esquema_comexstat import aplica_tipos, le_csv_comexstat
+from data_pipeline.models.limpador_de_tabela import (
+    ESTADOS_INVALIDOS, LimpadorDeTabela, MUNICIPIOS_INVALIDOS, PAISES_INVALIDOS, URFS_INVALIDAS,
+    VIAS_VALIDAS, gera_matriz_rotas_invalidas, regras_aplicaveis
+)
+from data_pipeline.models.dados_referencia import dados_referencia
+from data_pipeline.scripts.benchmark_rotas_absurdas import gera_pais_bloco_sintetico
+
+
+UFS_VALIDAS = ['SP', 'RJ', 'MG', 'PR', 'RS', 'SC', 'BA', 'GO', 'PA', 'AM']
+
+
+def gera_tabela_sintetica(rng:np.random.Generator, linhas:int, tipo:str, paises:np.ndarray, taxa_invalidos:float) -> pd.DataFrame:
+    '''
+        Gera uma tabela bruta com as colunas do tipo pedido. Cada coluna verificada por uma regra
+        recebe valores inválidos em uma fração `taxa_invalidos` das linhas, sorteada de forma independente.
+    '''
+    def com_invalidos(validos:np.ndarray, invalidos:list) -> np.ndarray:
+        sorteio = rng.random(linhas) < taxa_invalidos
+        return np.where(sorteio, rng.choice(invalidos, linhas), validos)
+
+    def medida(maximo:int) -> np.ndarray:
+        return com_invalidos(rng.integers(1, maximo, linhas), [0])
+
+    df = pd.DataFrame({'CO_ANO': 2024, 'CO_MES': rng.integers(1, 13, linhas)})
+    municipal = tipo.endswith('_mun')
+    uf = 'SG_UF_MUN' if municipal else 'SG_UF_NCM'
+    if municipal:
+        df['SH4'] = rng.integers(101, 9706, linhas)
+    else:
+        df['CO_NCM'] = rng.integers(1_000_000, 99_999_999, linhas)
+        df['CO_UNID'] = rng.integers(10, 20, linhas)
+    df['CO_PAIS'] = com_invalidos(rng.choice(paises, linhas), PAISES_INVALIDOS)
+    df[uf] = com_invalidos(rng.choice(UFS_VALIDAS, linhas), ESTADOS_INVALIDOS)
+    if municipal:
+        df['CO_MUN'] = com_invalidos(rng.integers(1_100_015, 5_300_108, linhas), MUNICIPIOS_INVALIDOS)
+    else:
+        df['CO_VIA'] = com_invalidos(rng.choice(VIAS_VALIDAS, linhas), [0, 9, 10, 12, 99])
+        df['CO_URF'] = com_invalidos(rng.integers(100_000, 1_000_000, linhas), URFS_INVALIDAS)
+        df['QT_ESTAT'] = medida(1_000_000)
+    df['KG_LIQUIDO'] = medida(1_000_000)
+    df['VL_FOB'] = medida(10_000_000)
+    if tipo.startswith('imp'):
+        df['VL_FRETE'] = rng.integers(0, 100_000, linhas)
+        df['VL_SEGURO'] = rng.integers(0, 10_000, linhas)
+    return aplica_tipos(df)
+
+
+def mede_etapa(nome:str, func, linhas:int, repeticoes:int) -> tuple[dict, object]:
+    '''
+        O tempo é o menor de `repeticoes` execuções sem o tracemalloc, que deixa o código mais lento;
+        o pico de memória vem de uma execução separada, com o tracemalloc ativo.
+    '''
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    func()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tempo = min(tempos)
+    return {
+        'etapa': nome,
+        'linhas': linhas,
+        'tempo_s': round(tempo, 6),
+        'linhas_por_s': round(linhas / tempo) if tempo > 0 else None,
+        'pico_memoria_mb': round(pico / 1024 ** 2, 3),
+    }, resultado
+
+
+def executa(df_raw:pd.DataFrame, limpador:LimpadorDeTabela, repeticoes:int) -> list[dict]:
+    linhas = len(df_raw)
+    etapas = []
+    df = df_raw.copy()
+
+    medicao, valor_agregado = mede_etapa('valor_agregado', lambda: df['VL_FOB'] / df['KG_LIQUIDO'], linhas, repeticoes)
+    etapas.append(medicao)
+    df['VALOR_AGREGADO'] = valor_agregado
+
+    for nome, _, _, mascara in regras_aplicaveis(df):
+        medicao, violacoes = mede_etapa(f'regra:{nome}', lambda: np.asarray(mascara(limpador, df), dtype=bool), linhas, repeticoes)
+        medicao['rejeitadas'] = int(violacoes.sum())
+        etapas.append(medicao)
+
+    medicao, motivos = mede_etapa('calcular_motivos', lambda: limpador.calcular_motivos(df), linhas, repeticoes)
+    etapas.append(medicao)
+
+    validas = motivos == 0
+    medicao, _ = mede_etapa('separacao', lambda: (df[validas], df[~validas].assign(MOTIVOS=motivos[~validas])), linhas, repeticoes)
+    etapas.append(medicao)
+
+    def limpar():
+        limpador.df_raw = df_raw.copy()
+        limpador.limpar()
+    medicao, _ = mede_etapa('limpar (total)', limpar, linhas, repeticoes)
+    medicao['rejeitadas'] = linhas - limpador.linhas_finais
+    etapas.append(medicao)
+    return etapas
+
+
+def compara(resultado:dict, caminho_referencia:str, tolerancia:float) -> list[str]:
+    '''
+        Retorna as etapas cujo tempo passou do tempo da referência em mais de `tolerancia` (fração).
+    '''
+    with open(caminho_referencia, encoding='utf-8') as arquivo:
+        execucao_anterior = json.load(arquivo)
+    for chave in ('entrada', 'tipo', 'linhas'):
+        if execucao_anterior.get(chave) != resultado[chave]:
+            print(f"Aviso: {chave} difere da referência ({execucao_anterior.get(chave)} x {resultado[chave]})")
+    referencia = {etapa['etapa']: etapa for etapa in execucao_anterior['etapas']}
+    etapas = resultado['etapas']
+    tabela = []
+    regressoes = []
+    for etapa in etapas:
+        anterior = referencia.get(etapa['etapa'])
+        if anterior is None or not anterior['tempo_s']:
+            continue
+        variacao = etapa['tempo_s'] / anterior['tempo_s'] - 1
+        if variacao > tolerancia:
+            regressoes.append(etapa['etapa'])
+        tabela.append([etapa['etapa'], anterior['tempo_s'], etapa['tempo_s'], f"{variacao:+.1%}", anterior['pico_memoria_mb'], etapa['pico_memoria_mb']])
+    print(f"\nComparação com {caminho_referencia}:\n")
+    print(tabulate(tabela, headers=["Etapa", "Tempo ref. (s)", "Tempo (s)", "Variação", "Memória ref. (MB)", "Memória (MB)"], tablefmt="grid", floatfmt=",.4f"))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da limpeza das tabelas do ComexStat, por regra")
+    parser.add_argument("--linhas", type=int, default=500_000, help="linhas da tabela sintética")
+    parser.add_argument("--tipo", choices=['exp', 'imp', 'exp_mun', 'imp_mun'], default='exp')
+    parser.add_argument("--arquivo", help="CSV bruto do ComexStat (separado por ';', latin1) usado no lugar da tabela sintética")
+    parser.add_argument("--taxa-invalidos", type=float, default=0.02, help="fração de valores inválidos por coluna na tabela sintética")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pais-bloco-real", action="store_true", help="usa a tabela PAIS_BLOCO do ComexStat (cache local)")
+    parser.add_argument("--saida", default="data_pipeline/datasets/benchmarks/limpeza.json")
+    parser.add_argument("--referencia", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="aumento de tempo aceito em relação à referência")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.pais_bloco_real:
+        pais_bloco = dados_referencia().tabela('PAIS_BLOCO')
+    else:
+        pais_bloco = gera_pais_bloco_sintetico(rng)
+
+    etapas = []
+    if args.arquivo:
+        medicao, df_raw = mede_etapa(
+            'leitura', lambda: le_csv_comexstat(args.arquivo, delimiter=';', encoding='latin1'), 0, 1
+        )
+        medicao['linhas'] = len(df_raw)
+        medicao['linhas_por_s'] = round(len(df_raw) / medicao['tempo_s']) if medicao['tempo_s'] > 0 else None
+        etapas.append(medicao)
+    else:
+        df_raw = gera_tabela_sintetica(rng, args.linhas, args.tipo, pais_bloco['CO_PAIS'].unique(), args.taxa_invalidos)
+
+    limpador = LimpadorDeTabela()
+    limpador.ano, limpador.tipo, limpador.nome_arquivo = 2024, args.tipo, f'benchmark_{args.tipo}'
+    # A matriz de rotas é montada fora das medições, como acontece uma vez por processo na limpeza real
+    limpador.rotas_invalidas = gera_matriz_rotas_invalidas(pais_bloco)
+    etapas += executa(df_raw, limpador, args.repeticoes)
+
+    print(tabulate(
+        [[e['etapa'], e['linhas'], e['tempo_s'], e['linhas_por_s'], e['pico_memoria_mb'], e.get('rejeitadas', '')] for e in etapas],
+        headers=["Etapa", "Linhas", "Tempo (s)", "Linhas/s", "Pico de memória (MB)", "Rejeitadas"],
+        tablefmt="grid", floatfmt=",.4f", intfmt=","
+    ))
+
+    resultado = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'entrada': args.arquivo or 'sintetica',
+        'tipo': args.tipo,
+        'linhas': len(df_raw),
+        'taxa_invalidos': None if args.arquivo else args.taxa_invalidos,
+        'repeticoes': args.repeticoes,
+        'seed': args.seed,
+        'ambiente': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'maquina': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'etapas': etapas,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"\nResultado salvo em {args.saida}")
+
+    if args.referencia:
+        regressoes = compara(resultado, args.referencia, args.tolerancia)
+        if regressoes:
+            print(f"\nEtapas mais lentas que a referência (tolerância de {args.tolerancia:.0%}): {', '.join(regressoes)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
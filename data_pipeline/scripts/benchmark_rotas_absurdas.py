@@ -0,0 +1,107 @@
+'''
+    Compara a implementação antiga de LimpadorDeTabela.remover_rotas_absurdas (apply linha a linha
+    seguido de isin elemento a elemento) com a versão vetorizada, usando dados sintéticos.
+
+    Uso (a partir da raiz do projeto):
+        python -m data_pipeline.scripts.benchmark_rotas_absurdas --linhas 500000
+        python -m data_pipeline.scripts.benchmark_rotas_absurdas --pais-bloco-real
+'''
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from data_pipeline.models.limpador_de_tabela import VIAS_BLOCOS_INVALIDOS, gera_matriz_rotas_invalidas, rotas_invalidas_mask
+from data_pipeline.models.dados_referencia import dados_referencia
+
+
+BLOCOS = [51, 105, 107, 48, 39, 53, 112, 111, 61, 41, 22]
+VIAS = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 14, 15, 99]
+
+
+def gera_pais_bloco_sintetico(rng:np.random.Generator, paises:int = 250) -> pd.DataFrame:
+    '''
+        Cada país pertence a um bloco, e parte deles também a um segundo bloco, como acontece na tabela PAIS_BLOCO.
+    '''
+    co_pais = np.arange(1, paises + 1)
+    primeiro = pd.DataFrame({'CO_PAIS': co_pais, 'CO_BLOCO': rng.choice(BLOCOS, paises)})
+    segundo = primeiro.sample(frac=0.3, random_state=0).assign(CO_BLOCO=lambda df: rng.choice(BLOCOS, len(df)))
+    pais_bloco = pd.concat([primeiro, segundo]).drop_duplicates(ignore_index=True)
+    pais_bloco['NO_BLOCO'] = pais_bloco['CO_BLOCO'].astype(str)
+    return pais_bloco
+
+
+def gera_transacoes_sinteticas(rng:np.random.Generator, linhas:int, paises:np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame({
+        'ID': np.arange(linhas),
+        'CO_ANO': 2024,
+        'CO_MES': rng.integers(1, 13, linhas),
+        'CO_NCM': rng.integers(1_000_000, 99_999_999, linhas),
+        'CO_PAIS': rng.choice(paises, linhas),
+        'SG_UF_NCM': rng.choice(['SP', 'RJ', 'MG', 'PR', 'RS'], linhas),
+        'CO_VIA': rng.choice(VIAS, linhas),
+        'KG_LIQUIDO': rng.integers(1, 1_000_000, linhas),
+        'VL_FOB': rng.integers(1, 10_000_000, linhas),
+    })
+    df['VALOR_AGREGADO'] = df['VL_FOB'] / df['KG_LIQUIDO']
+    # As etapas anteriores da limpeza deixam o índice com lacunas
+    return df.sample(frac=0.9, random_state=0).sort_index()
+
+
+def remover_rotas_absurdas_antigo(df:pd.DataFrame, pais_bloco:pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    df_merged = df.merge(pais_bloco[['CO_PAIS', 'CO_BLOCO', 'NO_BLOCO']], on='CO_PAIS', how='left')
+    df_merged['via_invalida'] = df_merged.apply(
+        lambda row: row['CO_BLOCO'] in VIAS_BLOCOS_INVALIDOS.get(row['CO_VIA'], []),
+        axis=1
+    )
+    rotas_absurdas = df_merged[df_merged['via_invalida']].drop(columns=['via_invalida', 'CO_BLOCO', 'NO_BLOCO']).copy()
+    limpo = df[~df.isin(rotas_absurdas)].dropna()
+    return limpo, rotas_absurdas
+
+
+def remover_rotas_absurdas_vetorizado(df:pd.DataFrame, pais_bloco:pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    invalida = rotas_invalidas_mask(df, gera_matriz_rotas_invalidas(pais_bloco))
+    return df[~invalida], df[invalida]
+
+
+def mede(func, *args):
+    inicio = time.perf_counter()
+    resultado = func(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do filtro de rotas absurdas")
+    parser.add_argument("--linhas", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pais-bloco-real", action="store_true", help="usa a tabela PAIS_BLOCO do ComexStat (cache local)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.pais_bloco_real:
+        pais_bloco = dados_referencia().tabela('PAIS_BLOCO')
+    else:
+        pais_bloco = gera_pais_bloco_sintetico(rng)
+    df = gera_transacoes_sinteticas(rng, args.linhas, pais_bloco['CO_PAIS'].unique())
+
+    (limpo_antigo, rotas_antigo), tempo_antigo = mede(remover_rotas_absurdas_antigo, df, pais_bloco)
+    (limpo_novo, rotas_novo), tempo_novo = mede(remover_rotas_absurdas_vetorizado, df, pais_bloco)
+
+    # A versão antiga repete a linha para cada bloco inválido do país; a comparação é feita pelo ID da transação
+    rejeitados_iguais = set(rotas_antigo['ID']) == set(rotas_novo['ID'])
+    esperado = df[~df['ID'].isin(rotas_antigo['ID'])]
+
+    print(tabulate([
+        ["Antiga (apply + isin)", len(df), len(limpo_antigo), rotas_antigo['ID'].nunique(), tempo_antigo, len(df) / tempo_antigo],
+        ["Vetorizada (matriz via × país)", len(df), len(limpo_novo), len(rotas_novo), tempo_novo, len(df) / tempo_novo],
+    ], headers=["Implementação", "Linhas", "Limpas", "Rejeitadas", "Tempo (s)", "Linhas/s"], tablefmt="grid", floatfmt=",.3f"))
+    print(f"Speedup: {tempo_antigo / tempo_novo:,.1f}x")
+    print(f"Mesmas transações rejeitadas: {rejeitados_iguais}")
+    print(f"Saída limpa vetorizada igual ao DataFrame sem as rejeitadas: {limpo_novo.equals(esperado)}")
+    print(f"Saída limpa antiga igual ao DataFrame sem as rejeitadas: {limpo_antigo.astype(esperado.dtypes).equals(esperado) if len(limpo_antigo) == len(esperado) else False}")
+
+
+if __name__ == "__main__":
+    main()
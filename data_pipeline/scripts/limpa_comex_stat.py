@@ -12,7 +12,7 @@ from models.tabelasComexStat import TabelasComexStat
 
 
 tabelas_cs = TabelasComexStat()
-dataframe = pd.read_csv(tabelas_cs.exportacao_ncm('2014'), delimiter=';', encoding='latin1')
+dataframe = pd.read_csv(tabelas_cs.local(tabelas_cs.exportacao_ncm('2014')), delimiter=';', encoding='latin1')
 
 
 
@@ -1,17 +1,39 @@
-from typing import Literal
+import os
+import time
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, Literal
 from psycopg2.extensions import connection
 from psycopg2 import Error, connect
+from psycopg2.extras import execute_values
 import pandas as pd
+from tabulate import tabulate
 
+from data_pipeline.models.dados_referencia import dados_referencia
+from data_pipeline.models.limpador_de_tabela import LimpadorDeTabela
 from data_pipeline.models.tabelasComexStat import TabelasComexStat
+from data_pipeline.models.tabela_limpa import caminho_tabela_limpa, ler_tabela_limpa, localiza_tabela_limpa
 from app.utils.logging_config import app_logger, error_logger
+from .build_utils import (
+    copy_dataframe, formata_vazao, hash_carga, le_tabela_limpa_em_lotes, linhas_dataframe, lotes_em_segundo_plano, upsert_dataframe
+)
+
+
+TABELAS_FATO = ('exportacao_estado', 'importacao_estado', 'exportacao_municipio', 'importacao_municipio')
+
+# Colunas das tabelas limpas usadas na carga; as demais não são lidas do Parquet.
+COLUNAS_ESTADO = ['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_PAIS', 'SG_UF_NCM', 'CO_VIA', 'CO_URF', 'QT_ESTAT', 'KG_LIQUIDO', 'VL_FOB']
+COLUNAS_ESTADO_IMP = COLUNAS_ESTADO + ['VL_SEGURO', 'VL_FRETE']
+COLUNAS_MUNICIPIO = ['CO_ANO', 'CO_MES', 'SH4', 'CO_PAIS', 'CO_MUN', 'KG_LIQUIDO', 'VL_FOB']
 
 
 class BuildDatabase:
     def __init__(self, config:dict):
+        self.config = config
         try:
             self.conn:connection = connect(**config)
             self.tabelas = TabelasComexStat()
+            self.referencia = dados_referencia()
         except Error as e:
             error_logger.error("Erro ao conectar ao banco de dados: %s", str(e))
             self.conn = None
@@ -22,19 +44,12 @@ class BuildDatabase:
 
 
     def registra_paises(self) -> None:
-        pais_df = pd.read_csv(self.tabelas.auxiliar('PAIS'), delimiter=';' ,encoding='latin1')
-
+        pais_df = self.referencia.tabela('PAIS')
+        pais_df = pais_df.rename(columns={'CO_PAIS': 'id_pais', 'NO_PAIS': 'nome'})[['id_pais', 'nome']]
         try:
-            cur = self.conn.cursor()
-            for _, row in pais_df.iterrows():
-                id_pais = row['CO_PAIS']
-                nome = row['NO_PAIS']
-                cur.execute(
-                    "INSERT INTO pais (id_pais, nome) VALUES (%s, %s) ON CONFLICT (id_pais) DO NOTHING",
-                    (id_pais, nome)
-                )
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, pais_df, 'pais', 'id_pais')
             self.conn.commit()
-            cur.close()
             app_logger.info("Paises cadastrados no banco de dados com sucesso")
         except Error as e:
             self.conn.rollback()
@@ -42,26 +57,25 @@ class BuildDatabase:
 
     
     def registra_blocos(self) -> None:
-        bloco_df = pd.read_csv(self.tabelas.auxiliar('PAIS_BLOCO'), delimiter=';', encoding='latin1')
+        bloco_df = self.referencia.tabela('PAIS_BLOCO')
         blocos = bloco_df.drop_duplicates(subset=["CO_BLOCO"])
+        blocos = blocos.rename(columns={'CO_BLOCO': 'id_bloco', 'NO_BLOCO': 'nome_bloco'})[['id_bloco', 'nome_bloco']]
+        # um país pode pertencer a mais de um bloco; assim como no UPDATE linha a linha, prevalece o último
+        pais_bloco = bloco_df.drop_duplicates(subset=['CO_PAIS'], keep='last')[['CO_PAIS', 'CO_BLOCO']]
         try:
-            cur = self.conn.cursor()
-            for _, row in blocos.iterrows():
-                id_bloco = row["CO_BLOCO"]
-                nome_bloco = row["NO_BLOCO"]
-                cur.execute(
-                    "INSERT INTO bloco (id_bloco, nome_bloco) VALUES (%s, %s) ON CONFLICT (id_bloco) DO NOTHING", 
-                    (id_bloco, nome_bloco)
-                )
-            for _, row in bloco_df.iterrows():
-                id_pais = row['CO_PAIS']
-                id_bloco = row['CO_BLOCO']
-                cur.execute(
-                    "UPDATE pais SET id_bloco = %s WHERE id_pais = %s",
-                    (id_bloco, id_pais)
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, blocos, 'bloco', 'id_bloco')
+                execute_values(
+                    cur,
+                    """
+                        UPDATE pais SET id_bloco = v.id_bloco
+                        FROM (VALUES %s) AS v (id_pais, id_bloco)
+                        WHERE pais.id_pais = v.id_pais
+                    """,
+                    linhas_dataframe(pais_bloco),
+                    page_size=10_000
                 )
             self.conn.commit()
-            cur.close()
             app_logger.info("Blocos cadastrados no banco de dados com sucesso")
         except Error as e:
             self.conn.rollback()
@@ -69,20 +83,14 @@ class BuildDatabase:
 
     
     def registra_estados(self) -> None:
-        estados_df = pd.read_csv(self.tabelas.auxiliar('UF'), delimiter=';', encoding='latin1')
+        estados_df = self.referencia.tabela('UF')
+        estados_df = estados_df.rename(columns={
+            'CO_UF': 'id_estado', 'SG_UF': 'sigla', 'NO_UF': 'nome', 'NO_REGIAO': 'regiao'
+        })[['id_estado', 'sigla', 'nome', 'regiao']]
         try:
-            cur = self.conn.cursor()
-            for _, row in estados_df.iterrows():
-                id_estado = row['CO_UF']
-                sigla = row['SG_UF']
-                nome=row['NO_UF']
-                regiao = row['NO_REGIAO']
-                cur.execute(
-                    "INSERT INTO estado (id_estado, sigla, nome, regiao) VALUES (%s, %s, %s, %s) ON CONFLICT (id_estado) DO NOTHING",
-                    (id_estado, sigla, nome, regiao)
-                )
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, estados_df, 'estado', 'id_estado')
             self.conn.commit()
-            cur.close()
             app_logger.info("Estados cadastrados no banco de dados com sucesso")
         except Error as e:
             self.conn.rollback()
@@ -90,19 +98,15 @@ class BuildDatabase:
 
 
     def registra_municipios(self) -> None:
-        mun_df = pd.read_csv(self.tabelas.auxiliar('UF_MUN'), delimiter=';', encoding='latin1')
-        estados_df = pd.read_csv(self.tabelas.auxiliar('UF'), delimiter=';', encoding='latin1')
+        mun_df = self.referencia.tabela('UF_MUN')
+        estados_df = self.referencia.tabela('UF')
         mun_df = mun_df.merge(estados_df, on="SG_UF", how="left")
+        mun_df = mun_df.rename(columns={
+            'CO_MUN_GEO': 'id_municipio', 'NO_MUN_MIN': 'nome', 'CO_UF': 'id_estado'
+        })[['id_municipio', 'nome', 'id_estado']]
         try:
-            cur = self.conn.cursor()
-            for _, row in mun_df.iterrows():
-                id_municipio = row['CO_MUN_GEO']
-                nome = row['NO_MUN_MIN']
-                id_estado = row['CO_UF']
-                cur.execute(
-                    "INSERT INTO municipio (id_municipio, nome, id_estado) VALUES (%s, %s, %s) ON CONFLICT (id_municipio) DO NOTHING",
-                    (id_municipio, nome, id_estado)
-                )
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, mun_df, 'municipio', 'id_municipio')
             self.conn.commit()
             app_logger.info("Municípios cadastrados no banco de dados com sucesso")
         except Error as e:
@@ -111,18 +115,12 @@ class BuildDatabase:
 
 
     def registra_modal_transporte(self) -> None:
-        via_df = pd.read_csv(self.tabelas.auxiliar('VIA'), delimiter=';', encoding='latin1')
+        via_df = self.referencia.tabela('VIA')
+        via_df = via_df.rename(columns={'CO_VIA': 'id_modal_transporte', 'NO_VIA': 'descricao'})[['id_modal_transporte', 'descricao']]
         try:
-            cur = self.conn.cursor()
-            for _, row in via_df.iterrows():
-                id_modal = row['CO_VIA']
-                descricao = row['NO_VIA']
-                cur.execute(
-                    "INSERT INTO modal_transporte (id_modal_transporte, descricao) VALUES (%s, %s) ON CONFLICT (id_modal_transporte) DO NOTHING",
-                    (id_modal, descricao)
-                )
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, via_df, 'modal_transporte', 'id_modal_transporte')
             self.conn.commit()
-            cur.close()
             app_logger.info("Modais de transporte cadastrados no banco de dados com sucesso")
         except Error as e: 
             self.conn.rollback()
@@ -130,18 +128,15 @@ class BuildDatabase:
 
 
     def registra_urfs(self) -> None:
-        urf_df = pd.read_csv(self.tabelas.auxiliar('URF'), delimiter=';', encoding='latin1')
+        urf_df = self.referencia.tabela('URF')
+        urf_df = pd.DataFrame({
+            'id_unidade': urf_df['CO_URF'],
+            'nome': urf_df['NO_URF'].str.split(' - ').str[1],
+        })
         try:
-            cur = self.conn.cursor()
-            for _, row in urf_df.iterrows():
-                id_unidade = row['CO_URF']
-                nome = row['NO_URF'].split(' - ')[1]
-                cur.execute(
-                    "INSERT INTO unidade_receita_federal (id_unidade, nome) VALUES (%s, %s) ON CONFLICT (id_unidade) DO NOTHING",
-                    (id_unidade, nome)
-                )
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, urf_df, 'unidade_receita_federal', 'id_unidade')
             self.conn.commit()
-            cur.close()
             app_logger.info("URFs cadastrados no banco de dados com sucesso")
         except Error as e:
             self.conn.rollback()
@@ -149,19 +144,13 @@ class BuildDatabase:
 
 
     def registra_cgce_n3(self) -> None:
-        cg_df = pd.read_csv(self.tabelas.auxiliar('NCM_CGCE'), delimiter=';', encoding='latin1')
+        cg_df = self.referencia.tabela('NCM_CGCE')
         cg_df = cg_df.drop_duplicates(subset=['CO_CGCE_N3'])
+        cg_df = cg_df.rename(columns={'CO_CGCE_N3': 'id_n3', 'NO_CGCE_N3': 'descricao'})[['id_n3', 'descricao']]
         try:
-            cur = self.conn.cursor()
-            for _, row in cg_df.iterrows():
-                id_n3 = row['CO_CGCE_N3']
-                descricao = row['NO_CGCE_N3']
-                cur.execute(
-                    "INSERT INTO cgce_n3 (id_n3, descricao) VALUES (%s, %s) ON CONFLICT (id_n3) DO NOTHING",
-                    (id_n3, descricao)
-                )
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, cg_df, 'cgce_n3', 'id_n3')
             self.conn.commit()
-            cur.close()
             app_logger.info("Códigos CGCE_N3 cadastrados no banco de dados com sucesso")
         except Error as e:
             self.conn.rollback()
@@ -169,30 +158,16 @@ class BuildDatabase:
         
 
     def registra_sh(self) -> None:
-        file_url = 'data_pipeline/tabelas_auxiliares/codigos.csv'
-        sh_df = pd.read_csv(file_url, delimiter=';', encoding='utf-8', dtype={'CO_SH4': str, 'CO_SH2': str})
+        sh_df = self.referencia.codigos_sh()
         sh4 = sh_df.drop_duplicates(subset=['CO_SH4'])
+        sh4 = sh4.rename(columns={'CO_SH4': 'id_sh4', 'NO_SH4_POR': 'descricao'})[['id_sh4', 'descricao']]
         sh2 = sh_df.drop_duplicates(subset=['CO_SH2'])
+        sh2 = sh2.rename(columns={'CO_SH2': 'id_sh2', 'NO_SH2_POR': 'descricao'})[['id_sh2', 'descricao']]
         try:
-            cur = self.conn.cursor()
-            for _, row in sh4.iterrows():
-                id_sh4 = row['CO_SH4']
-                descricao = row['NO_SH4_POR']
-                cur.execute(
-                    "INSERT INTO sh4 (id_sh4, descricao) VALUES (%s, %s) ON CONFLICT (id_sh4) DO NOTHING",
-                    (id_sh4, descricao)
-                )
-            
-            for _, row in sh2.iterrows():
-                id_sh2 = row['CO_SH2']
-                descricao = row['NO_SH2_POR']
-                cur.execute(
-                    "INSERT INTO sh2 (id_sh2, descricao) VALUES (%s, %s) ON CONFLICT (id_sh2) DO NOTHING",
-                    (id_sh2, descricao)
-                )
-
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, sh4, 'sh4', 'id_sh4')
+                upsert_dataframe(cur, sh2, 'sh2', 'id_sh2')
             self.conn.commit()
-            cur.close()
             app_logger.info("códigos SH2 e SH4 cadastrados no banco de dados com sucesso")
         except Error as e:
             self.conn.rollback()
@@ -200,30 +175,23 @@ class BuildDatabase:
 
 
     def registra_produto(self) -> None:
-        ncm_df = pd.read_csv(self.tabelas.auxiliar('NCM'), delimiter=";", encoding="latin1", dtype={'CO_NCM': int})
-        unidades_df = pd.read_csv(self.tabelas.auxiliar('NCM_UNIDADE'), delimiter=";", encoding="latin1")
+        ncm_df = self.referencia.tabela('NCM')
+        unidades_df = self.referencia.tabela('NCM_UNIDADE')
         ncm_df = ncm_df.merge(unidades_df[['CO_UNID', 'NO_UNID']], on='CO_UNID', how='left')
-        file_url = 'data_pipeline/tabelas_auxiliares/codigos.csv'
-        sh_df = pd.read_csv(file_url, delimiter=';', encoding='latin1', dtype={'CO_NCM': int, 'CO_SH4': str, 'CO_SH2': str})
+        sh_df = self.referencia.codigos_sh()
         ncm_df = ncm_df.merge(sh_df[['CO_NCM', 'CO_SH4', 'CO_SH2']], on='CO_NCM', how='left')
-        ncm_df = ncm_df.where(pd.notna(ncm_df), None)
+        produto_df = pd.DataFrame({
+            'id_ncm': ncm_df['CO_NCM'],
+            'descricao': ncm_df['NO_NCM_POR'],
+            'unidade_medida': ncm_df['NO_UNID'],
+            'id_sh4': ncm_df['CO_SH4'],
+            'id_cgce_n3': ncm_df['CO_CGCE_N3'].astype('int64'),
+            'id_sh2': ncm_df['CO_SH2'],
+        })
         try:
-            cur = self.conn.cursor()
-            for _, row in ncm_df.iterrows():
-                id_ncm = row['CO_NCM']
-                descricao = row['NO_NCM_POR']
-                unidade_medida = row['NO_UNID']
-                id_sh4 = row['CO_SH4']
-                id_sh2 = row['CO_SH2']
-                id_cgce_n3 = int(row['CO_CGCE_N3'])
-                cur.execute('''
-                    INSERT INTO produto (id_ncm, descricao, unidade_medida, id_sh4, id_cgce_n3, id_sh2) 
-                    VALUES (%s, %s, %s, %s, %s, %s) 
-                    ON CONFLICT (id_ncm) DO NOTHING''',
-                    (id_ncm, descricao, unidade_medida, id_sh4, id_cgce_n3, id_sh2)
-                )
+            with self.conn.cursor() as cur:
+                upsert_dataframe(cur, produto_df, 'produto', 'id_ncm')
             self.conn.commit()
-            cur.close()
             app_logger.info("Produtos cadastrados no banco de dados com sucesso")
         except Error as e:
             self.conn.rollback()
@@ -233,9 +201,8 @@ class BuildDatabase:
     def registra_transacao_estado (self, ano:int, tipo:Literal["exp", "imp"]) -> None:
         if tipo not in ['exp', 'imp']:
             raise ValueError("O tipo deve ser 'exp' ou 'imp'")
-        transacao_df = pd.read_csv(f'data_pipeline/datasets/limpo/{ano}/{tipo.upper()}_{ano}.csv', dtype={'CO_NCM': int})
-        uf_df = pd.read_csv(self.tabelas.auxiliar('UF'), delimiter=';', encoding='latin1')
-        uf_df = uf_df.rename(columns={'SG_UF': 'SG_UF_NCM'})
+        transacao_df = ler_tabela_limpa(ano, f'{tipo.upper()}_{ano}')
+        uf_df = self.referencia.tabela('UF').rename(columns={'SG_UF': 'SG_UF_NCM'})
         transacao_df = transacao_df.merge(uf_df, on='SG_UF_NCM', how='left')
         count = 0
         try:
@@ -280,10 +247,9 @@ class BuildDatabase:
     def registra_transacao_municipio(self, ano:int, tipo:Literal["exp", "imp"]) -> None:
         if tipo not in ['exp', 'imp']:
             raise ValueError("O tipo deve ser 'exp' ou 'imp'")        
-        transacao_df = pd.read_csv(f'data_pipeline/datasets/limpo/{ano}/{tipo.upper()}_{ano}_MUN.csv', dtype={'SH4': str})
-        transacao_df['SH4'] = transacao_df['SH4'].str.strip().str.zfill(4)
-        uf_df = pd.read_csv(self.tabelas.auxiliar('UF'), delimiter=';', encoding='latin1')
-        uf_df = uf_df.rename(columns={'SG_UF': 'SG_UF_MUN'})
+        transacao_df = ler_tabela_limpa(ano, f'{tipo.upper()}_{ano}_MUN')
+        transacao_df['SH4'] = transacao_df['SH4'].astype(str).str.strip().str.zfill(4)
+        uf_df = self.referencia.tabela('UF').rename(columns={'SG_UF': 'SG_UF_MUN'})
         transacao_df = transacao_df.merge(uf_df, on='SG_UF_MUN', how='left')
         count = 0
         try:
@@ -315,19 +281,298 @@ class BuildDatabase:
             cur.close()
             app_logger.info(f"{count} Transações por município de {tipo}ortação do ano {ano} cadastrados no banco de dados com sucesso")
         except Error as e:
-            print(id_sh4)
             self.conn.rollback()
             error_logger.error("Erro ao cadastrar transações comerciais por municipio no banco de dados: %s", str(e))
 
 
-    def registra_transacoes_estado(self) -> None:
+    def gera_mapa_estados(self) -> pd.Series:
+        '''
+            Retorna uma Series indexada pela sigla da UF com o id_estado correspondente.
+            A tabela UF é lida uma única vez por processo.
+        '''
+        return self.referencia.mapa('UF', 'SG_UF', 'CO_UF')
+
+
+    def prepara_transacoes_estado(self, transacao_df:pd.DataFrame, tipo:Literal["exp", "imp"]) -> pd.DataFrame:
+        '''
+            Converte as colunas da tabela limpa nas colunas de exportacao_estado/importacao_estado,
+            mapeando SG_UF_NCM para id_estado e calculando valor_agregado de forma vetorizada.
+        '''
+        df = pd.DataFrame({
+            'ano': transacao_df['CO_ANO'].astype('int64'),
+            'mes': transacao_df['CO_MES'].astype('int64'),
+            'id_produto': transacao_df['CO_NCM'].astype('int64'),
+            'id_pais': transacao_df['CO_PAIS'].astype('int64'),
+            'id_estado': transacao_df['SG_UF_NCM'].map(self.gera_mapa_estados()).astype('Int64'),
+            'id_modal_transporte': transacao_df['CO_VIA'].astype('int64'),
+            'id_unidade_receita_federal': transacao_df['CO_URF'].astype('int64'),
+            'quantidade': transacao_df['QT_ESTAT'].astype('int64'),
+            'kg_liquido': transacao_df['KG_LIQUIDO'],
+            'valor_fob': transacao_df['VL_FOB'],
+            'valor_agregado': transacao_df['VL_FOB'] / transacao_df['KG_LIQUIDO'],
+        })
+        if tipo == 'imp':
+            df['valor_seguro'] = transacao_df['VL_SEGURO']
+            df['valor_frete'] = transacao_df['VL_FRETE']
+        return df
+
+
+    def prepara_transacoes_municipio(self, transacao_df:pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame({
+            'ano': transacao_df['CO_ANO'].astype('int64'),
+            'mes': transacao_df['CO_MES'].astype('int64'),
+            'id_sh4': transacao_df['SH4'].astype(str).str.strip().str.zfill(4),
+            'id_pais': transacao_df['CO_PAIS'].astype('int64'),
+            'id_municipio': transacao_df['CO_MUN'].astype('int64'),
+            'kg_liquido': transacao_df['KG_LIQUIDO'],
+            'valor_fob': transacao_df['VL_FOB'],
+            'valor_agregado': transacao_df['VL_FOB'] / transacao_df['KG_LIQUIDO'],
+        })
+
+
+    def situacao_carga(self, tipo:str, ano:int) -> tuple[str, str] | None:
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT hash_arquivo, status FROM carga_manifest WHERE tipo = %s AND ano = %s", (tipo, ano))
+            return cur.fetchone()
+
+
+    def carga_concluida(self, tipo:str, ano:int, hash_atual:str) -> bool:
+        return self.situacao_carga(tipo, ano) == (hash_atual, 'concluido')
+
+
+    def registra_situacao_carga(
+        self,
+        cur,
+        tipo:str,
+        ano:int,
+        hash_atual:str,
+        status:Literal["em_andamento", "concluido", "parcial", "falhou"],
+        linhas:int | None = None,
+        duracao:float | None = None
+    ) -> None:
+        cur.execute("""
+            INSERT INTO carga_manifest (tipo, ano, hash_arquivo, linhas, status, duracao, atualizado_em)
+            VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (tipo, ano) DO UPDATE SET
+                hash_arquivo = EXCLUDED.hash_arquivo,
+                linhas = EXCLUDED.linhas,
+                status = EXCLUDED.status,
+                duracao = EXCLUDED.duracao,
+                atualizado_em = EXCLUDED.atualizado_em
+        """, (tipo, ano, hash_atual, linhas, status, duracao))
+
+
+    def esvazia_ano(self, cur, tabela:str, ano:int) -> None:
+        particao = f"{tabela}_{ano}"
+        if particao in self.particoes(tabela):
+            cur.execute(f"TRUNCATE {particao}")
+        else:
+            cur.execute(f"DELETE FROM {tabela} WHERE ano = %s", (ano,))
+
+
+    def carrega_ano(
+        self,
+        chave:str,
+        ano:int,
+        caminho:str,
+        tabela:str,
+        gera_lotes:Callable[[], Iterator[pd.DataFrame]],
+        formato:Literal["text", "csv"] = "text",
+        tabela_destino:str | None = None,
+        configuracao:str | None = None
+    ) -> int | None:
+        '''
+            Carrega um ano de `tabela` com COPY, usando carga_manifest para decidir se a carga é necessária:
+            o ano é ignorado se já foi concluído a partir de um arquivo com o mesmo hash.
+            `configuracao` descreve como os lotes são produzidos a partir do arquivo e entra no hash (hash_carga),
+            então mudá-la também recarrega o ano.
+            Caso contrário, os dados do ano são apagados (restos de uma carga interrompida ou de um arquivo antigo)
+            e recarregados; os dados e o registro 'concluido' no manifesto são gravados na mesma transação.
+            Retorna a quantidade de linhas carregadas, 0 se o ano não mudou ou None em caso de erro.
+        '''
+        if not os.path.exists(caminho):
+            error_logger.error(f"Arquivo {caminho} não encontrado para a carga {chave} de {ano}")
+            return None
+        hash_atual = hash_carga(caminho, configuracao)
+        if self.carga_concluida(chave, ano, hash_atual):
+            app_logger.info(f"Carga {chave} de {ano} já concluída para o arquivo atual.")
+            return 0
+
+        inicio = time.perf_counter()
+        count = 0
+        try:
+            with self.conn.cursor() as cur:
+                self.registra_situacao_carga(cur, chave, ano, hash_atual, 'em_andamento')
+            self.conn.commit()
+            with self.conn.cursor() as cur:
+                self.esvazia_ano(cur, tabela, ano)
+                for lote in gera_lotes():
+                    count += copy_dataframe(cur, lote, tabela_destino or tabela, formato)
+                self.registra_situacao_carga(cur, chave, ano, hash_atual, 'concluido', count, time.perf_counter() - inicio)
+            self.conn.commit()
+            app_logger.info(f"Carga {chave} de {ano} concluída via COPY: {formata_vazao(count, time.perf_counter() - inicio)}")
+            return count
+        except Error as e:
+            self.conn.rollback()
+            error_logger.error("Erro ao carregar %s no banco de dados para o ano %s: %s", tabela, ano, str(e))
+            try:
+                with self.conn.cursor() as cur:
+                    self.registra_situacao_carga(cur, chave, ano, hash_atual, 'falhou', duracao=time.perf_counter() - inicio)
+                self.conn.commit()
+            except Error:
+                self.conn.rollback()
+            return None
+        except Exception:
+            # Erro na produção dos lotes (ex: leitura ou limpeza): a transação é desfeita e o erro propagado
+            self.conn.rollback()
+            raise
+
+
+    def carrega_transacao_estado(
+        self,
+        ano:int,
+        tipo:Literal["exp", "imp"],
+        formato:Literal["text", "csv"] = "text",
+        tabela:str | None = None,
+        memoria_max_mb:float | None = None
+    ) -> int | None:
+        '''
+            Versão em massa de registra_transacao_estado: envia o ano com COPY FROM STDIN
+            em vez de um INSERT por linha. Retorna a quantidade de linhas carregadas.
+            `tabela` permite escrever direto na partição do ano (ex: exportacao_estado_2020).
+            Com `memoria_max_mb` o arquivo é lido, enriquecido e enviado em lotes que respeitam esse limite,
+            em vez de carregar o ano inteiro em memória. A carga do ano continua em uma única transação.
+        '''
+        if tipo not in ['exp', 'imp']:
+            raise ValueError("O tipo deve ser 'exp' ou 'imp'")
+        nome_arquivo = f'{tipo.upper()}_{ano}'
+        colunas = COLUNAS_ESTADO_IMP if tipo == 'imp' else COLUNAS_ESTADO
+        caminho = localiza_tabela_limpa(ano, nome_arquivo) or caminho_tabela_limpa(ano, nome_arquivo)
+        return self.carrega_ano(
+            tipo, ano, caminho, f'{tipo}ortacao_estado',
+            lambda: (
+                self.prepara_transacoes_estado(lote, tipo)
+                for lote in le_tabela_limpa_em_lotes(ano, nome_arquivo, memoria_max_mb, colunas)
+            ),
+            formato, tabela
+        )
+
+
+    def carrega_transacao_municipio(
+        self,
+        ano:int,
+        tipo:Literal["exp", "imp"],
+        formato:Literal["text", "csv"] = "text",
+        tabela:str | None = None,
+        memoria_max_mb:float | None = None
+    ) -> int | None:
+        '''
+            Equivalente a carrega_transacao_estado para as tabelas por município.
+            `tabela` permite escrever direto na partição do ano (ex: exportacao_municipio_2020).
+        '''
+        if tipo not in ['exp', 'imp']:
+            raise ValueError("O tipo deve ser 'exp' ou 'imp'")
+        nome_arquivo = f'{tipo.upper()}_{ano}_MUN'
+        caminho = localiza_tabela_limpa(ano, nome_arquivo) or caminho_tabela_limpa(ano, nome_arquivo)
+        return self.carrega_ano(
+            f'{tipo}_mun', ano, caminho, f'{tipo}ortacao_municipio',
+            lambda: (
+                self.prepara_transacoes_municipio(lote)
+                for lote in le_tabela_limpa_em_lotes(ano, nome_arquivo, memoria_max_mb, COLUNAS_MUNICIPIO)
+            ),
+            formato, tabela
+        )
+
+
+    def carrega_limpando(
+        self,
+        nivel:Literal["estado", "municipio"],
+        ano:int,
+        tipo:Literal["exp", "imp"],
+        linhas_por_lote:int = 500_000,
+        tamanho_fila:int = 4,
+        salvar_limpa:bool = False,
+        exportar_csv:bool = False,
+        salvar_excluidos:bool = True,
+        formato:Literal["text", "csv"] = "text",
+        tabela:str | None = None,
+        agregar_grao:bool = False
+    ) -> int | None:
+        '''
+            Limpa a tabela bruta do ComexStat e carrega os lotes limpos à medida que são produzidos, sem gravar
+            e reler a tabela limpa. A limpeza e a preparação dos lotes rodam em uma thread e os entregam por uma fila
+            de até `tamanho_fila` lotes, enquanto esta conexão envia o lote anterior com COPY.
+            A tabela limpa só é gravada com `salvar_limpa` (Parquet) ou `exportar_csv` (Parquet e CSV), para auditoria.
+            O carga_manifest registra o hash do arquivo bruto combinado com a configuração da limpeza
+            (LimpadorDeTabela.configuracao_limpeza), então o ano só é ignorado se nenhum dos dois mudou.
+            Com `agregar_grao` as linhas do mesmo grão são somadas na limpeza (ver LimpadorDeTabela.agregar_grao).
+        '''
+        if tipo not in ['exp', 'imp']:
+            raise ValueError("O tipo deve ser 'exp' ou 'imp'")
+        municipal = nivel == "municipio"
+        limpador = LimpadorDeTabela(exportar_csv, agregar_grao)
+        limpador.preparar_fonte(ano, f'{tipo}_mun' if municipal else tipo)
+        caminho = limpador.tabelas_cs.local(limpador.url)
+        colunas = COLUNAS_MUNICIPIO if municipal else COLUNAS_ESTADO_IMP if tipo == 'imp' else COLUNAS_ESTADO
+
+        def prepara(lote:pd.DataFrame) -> pd.DataFrame:
+            lote = lote[colunas]
+            return self.prepara_transacoes_municipio(lote) if municipal else self.prepara_transacoes_estado(lote, tipo)
+
+        def lotes_preparados() -> Iterator[pd.DataFrame]:
+            with closing(limpador.lotes_limpos(linhas_por_lote, salvar_excluidos, salvar_limpa or exportar_csv)) as lotes:
+                for lote in lotes:
+                    yield prepara(lote)
+
+        count = self.carrega_ano(
+            f'{tipo}_mun' if municipal else tipo, ano, caminho, f'{tipo}ortacao_{nivel}',
+            lambda: lotes_em_segundo_plano(lotes_preparados, tamanho_fila),
+            formato, tabela, limpador.configuracao_limpeza()
+        )
+        if count:
+            app_logger.info(f"{limpador.nome_arquivo}: {limpador.linhas_iniciais - limpador.linhas_finais} de {limpador.linhas_iniciais} linhas excluídas na limpeza")
+            if agregar_grao:
+                app_logger.info(f"{limpador.nome_arquivo}: {limpador.linhas_finais} linhas limpas agregadas em {limpador.linhas_agregadas}")
+        return count
+
+
+    def registra_transacoes_limpando(
+        self,
+        linhas_por_lote:int = 500_000,
+        tamanho_fila:int = 4,
+        salvar_limpa:bool = False,
+        exportar_csv:bool = False,
+        niveis:tuple[str, ...] = ("estado", "municipio"),
+        anos:range = range(2014, 2026),
+        agregar_grao:bool = False
+    ) -> None:
+        '''
+            Versão de registra_transacoes_estado/registra_transacoes_municipio que parte das tabelas brutas,
+            limpando e carregando cada (tipo, ano) com carrega_limpando.
+            Um ano que falhe na limpeza (ex: tabela não publicada) é registrado no log e os demais continuam.
+        '''
+        for nivel in niveis:
+            for tipo in ('exp', 'imp'):
+                for ano in anos:
+                    try:
+                        self.carrega_limpando(
+                            nivel, ano, tipo, linhas_por_lote, tamanho_fila, salvar_limpa, exportar_csv, agregar_grao=agregar_grao
+                        )
+                    except Exception as e:
+                        error_logger.error(f"Erro ao limpar e carregar {tipo}ortacao_{nivel} de {ano}: {str(e)}")
+
+
+    def registra_transacoes_estado(self, modo:Literal["insert", "copy"] = "copy", memoria_max_mb:float | None = None) -> None:
         for tipo in ('exp', 'imp'):
             for ano in range(2014, 2026):
+                if modo == "copy":
+                    self.carrega_transacao_estado(ano, tipo, memoria_max_mb=memoria_max_mb)
+                    continue
                 try:
                     cur = self.conn.cursor()
                     cur.execute(f"SELECT COUNT(*) FROM {tipo}ortacao_estado WHERE ano = {ano}")
                     res = cur.fetchone()[0]
-                    print(res)
+                    app_logger.debug(f"{res} transações de {tipo}ortação em {ano} já cadastradas")
                     if res > 0:
                         app_logger.info(f"Transações de {tipo}ortação para o ano de {ano} já está cadastradas.")
                         continue
@@ -341,14 +586,78 @@ class BuildDatabase:
                     if cur:cur.close()
 
 
-    def registra_transacoes_municipio(self) -> None:
+    def registra_transacoes_estado_paralelo(
+        self,
+        paralelismo:int = 4,
+        formato:Literal["text", "csv"] = "text",
+        memoria_max_mb:float | None = None
+    ) -> None:
+        '''
+            Carrega cada partição (tipo, ano) em um processo próprio, com conexão própria,
+            escrevendo direto na partição filha (ex: importacao_estado_2018) para evitar o roteamento
+            da tabela particionada. Ao final imprime o tempo gasto em cada partição.
+            `memoria_max_mb` é o limite de cada processo, não da carga inteira.
+            Cada processo consulta carga_manifest, então partições inalteradas terminam sem carregar nada.
+        '''
+        self.registra_particoes_paralelo("estado", paralelismo, formato, memoria_max_mb)
+
+
+    def registra_transacoes_municipio_paralelo(
+        self,
+        paralelismo:int = 4,
+        formato:Literal["text", "csv"] = "text",
+        memoria_max_mb:float | None = None
+    ) -> None:
+        self.registra_particoes_paralelo("municipio", paralelismo, formato, memoria_max_mb)
+
+
+    def registra_particoes_paralelo(
+        self,
+        nivel:Literal["estado", "municipio"],
+        paralelismo:int = 4,
+        formato:Literal["text", "csv"] = "text",
+        memoria_max_mb:float | None = None
+    ) -> None:
+        sufixo = "_MUN" if nivel == "municipio" else ""
+        particoes = [
+            (tipo, ano) for tipo in ('exp', 'imp') for ano in range(2014, 2026)
+            if localiza_tabela_limpa(ano, f'{tipo.upper()}_{ano}{sufixo}')
+        ]
+        inicio = time.perf_counter()
+        resumo = []
+        with ProcessPoolExecutor(max_workers=paralelismo) as executor:
+            futuros = {
+                executor.submit(_carrega_particao, self.config, nivel, ano, tipo, formato, memoria_max_mb): (tipo, ano)
+                for tipo, ano in particoes
+            }
+            for futuro in as_completed(futuros):
+                tipo, ano = futuros[futuro]
+                try:
+                    count, duracao = futuro.result()
+                except Exception as e:
+                    error_logger.error(f"Erro no processo de carga da partição {tipo}ortacao_{nivel}_{ano}: {str(e)}")
+                    count, duracao = None, None
+                situacao = "falhou" if count is None else "inalterada" if count == 0 else count
+                resumo.append([f"{tipo}ortacao_{nivel}_{ano}", situacao, duracao])
+        resumo.sort(key=lambda linha: linha[0])
+        app_logger.info(f"Carga paralela de {len(particoes)} partições concluída em {time.perf_counter() - inicio:.2f}s com {paralelismo} processos")
+        print(tabulate(resumo, headers=["Partição", "Linhas", "Tempo (s)"], tablefmt="grid", floatfmt=".2f"))
+
+
+    def registra_transacoes_municipio(self, modo:Literal["insert", "copy"] = "copy", memoria_max_mb:float | None = None) -> None:
         for tipo in ('exp', 'imp'):
-            for ano in range(2014, 2025):
+            for ano in range(2014, 2026):
+                if modo == "copy":
+                    if not localiza_tabela_limpa(ano, f'{tipo.upper()}_{ano}_MUN'):
+                        app_logger.info(f"Arquivo de {tipo}ortação por município de {ano} não encontrado, ano ignorado.")
+                        continue
+                    self.carrega_transacao_municipio(ano, tipo, memoria_max_mb=memoria_max_mb)
+                    continue
                 try:
                     cur = self.conn.cursor()
                     cur.execute(f"SELECT COUNT(*) FROM {tipo}ortacao_municipio WHERE ano = {ano}")
                     res = cur.fetchone()[0]
-                    print(res)
+                    app_logger.debug(f"{res} transações por município de {tipo}ortação em {ano} já cadastradas")
                     if res > 0:
                         app_logger.info(f"Transações por município de {tipo}ortação para o ano de {ano} já estão cadastradas.")
                         continue
@@ -361,6 +670,122 @@ class BuildDatabase:
                 finally:
                     if cur:cur.close()
 
+
+    def registra_objetos_adiados(self, tabelas:tuple[str, ...] = TABELAS_FATO) -> None:
+        '''
+            Guarda em carga_objetos_adiados a definição dos índices (exceto a chave primária)
+            e das chaves estrangeiras das tabelas fato, para que possam ser recriados após a carga.
+            Definições já registradas são mantidas, assim uma carga interrompida pode ser retomada.
+        '''
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, i.relname, 'indice', pg_get_indexdef(i.oid)
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                JOIN pg_class c ON c.oid = x.indrelid
+                WHERE c.relname = ANY(%s)
+                AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.oid)
+            """, (list(tabelas),))
+            indices = cur.fetchall()
+            cur.execute("""
+                SELECT c.relname, con.conname, 'fk', pg_get_constraintdef(con.oid)
+                FROM pg_constraint con
+                JOIN pg_class c ON c.oid = con.conrelid
+                WHERE con.contype = 'f' AND con.conparentid = 0
+                AND c.relname = ANY(%s)
+            """, (list(tabelas),))
+            fks = cur.fetchall()
+            if indices or fks:
+                execute_values(cur, """
+                    INSERT INTO carga_objetos_adiados (tabela, nome, tipo_objeto, definicao)
+                    VALUES %s ON CONFLICT (tabela, nome) DO NOTHING
+                """, indices + fks)
+        self.conn.commit()
+        app_logger.info(f"{len(indices)} índices e {len(fks)} chaves estrangeiras registrados para a carga em massa")
+
+
+    def objetos_adiados(self, tipo_objeto:Literal["indice", "fk"]) -> list[tuple[str, str, str]]:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT tabela, nome, definicao FROM carga_objetos_adiados WHERE tipo_objeto = %s ORDER BY tabela, nome",
+                (tipo_objeto,)
+            )
+            return cur.fetchall()
+
+
+    def remove_objetos_adiados(self) -> None:
+        with self.conn.cursor() as cur:
+            for tabela, nome, _ in self.objetos_adiados('fk'):
+                cur.execute(f"ALTER TABLE {tabela} DROP CONSTRAINT IF EXISTS {nome}")
+            for _, nome, _ in self.objetos_adiados('indice'):
+                cur.execute(f"DROP INDEX IF EXISTS {nome}")
+        self.conn.commit()
+        app_logger.info("Índices e chaves estrangeiras das tabelas fato removidos para a carga em massa")
+
+
+    def particoes(self, tabela:str) -> list[str]:
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = %s::regclass
+                ORDER BY c.relname
+            """, (tabela,))
+            return [row[0] for row in cur.fetchall()]
+
+
+    def recria_indices_adiados(self, paralelismo:int = 4) -> None:
+        '''
+            Recria os índices registrados, cada um em uma conexão própria.
+            Vários CREATE INDEX podem rodar ao mesmo tempo na mesma tabela.
+        '''
+        comandos = []
+        for _, _, definicao in self.objetos_adiados('indice'):
+            definicao = definicao.replace(" ON ONLY ", " ON ").replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1)
+            comandos.append([definicao])
+        self._executa_em_paralelo(comandos, paralelismo)
+
+
+    def revalida_fks_adiadas(self, paralelismo:int = 4) -> None:
+        '''
+            Recria as chaves estrangeiras com NOT VALID e as valida em seguida com VALIDATE CONSTRAINT,
+            que não bloqueia escritas durante a verificação.
+            O PostgreSQL não aceita NOT VALID em tabelas particionadas, então a constraint é criada e validada
+            em cada partição (uma conexão por partição) e só depois adicionada à tabela mãe,
+            que reaproveita as constraints já validadas das partições.
+        '''
+        fks = self.objetos_adiados('fk')
+        por_tabela:dict[str, list[str]] = {}
+        for tabela, nome, definicao in fks:
+            for particao in self.particoes(tabela) or [tabela]:
+                nome_particao = nome if particao == tabela else f"{particao}_{nome.removeprefix(tabela + '_')}"
+                por_tabela.setdefault(particao, []).extend([
+                    _adiciona_constraint_se_ausente(particao, nome_particao, f"{definicao} NOT VALID"),
+                    f"ALTER TABLE {particao} VALIDATE CONSTRAINT {nome_particao}",
+                ])
+        self._executa_em_paralelo(list(por_tabela.values()), paralelismo)
+
+        with self.conn.cursor() as cur:
+            for tabela, nome, definicao in fks:
+                if self.particoes(tabela):
+                    cur.execute(_adiciona_constraint_se_ausente(tabela, nome, definicao))
+        self.conn.commit()
+
+
+    def _executa_em_paralelo(self, comandos:list[list[str]], paralelismo:int) -> None:
+        with ThreadPoolExecutor(max_workers=paralelismo) as executor:
+            futuros = {executor.submit(_executa_em_conexao_propria, self.config, lista): lista for lista in comandos}
+            for futuro in as_completed(futuros):
+                futuro.result()
+                app_logger.info(f"Concluído: {futuros[futuro][-1][:90]}")
+
+
+    def limpa_objetos_adiados(self) -> None:
+        with self.conn.cursor() as cur:
+            cur.execute("DELETE FROM carga_objetos_adiados")
+        self.conn.commit()
+
+
     def atualizar_views_materializadas(self) -> None:
         atualizacoes = [
             "SELECT atualizar_mv_exportacao_estado_anual()",
@@ -381,7 +806,122 @@ class BuildDatabase:
                     pass
                 
 
-    def buid_db(self) -> None:
+    def cria_particao_ano(self, cur, tabela:str, ano:int) -> None:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {tabela}_{ano} PARTITION OF {tabela} FOR VALUES FROM ({ano}) TO ({ano + 1})")
+
+
+    def registra_mes(
+        self,
+        ano:int,
+        mes:int,
+        tipo:Literal["exp", "imp"],
+        formato:Literal["text", "csv"] = "text",
+        memoria_max_mb:float | None = None
+    ) -> int | None:
+        '''
+            Acrescenta um mês de dados à partição do ano sem recarregar o restante do ano.
+            O mês é lido da tabela limpa do ano, que o ComexStat publica acumulada, filtrando CO_MES na leitura, e os registros
+            que já existirem para o mesmo mês são substituídos, então a operação pode ser repetida.
+            Se o ano estava concluído no carga_manifest, ele passa a 'parcial' mantendo o hash da última carga completa:
+            o hash do arquivo novo cobriria também os outros meses, que não foram recarregados, e faria carrega_ano
+            ignorar o ano. Assim a próxima carga completa recarrega o ano inteiro a partir do arquivo atual.
+            Os agregados devem ser atualizados em seguida com atualizar_agregados_periodo.
+        '''
+        if tipo not in ['exp', 'imp']:
+            raise ValueError("O tipo deve ser 'exp' ou 'imp'")
+        nome_arquivo = f'{tipo.upper()}_{ano}'
+        caminho = localiza_tabela_limpa(ano, nome_arquivo)
+        if caminho is None:
+            error_logger.error(f"Tabela limpa {nome_arquivo} não encontrada")
+            return None
+        colunas = COLUNAS_ESTADO_IMP if tipo == 'imp' else COLUNAS_ESTADO
+        tabela = f'{tipo}ortacao_estado'
+        inicio = time.perf_counter()
+        count = 0
+        try:
+            with self.conn.cursor() as cur:
+                self.cria_particao_ano(cur, tabela, ano)
+                cur.execute(f"DELETE FROM {tabela} WHERE ano = %s AND mes = %s", (ano, mes))
+                removidas = cur.rowcount
+                for lote in le_tabela_limpa_em_lotes(ano, nome_arquivo, memoria_max_mb, colunas, [('CO_MES', '==', mes)]):
+                    count += copy_dataframe(cur, self.prepara_transacoes_estado(lote, tipo), tabela, formato)
+                situacao = self.situacao_carga(tipo, ano)
+                if situacao is not None and situacao[1] in ('concluido', 'parcial'):
+                    cur.execute(
+                        "UPDATE carga_manifest SET status = 'parcial', linhas = linhas + %s, atualizado_em = CURRENT_TIMESTAMP WHERE tipo = %s AND ano = %s",
+                        (count - removidas, tipo, ano)
+                    )
+            self.conn.commit()
+            app_logger.info(f"Mês {mes}/{ano} de {tipo}ortação acrescentado ({removidas} linhas substituídas): {formata_vazao(count, time.perf_counter() - inicio)}")
+            return count
+        except Error as e:
+            self.conn.rollback()
+            error_logger.error("Erro ao acrescentar o mês %s/%s de %sortação: %s", mes, ano, tipo, str(e))
+            return None
+
+
+    def atualizar_agregados_periodo(self, ano:int, mes:int) -> None:
+        '''
+            Recalcula apenas as fatias dos agregados afetadas por um mês novo:
+            o ano nos agregados anuais e o (ano, mês) na balança comercial.
+            mv_tendencia_saldo_setores não é atualizada aqui: ela continua sendo uma view materializada,
+            sem atualização por período, e é atualizada por completo com atualizar_tendencias.
+        '''
+        atualizacoes = [
+            ("SELECT atualizar_mv_exportacao_estado_anual(%s)", (ano,)),
+            ("SELECT atualizar_mv_importacao_estado_anual(%s)", (ano,)),
+            ("SELECT atualizar_mv_balanca_comercial(%s, %s)", (ano, mes)),
+            ("SELECT atualizar_mv_vlfob_setores(%s)", (ano,)),
+        ]
+        with self.conn.cursor() as cur:
+            for foo, args in atualizacoes:
+                try:
+                    inicio = time.perf_counter()
+                    cur.execute(foo, args)
+                    self.conn.commit()
+                    app_logger.info(f"Função {foo % args} finalizada em {time.perf_counter() - inicio:.2f}s")
+                except Error as e:
+                    self.conn.rollback()
+                    error_logger.error("Erro ao atualizar agregados do período %s/%s: %s", mes, ano, str(e))
+
+
+    def atualizar_tendencias(self) -> None:
+        '''
+            Atualiza mv_tendencia_saldo_setores por completo (REFRESH CONCURRENTLY, sem bloquear as leituras).
+        '''
+        with self.conn.cursor() as cur:
+            try:
+                inicio = time.perf_counter()
+                cur.execute("SELECT atualizar_mv_tendencia_saldo_setores()")
+                self.conn.commit()
+                app_logger.info(f"mv_tendencia_saldo_setores atualizada em {time.perf_counter() - inicio:.2f}s")
+            except Error as e:
+                self.conn.rollback()
+                error_logger.error("Erro ao atualizar mv_tendencia_saldo_setores: %s", str(e))
+
+
+    def buid_db(
+        self,
+        modo:Literal["insert", "copy"] = "copy",
+        paralelismo:int | None = None,
+        memoria_max_mb:float | None = None,
+        bulk_load:bool = False,
+        limpar_na_carga:bool = False
+    ) -> None:
+        '''
+            Com `limpar_na_carga` as transações são lidas das tabelas brutas e limpas durante a carga
+            (registra_transacoes_limpando), sem depender da etapa de limpeza ter gravado as tabelas limpas.
+            Com `bulk_load` os índices e chaves estrangeiras das tabelas fato são removidos antes da carga
+            e recriados depois dela (índices em paralelo, FKs com NOT VALID + VALIDATE),
+            e o tempo de cada fase é impresso ao final.
+            As transações por município só são carregadas no modo copy; os anos sem arquivo _MUN limpo são ignorados.
+        '''
+        fases:list[list] = []
+        def executa_fase(nome:str, func, *args):
+            inicio = time.perf_counter()
+            func(*args)
+            fases.append([nome, time.perf_counter() - inicio])
+
         self.registra_paises()
         self.registra_blocos()
         self.registra_estados()
@@ -391,7 +931,60 @@ class BuildDatabase:
         self.registra_cgce_n3()
         self.registra_sh()
         self.registra_produto()
-        self.registra_transacoes_estado()
-        # self.registra_transacoes_municipio()
-        self.atualizar_views_materializadas()
-        
\ No newline at end of file
+        if bulk_load:
+            executa_fase("registro de índices e FKs", self.registra_objetos_adiados)
+            executa_fase("remoção de índices e FKs", self.remove_objetos_adiados)
+        if limpar_na_carga:
+            executa_fase("limpeza e carga das transações", self.registra_transacoes_limpando)
+        elif modo == "copy" and paralelismo:
+            executa_fase("carga das transações", self.registra_transacoes_estado_paralelo, paralelismo, "text", memoria_max_mb)
+            executa_fase("carga das transações por município", self.registra_transacoes_municipio_paralelo, paralelismo, "text", memoria_max_mb)
+        else:
+            executa_fase("carga das transações", self.registra_transacoes_estado, modo, memoria_max_mb)
+            if modo == "copy":
+                executa_fase("carga das transações por município", self.registra_transacoes_municipio, modo, memoria_max_mb)
+        if bulk_load:
+            executa_fase("recriação de índices", self.recria_indices_adiados, paralelismo or 4)
+            executa_fase("validação de FKs", self.revalida_fks_adiadas, paralelismo or 4)
+            self.limpa_objetos_adiados()
+        executa_fase("atualização das views materializadas", self.atualizar_views_materializadas)
+        print(tabulate(fases, headers=["Fase", "Tempo (s)"], tablefmt="grid", floatfmt=".2f"))
+
+
+def _carrega_particao(
+    config:dict,
+    nivel:Literal["estado", "municipio"],
+    ano:int,
+    tipo:Literal["exp", "imp"],
+    formato:Literal["text", "csv"],
+    memoria_max_mb:float | None
+) -> tuple[int | None, float]:
+    inicio = time.perf_counter()
+    builder = BuildDatabase(config)
+    carrega = builder.carrega_transacao_municipio if nivel == "municipio" else builder.carrega_transacao_estado
+    try:
+        count = carrega(ano, tipo, formato, tabela=f'{tipo}ortacao_{nivel}_{ano}', memoria_max_mb=memoria_max_mb)
+    finally:
+        builder.close_connection()
+    return count, time.perf_counter() - inicio
+
+
+def _executa_em_conexao_propria(config:dict, comandos:list[str]) -> None:
+    conn = connect(**config)
+    try:
+        with conn.cursor() as cur:
+            for comando in comandos:
+                cur.execute(comando)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _adiciona_constraint_se_ausente(tabela:str, nome:str, definicao:str) -> str:
+    return f"""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{nome}' AND conrelid = '{tabela}'::regclass) THEN
+                ALTER TABLE {tabela} ADD CONSTRAINT {nome} {definicao};
+            END IF;
+        END $$;
+    """
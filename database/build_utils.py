@@ -0,0 +1,184 @@
+import csv
+import hashlib
+import io
+import queue
+import threading
+from typing import Callable, Iterator, Literal, TypeVar
+
+import pandas as pd
+from psycopg2.extensions import cursor
+from psycopg2.extras import execute_values
+
+from data_pipeline.models.tabela_limpa import Filtro, iterar_tabela_limpa, ler_tabela_limpa
+
+
+T = TypeVar("T")
+
+def dataframe_para_buffer(df: pd.DataFrame, formato: Literal["text", "csv"] = "text") -> io.StringIO:
+    '''
+        Serializa o DataFrame no formato esperado pelo COPY do PostgreSQL.
+        Valores nulos viram \\N no formato text e campo vazio no formato csv.
+        O formato text não escapa tabulações nem quebras de linha, então é destinado às tabelas fato,
+        que só possuem colunas numéricas e códigos.
+    '''
+    buffer = io.StringIO()
+    if formato == "text":
+        df.to_csv(buffer, sep="\t", header=False, index=False, na_rep="\\N", quoting=csv.QUOTE_NONE)
+    else:
+        df.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+# Um lote lido do CSV, sua versão preparada para o banco e o buffer do COPY coexistem em memória,
+# além dos temporários do pandas; o orçamento de memória é dividido por esse fator.
+FATOR_MEMORIA_LOTE = 4
+
+
+def estima_linhas_por_lote(amostra: pd.DataFrame, memoria_max_mb: float) -> int:
+    '''
+        Estima quantas linhas cabem em `memoria_max_mb` a partir de uma amostra da tabela.
+    '''
+    bytes_por_linha = amostra.memory_usage(deep=True).sum() / max(len(amostra), 1)
+    return max(1_000, int(memoria_max_mb * 1024 ** 2 / (bytes_por_linha * FATOR_MEMORIA_LOTE)))
+
+
+def le_tabela_limpa_em_lotes(
+    ano: int,
+    nome_arquivo: str,
+    memoria_max_mb: float | None = None,
+    colunas: list[str] | None = None,
+    filtros: list[Filtro] | None = None
+) -> Iterator[pd.DataFrame]:
+    '''
+        Lê a tabela limpa do ano em lotes dimensionados para `memoria_max_mb`,
+        trazendo apenas `colunas` e as linhas que atendem `filtros`.
+        Sem limite de memória a tabela é lida inteira em um único lote.
+    '''
+    if memoria_max_mb is None:
+        yield ler_tabela_limpa(ano, nome_arquivo, colunas, filtros)
+        return
+    amostra = next(iterar_tabela_limpa(ano, nome_arquivo, 10_000, colunas), pd.DataFrame())
+    linhas = estima_linhas_por_lote(amostra, memoria_max_mb)
+    yield from iterar_tabela_limpa(ano, nome_arquivo, linhas, colunas, filtros)
+
+
+_FIM = object()
+
+
+def lotes_em_segundo_plano(gera_lotes: Callable[[], Iterator[T]], tamanho_fila: int = 4) -> Iterator[T]:
+    '''
+        Consome `gera_lotes` em uma thread própria, entregando os lotes por uma fila limitada a `tamanho_fila` itens.
+        Assim a produção do próximo lote (ex: a limpeza) acontece enquanto o atual é consumido (ex: enviado com COPY),
+        e no máximo `tamanho_fila` lotes ficam em memória aguardando o consumidor.
+        Um erro na produção é relançado no consumidor; se o consumidor parar antes do fim, a produção é interrompida.
+    '''
+    fila: queue.Queue = queue.Queue(maxsize=tamanho_fila)
+    parar = threading.Event()
+
+    def coloca(item) -> bool:
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produz():
+        lotes = gera_lotes()
+        try:
+            for lote in lotes:
+                if not coloca(lote):
+                    return
+            coloca(_FIM)
+        except BaseException as e:
+            coloca(e)
+        finally:
+            # Finaliza o gerador na própria thread, descartando arquivos parciais se a produção foi interrompida
+            close = getattr(lotes, "close", None)
+            if close is not None:
+                close()
+
+    produtor = threading.Thread(target=produz, name="produtor-de-lotes", daemon=True)
+    produtor.start()
+    try:
+        while True:
+            item = fila.get()
+            if item is _FIM:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        parar.set()
+        produtor.join()
+
+
+def copy_dataframe(
+    cur: cursor,
+    df: pd.DataFrame,
+    tabela: str,
+    formato: Literal["text", "csv"] = "text",
+    linhas_por_copy: int = 200_000
+) -> int:
+    '''
+        Envia o DataFrame para a tabela com COPY FROM STDIN, em fatias de `linhas_por_copy` linhas
+        para não serializar o ano inteiro em memória de uma vez.
+        As colunas do DataFrame devem ter o mesmo nome das colunas da tabela.
+        Retorna a quantidade de linhas enviadas.
+    '''
+    if formato not in ("text", "csv"):
+        raise ValueError("O formato deve ser 'text' ou 'csv'")
+    colunas = ", ".join(df.columns)
+    comando = f"COPY {tabela} ({colunas}) FROM STDIN WITH (FORMAT {formato})"
+    for inicio in range(0, len(df), linhas_por_copy):
+        fatia = df.iloc[inicio:inicio + linhas_por_copy]
+        cur.copy_expert(comando, dataframe_para_buffer(fatia, formato))
+    return len(df)
+
+
+def formata_vazao(linhas: int, segundos: float) -> str:
+    vazao = linhas / segundos if segundos > 0 else float("inf")
+    return f"{linhas} linhas em {segundos:.2f}s ({vazao:,.0f} linhas/s)"
+
+
+def linhas_dataframe(df: pd.DataFrame) -> list[tuple]:
+    '''
+        Converte o DataFrame em tuplas de tipos nativos do Python (NaN vira None),
+        que é o que o psycopg2 sabe adaptar.
+    '''
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def upsert_dataframe(cur: cursor, df: pd.DataFrame, tabela: str, chave: str, page_size: int = 10_000) -> int:
+    '''
+        Insere o DataFrame com INSERT ... ON CONFLICT DO NOTHING em lotes de `page_size` linhas,
+        uma ida ao banco por lote em vez de uma por linha.
+    '''
+    colunas = ", ".join(df.columns)
+    execute_values(
+        cur,
+        f"INSERT INTO {tabela} ({colunas}) VALUES %s ON CONFLICT ({chave}) DO NOTHING",
+        linhas_dataframe(df),
+        page_size=page_size
+    )
+    return len(df)
+
+
+def hash_arquivo(caminho: str, tamanho_bloco: int = 1024 * 1024) -> str:
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def hash_carga(caminho: str, configuracao: str | None = None) -> str:
+    '''
+        Hash gravado no carga_manifest: o do arquivo, combinado com `configuracao` quando os lotes
+        carregados dependem de algo além dele (ex: as regras de limpeza aplicadas na carga).
+    '''
+    if configuracao is None:
+        return hash_arquivo(caminho)
+    return hashlib.sha256(f"{hash_arquivo(caminho)}:{configuracao}".encode()).hexdigest()
@@ -135,8 +135,22 @@ BEGIN
     END LOOP;
 END $$;
 
+-- Versões antigas das tabelas por município não eram particionadas: são preservadas com o sufixo _legado
+DO $$
+DECLARE
+    tabela TEXT;
+BEGIN
+    FOREACH tabela IN ARRAY ARRAY['importacao_municipio', 'exportacao_municipio'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_class WHERE relname = tabela AND relkind = 'r') THEN
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', tabela, tabela || '_legado');
+            EXECUTE format('ALTER INDEX IF EXISTS %I RENAME TO %I', tabela || '_pkey', tabela || '_legado_pkey');
+            EXECUTE format('ALTER SEQUENCE IF EXISTS %I RENAME TO %I', tabela || '_id_transacao_seq', tabela || '_legado_id_transacao_seq');
+        END IF;
+    END LOOP;
+END $$;
+
 CREATE TABLE IF NOT EXISTS importacao_municipio (
-    id_transacao SERIAL PRIMARY KEY,
+    id_transacao SERIAL,
     ano INT,
     mes INT,
     id_sh4 VARCHAR(4),
@@ -147,13 +161,14 @@ CREATE TABLE IF NOT EXISTS importacao_municipio (
     valor_agregado DECIMAL(15,2),
     valor_seguro DECIMAL(15,2),
     valor_frete DECIMAL(15,2),
+    PRIMARY KEY (id_transacao, ano),
     FOREIGN KEY (id_sh4) REFERENCES sh4 (id_sh4),
     FOREIGN KEY (id_pais) REFERENCES pais (id_pais),
     FOREIGN KEY (id_municipio) REFERENCES municipio (id_municipio)
-);
+) PARTITION BY RANGE (ano);
 
 CREATE TABLE IF NOT EXISTS exportacao_municipio (
-    id_transacao SERIAL PRIMARY KEY,
+    id_transacao SERIAL,
     ano INT,
     mes INT,
     id_sh4 VARCHAR(4),
@@ -162,10 +177,60 @@ CREATE TABLE IF NOT EXISTS exportacao_municipio (
     valor_fob DECIMAL(15,2),
     kg_liquido DECIMAL(15,2),
     valor_agregado DECIMAL(15,2),
+    PRIMARY KEY (id_transacao, ano),
     FOREIGN KEY (id_sh4) REFERENCES sh4 (id_sh4),
     FOREIGN KEY (id_pais) REFERENCES pais (id_pais),
     FOREIGN KEY (id_municipio) REFERENCES municipio (id_municipio)
-);
+) PARTITION BY RANGE (ano);
+
+-- Criar partições por município para os anos
+DO $$
+DECLARE
+    ano_atual INT := EXTRACT(YEAR FROM CURRENT_DATE);
+    ano_inicio INT := 2014;
+BEGIN
+    FOR ano IN ano_inicio..ano_atual LOOP
+        EXECUTE format('
+            CREATE TABLE IF NOT EXISTS exportacao_municipio_%s PARTITION OF exportacao_municipio
+            FOR VALUES FROM (%s) TO (%s);
+        ', ano, ano, ano + 1);
+
+        EXECUTE format('
+            CREATE TABLE IF NOT EXISTS importacao_municipio_%s PARTITION OF importacao_municipio
+            FOR VALUES FROM (%s) TO (%s);
+        ', ano, ano, ano + 1);
+    END LOOP;
+END $$;
+
+-- Copia as linhas das tabelas _legado para as novas tabelas particionadas, na mesma transação da troca,
+-- para que a API não passe a ler tabelas vazias. A cópia só acontece com a tabela nova vazia, então executar
+-- o script de novo não duplica linhas; as partições dos anos fora do intervalo acima são criadas antes.
+-- As duas versões têm as mesmas colunas, na mesma ordem; linhas sem ano não cabem em nenhuma partição e ficam só no _legado.
+DO $$
+DECLARE
+    tabela TEXT;
+    ano_legado INT;
+    vazia BOOLEAN;
+BEGIN
+    FOREACH tabela IN ARRAY ARRAY['importacao_municipio', 'exportacao_municipio'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_class WHERE relname = tabela || '_legado' AND relkind = 'r') THEN
+            EXECUTE format('SELECT NOT EXISTS (SELECT 1 FROM %I)', tabela) INTO vazia;
+            IF vazia THEN
+                FOR ano_legado IN EXECUTE format('SELECT DISTINCT ano FROM %I WHERE ano IS NOT NULL', tabela || '_legado') LOOP
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%s) TO (%s)',
+                        tabela || '_' || ano_legado, tabela, ano_legado, ano_legado + 1
+                    );
+                END LOOP;
+                EXECUTE format('INSERT INTO %I SELECT * FROM %I WHERE ano IS NOT NULL', tabela, tabela || '_legado');
+                EXECUTE format(
+                    'SELECT setval(pg_get_serial_sequence(%L, ''id_transacao''), COALESCE(MAX(id_transacao), 0) + 1, false) FROM %I',
+                    tabela, tabela
+                );
+            END IF;
+        END IF;
+    END LOOP;
+END $$;
 
 CREATE INDEX IF NOT EXISTS idx_ano_id_produto ON exportacao_estado(ano, id_produto);
 CREATE INDEX IF NOT EXISTS idx_ano_mes_estado ON exportacao_estado(ano, mes, id_estado);
@@ -180,128 +245,120 @@ CREATE INDEX IF NOT EXISTS idx_municipio_estado ON municipio(id_estado);
 CREATE INDEX IF NOT EXISTS idx_pais_bloco ON pais(id_bloco);
 CREATE INDEX IF NOT EXISTS idx_exportacao_estado_ano_mes_tipo ON exportacao_estado (ano, mes, id_estado, id_pais, id_produto);
 CREATE INDEX IF NOT EXISTS idx_importacao_estado_ano_mes_tipo ON importacao_estado (ano, mes, id_estado, id_pais, id_produto);
+CREATE INDEX IF NOT EXISTS idx_exportacao_municipio_municipio ON exportacao_municipio (id_municipio);
+CREATE INDEX IF NOT EXISTS idx_exportacao_municipio_sh4 ON exportacao_municipio (id_sh4);
+CREATE INDEX IF NOT EXISTS idx_exportacao_municipio_ano_mes ON exportacao_municipio (ano, mes);
+CREATE INDEX IF NOT EXISTS idx_importacao_municipio_municipio ON importacao_municipio (id_municipio);
+CREATE INDEX IF NOT EXISTS idx_importacao_municipio_sh4 ON importacao_municipio (id_sh4);
+CREATE INDEX IF NOT EXISTS idx_importacao_municipio_ano_mes ON importacao_municipio (ano, mes);
 
 CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- Situação da carga de cada (tipo, ano); tipo é 'exp', 'imp', 'exp_mun' ou 'imp_mun'.
+-- status 'parcial': meses acrescentados com registra_mes depois da última carga completa, cujo hash é mantido
+-- hash_arquivo: sha256 do arquivo carregado; na carga com limpeza, combinado com as opções e o código da limpeza
+CREATE TABLE IF NOT EXISTS carga_manifest (
+    tipo VARCHAR(10),
+    ano INT,
+    hash_arquivo VARCHAR(64) NOT NULL,
+    linhas BIGINT,
+    status VARCHAR(20) NOT NULL,
+    duracao DOUBLE PRECISION,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tipo, ano)
+);
+
+-- Definições de índices e chaves estrangeiras removidas durante uma carga em massa
+CREATE TABLE IF NOT EXISTS carga_objetos_adiados (
+    tabela VARCHAR(100),
+    nome VARCHAR(100),
+    tipo_objeto VARCHAR(10) NOT NULL,
+    definicao TEXT NOT NULL,
+    PRIMARY KEY (tabela, nome)
+);
 '''
 
+# Os agregados abaixo eram views materializadas. Como views materializadas só podem ser recalculadas
+# por inteiro, agora são tabelas comuns (com os mesmos nomes usados pela API) mantidas pelas funções
+# atualizar_mv_*, que aceitam o período a recalcular.
+remove_views_materializadas_antigas = """
+DO $$ BEGIN
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'mv_exportacao_estado_anual') THEN
+        DROP MATERIALIZED VIEW mv_exportacao_estado_anual;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'mv_importacao_estado_anual') THEN
+        DROP MATERIALIZED VIEW mv_importacao_estado_anual;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'mv_balanca_comercial') THEN
+        DROP MATERIALIZED VIEW mv_balanca_comercial;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'mv_vlfob_setores') THEN
+        DROP MATERIALIZED VIEW mv_vlfob_setores;
+    END IF;
+END $$;
+
+DROP FUNCTION IF EXISTS atualizar_mv_exportacao_estado_anual();
+DROP FUNCTION IF EXISTS atualizar_mv_importacao_estado_anual();
+DROP FUNCTION IF EXISTS atualizar_mv_balanca_comercial();
+DROP FUNCTION IF EXISTS atualizar_mv_vlfob_setores();
+"""
+
 cria_mv_exportacao_estado_anual = """
-CREATE MATERIALIZED VIEW IF NOT EXISTS mv_exportacao_estado_anual AS
-SELECT 
-    ano,
-    id_estado,
-    id_produto,
-    id_pais,
-    SUM(quantidade) as quantidade_total,
-    SUM(valor_fob) as valor_fob_total,
-    SUM(kg_liquido) as kg_liquido_total,
-    SUM(valor_agregado) as valor_agregado_total
-FROM exportacao_estado
-GROUP BY ano, id_estado, id_produto, id_pais;
+CREATE TABLE IF NOT EXISTS mv_exportacao_estado_anual (
+    ano INT,
+    id_estado INT,
+    id_produto INT,
+    id_pais INT,
+    quantidade_total NUMERIC,
+    valor_fob_total NUMERIC,
+    kg_liquido_total NUMERIC,
+    valor_agregado_total NUMERIC
+);
 
 CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_exportacao_estado_anual ON mv_exportacao_estado_anual(ano, id_estado, id_produto, id_pais);
 """
 
 cria_mv_importacao_estado_anual = """
-CREATE MATERIALIZED VIEW IF NOT EXISTS mv_importacao_estado_anual AS
-SELECT 
-    ano,
-    id_estado,
-    id_produto,
-    id_pais,
-    SUM(quantidade) as quantidade_total,
-    SUM(valor_fob) as valor_fob_total,
-    SUM(kg_liquido) as kg_liquido_total,
-    SUM(valor_agregado) as valor_agregado_total,
-    SUM(valor_seguro) as valor_seguro_total,
-    SUM(valor_frete) as valor_frete_total
-FROM importacao_estado
-GROUP BY ano, id_estado, id_produto, id_pais;
+CREATE TABLE IF NOT EXISTS mv_importacao_estado_anual (
+    ano INT,
+    id_estado INT,
+    id_produto INT,
+    id_pais INT,
+    quantidade_total NUMERIC,
+    valor_fob_total NUMERIC,
+    kg_liquido_total NUMERIC,
+    valor_agregado_total NUMERIC,
+    valor_seguro_total NUMERIC,
+    valor_frete_total NUMERIC
+);
 
 CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_importacao_estado_anual ON mv_importacao_estado_anual(ano, id_estado, id_produto, id_pais);
 """
 
 cria_mv_balanca_comercial = """
-CREATE MATERIALIZED VIEW IF NOT EXISTS mv_balanca_comercial AS
-WITH exp AS (
-    SELECT
-        ano,
-        mes,
-        id_pais,
-        id_estado,
-        SUM(valor_fob) AS total_exportado
-    FROM exportacao_estado
-    GROUP BY ano, mes, id_pais, id_estado
-),
-imp AS (
-    SELECT
-        ano,
-        mes,
-        id_pais,
-        id_estado,
-        SUM(valor_fob) AS total_importado
-    FROM importacao_estado
-    GROUP BY ano, mes, id_pais, id_estado 
-)
-SELECT
-    COALESCE(exp.ano, imp.ano) AS ano,
-    COALESCE(exp.mes, imp.mes) AS mes,
-    COALESCE(exp.id_pais, imp.id_pais) AS id_pais,
-    COALESCE(exp.id_estado, imp.id_estado) AS id_estado,
-    exp.total_exportado,
-    imp.total_importado,
-    COALESCE(exp.total_exportado, 0) - COALESCE(imp.total_importado, 0) AS balanca_comercial
-FROM exp
-FULL OUTER JOIN imp
-    ON exp.ano = imp.ano
-    AND exp.mes = imp.mes
-    AND exp.id_pais = imp.id_pais
-    AND exp.id_estado = imp.id_estado
-ORDER BY ano, mes;
-
--- Índices para as views materializadas
-CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_exportacao_estado_anual ON mv_exportacao_estado_anual(ano, id_estado, id_produto, id_pais);
-CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_importacao_estado_anual ON mv_importacao_estado_anual(ano, id_estado, id_produto, id_pais);
+CREATE TABLE IF NOT EXISTS mv_balanca_comercial (
+    ano INT,
+    mes INT,
+    id_pais INT,
+    id_estado INT,
+    total_exportado NUMERIC,
+    total_importado NUMERIC,
+    balanca_comercial NUMERIC
+);
 
 CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_balanca_comercial_unique ON mv_balanca_comercial (ano, mes, id_pais, id_estado);
 """
 
 cria_mv_vlfob_setores = """
-CREATE MATERIALIZED VIEW IF NOT EXISTS mv_vlfob_setores AS
-WITH exportacoes AS (
-    SELECT 
-        s.id_sh4,
-        e.ano,
-        e.id_estado,
-        SUM(e.valor_fob) AS valor_fob_exp,
-        SUM(e.kg_liquido) AS kg_liquido_exp
-    FROM produto p
-    JOIN sh4 s ON s.id_sh4 = p.id_sh4
-    JOIN exportacao_estado e ON e.id_produto = p.id_ncm
-    GROUP BY s.id_sh4, ano, e.id_estado
-),
-importacoes AS (
-    SELECT 
-        s.id_sh4,
-        i.ano,
-        i.id_estado,
-        SUM(i.valor_fob) AS valor_fob_imp,
-        SUM(i.kg_liquido) AS kg_liquido_imp
-    FROM produto p
-    JOIN sh4 s ON s.id_sh4 = p.id_sh4
-    JOIN importacao_estado i ON i.id_produto = p.id_ncm
-    GROUP BY s.id_sh4, ano, i.id_estado
-)
-SELECT 
-    COALESCE(e.id_sh4, i.id_sh4) AS id_sh4,
-    COALESCE(e.ano, i.ano) AS ano,
-    COALESCE(e.id_estado, i.id_estado) AS id_estado,
-    COALESCE(e.valor_fob_exp, 0) AS valor_fob_exp,
-    COALESCE(i.valor_fob_imp, 0) AS valor_fob_imp,
-    COALESCE(e.kg_liquido_exp, 0) AS kg_liquido_exp,
-    COALESCE(i.kg_liquido_imp, 0) AS kg_liquido_imp
-FROM exportacoes e
-FULL OUTER JOIN importacoes i
-    ON e.id_sh4 = i.id_sh4 AND e.ano = i.ano AND e.id_estado = i.id_estado  ;
+CREATE TABLE IF NOT EXISTS mv_vlfob_setores (
+    id_sh4 VARCHAR(4),
+    ano INT,
+    id_estado INT,
+    valor_fob_exp NUMERIC,
+    valor_fob_imp NUMERIC,
+    kg_liquido_exp NUMERIC,
+    kg_liquido_imp NUMERIC
+);
 
 CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_vlfob_setores ON mv_vlfob_setores (id_sh4, ano, id_estado);
 """
@@ -332,39 +389,156 @@ CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_tendencia_saldo_setores ON mv_tendencia
 
 """
 
+# As funções recalculam o agregado inteiro quando chamadas sem argumentos
+# ou apenas o período informado (ano, e mês quando o agregado é mensal).
+# A recarga completa usa DELETE em vez de TRUNCATE: a função roda em uma única transação, então as consultas
+# concorrentes continuam lendo as linhas antigas até o commit, enquanto o TRUNCATE (ACCESS EXCLUSIVE) as bloquearia.
+# mv_tendencia_saldo_setores continua sendo uma view materializada, atualizada só por completo com
+# atualizar_mv_tendencia_saldo_setores (REFRESH CONCURRENTLY).
+# Os filtros usam BETWEEN com COALESCE para que o planejador descarte as partições de outros anos.
 atualiza_mv_exportacao_estado_anual = """
-CREATE OR REPLACE FUNCTION atualizar_mv_exportacao_estado_anual()
+CREATE OR REPLACE FUNCTION atualizar_mv_exportacao_estado_anual(p_ano INT DEFAULT NULL)
 RETURNS void AS $$
 BEGIN
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_exportacao_estado_anual;
+    DELETE FROM mv_exportacao_estado_anual WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999);
+
+    INSERT INTO mv_exportacao_estado_anual
+    SELECT 
+        ano,
+        id_estado,
+        id_produto,
+        id_pais,
+        SUM(quantidade) as quantidade_total,
+        SUM(valor_fob) as valor_fob_total,
+        SUM(kg_liquido) as kg_liquido_total,
+        SUM(valor_agregado) as valor_agregado_total
+    FROM exportacao_estado
+    WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999)
+    GROUP BY ano, id_estado, id_produto, id_pais;
 END;
 $$ LANGUAGE plpgsql;
 """
 
 atualiza_mv_importacao_estado_anual = """
-CREATE OR REPLACE FUNCTION atualizar_mv_importacao_estado_anual()
+CREATE OR REPLACE FUNCTION atualizar_mv_importacao_estado_anual(p_ano INT DEFAULT NULL)
 RETURNS void AS $$
 BEGIN
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_importacao_estado_anual;
+    DELETE FROM mv_importacao_estado_anual WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999);
+
+    INSERT INTO mv_importacao_estado_anual
+    SELECT 
+        ano,
+        id_estado,
+        id_produto,
+        id_pais,
+        SUM(quantidade) as quantidade_total,
+        SUM(valor_fob) as valor_fob_total,
+        SUM(kg_liquido) as kg_liquido_total,
+        SUM(valor_agregado) as valor_agregado_total,
+        SUM(valor_seguro) as valor_seguro_total,
+        SUM(valor_frete) as valor_frete_total
+    FROM importacao_estado
+    WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999)
+    GROUP BY ano, id_estado, id_produto, id_pais;
 END;
 $$ LANGUAGE plpgsql;
 """
 
 atualiza_mv_balanca_comercial = """
-CREATE OR REPLACE FUNCTION atualizar_mv_balanca_comercial()
+CREATE OR REPLACE FUNCTION atualizar_mv_balanca_comercial(p_ano INT DEFAULT NULL, p_mes INT DEFAULT NULL)
 RETURNS void AS $$
 BEGIN
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_balanca_comercial;
+    DELETE FROM mv_balanca_comercial
+    WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999)
+    AND mes BETWEEN COALESCE(p_mes, 1) AND COALESCE(p_mes, 12);
+
+    INSERT INTO mv_balanca_comercial
+    WITH exp AS (
+        SELECT
+            ano,
+            mes,
+            id_pais,
+            id_estado,
+            SUM(valor_fob) AS total_exportado
+        FROM exportacao_estado
+        WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999)
+        AND mes BETWEEN COALESCE(p_mes, 1) AND COALESCE(p_mes, 12)
+        GROUP BY ano, mes, id_pais, id_estado
+    ),
+    imp AS (
+        SELECT
+            ano,
+            mes,
+            id_pais,
+            id_estado,
+            SUM(valor_fob) AS total_importado
+        FROM importacao_estado
+        WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999)
+        AND mes BETWEEN COALESCE(p_mes, 1) AND COALESCE(p_mes, 12)
+        GROUP BY ano, mes, id_pais, id_estado 
+    )
+    SELECT
+        COALESCE(exp.ano, imp.ano) AS ano,
+        COALESCE(exp.mes, imp.mes) AS mes,
+        COALESCE(exp.id_pais, imp.id_pais) AS id_pais,
+        COALESCE(exp.id_estado, imp.id_estado) AS id_estado,
+        exp.total_exportado,
+        imp.total_importado,
+        COALESCE(exp.total_exportado, 0) - COALESCE(imp.total_importado, 0) AS balanca_comercial
+    FROM exp
+    FULL OUTER JOIN imp
+        ON exp.ano = imp.ano
+        AND exp.mes = imp.mes
+        AND exp.id_pais = imp.id_pais
+        AND exp.id_estado = imp.id_estado;
 END;
 $$ LANGUAGE plpgsql;
 """
 
 atualiza_mv_vlfob_setores = """
-CREATE OR REPLACE FUNCTION atualizar_mv_vlfob_setores()
+CREATE OR REPLACE FUNCTION atualizar_mv_vlfob_setores(p_ano INT DEFAULT NULL)
 RETURNS void AS $$
 BEGIN
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_vlfob_setores;
-
+    DELETE FROM mv_vlfob_setores WHERE ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999);
+
+    INSERT INTO mv_vlfob_setores
+    WITH exportacoes AS (
+        SELECT 
+            s.id_sh4,
+            e.ano,
+            e.id_estado,
+            SUM(e.valor_fob) AS valor_fob_exp,
+            SUM(e.kg_liquido) AS kg_liquido_exp
+        FROM produto p
+        JOIN sh4 s ON s.id_sh4 = p.id_sh4
+        JOIN exportacao_estado e ON e.id_produto = p.id_ncm
+        WHERE e.ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999)
+        GROUP BY s.id_sh4, ano, e.id_estado
+    ),
+    importacoes AS (
+        SELECT 
+            s.id_sh4,
+            i.ano,
+            i.id_estado,
+            SUM(i.valor_fob) AS valor_fob_imp,
+            SUM(i.kg_liquido) AS kg_liquido_imp
+        FROM produto p
+        JOIN sh4 s ON s.id_sh4 = p.id_sh4
+        JOIN importacao_estado i ON i.id_produto = p.id_ncm
+        WHERE i.ano BETWEEN COALESCE(p_ano, 0) AND COALESCE(p_ano, 9999)
+        GROUP BY s.id_sh4, ano, i.id_estado
+    )
+    SELECT 
+        COALESCE(e.id_sh4, i.id_sh4) AS id_sh4,
+        COALESCE(e.ano, i.ano) AS ano,
+        COALESCE(e.id_estado, i.id_estado) AS id_estado,
+        COALESCE(e.valor_fob_exp, 0) AS valor_fob_exp,
+        COALESCE(i.valor_fob_imp, 0) AS valor_fob_imp,
+        COALESCE(e.kg_liquido_exp, 0) AS kg_liquido_exp,
+        COALESCE(i.kg_liquido_imp, 0) AS kg_liquido_imp
+    FROM exportacoes e
+    FULL OUTER JOIN importacoes i
+        ON e.id_sh4 = i.id_sh4 AND e.ano = i.ano AND e.id_estado = i.id_estado;
 END;
 $$ LANGUAGE plpgsql;
 """
@@ -379,20 +553,13 @@ $$ LANGUAGE plpgsql;
 """
 
 atualiza_views = """
--- Função para atualizar as views materializadas
+-- Função para atualizar os agregados
 CREATE OR REPLACE FUNCTION atualizar_views_materializadas()
 RETURNS void AS $$
 BEGIN
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_exportacao_estado_anual;
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_importacao_estado_anual;
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_balanca_comercial;
-END;
-$$ LANGUAGE plpgsql;
-
-CREATE OR REPLACE FUNCTION atualizar_mv_vlfob_setores()
-RETURNS void AS $$
-BEGIN
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_vlfob_setores;
+    PERFORM atualizar_mv_exportacao_estado_anual();
+    PERFORM atualizar_mv_importacao_estado_anual();
+    PERFORM atualizar_mv_balanca_comercial();
 END;
 $$ LANGUAGE plpgsql;
 
@@ -104,6 +104,7 @@ def cria_views_materializadas():
     if not conn:
         return
     scripts = [
+        create.remove_views_materializadas_antigas,
         create.cria_mv_exportacao_estado_anual,
         create.cria_mv_importacao_estado_anual,
         create.cria_mv_balanca_comercial,
@@ -149,11 +150,20 @@ def cria_funcoes():
         conn.close()
 
 
-def init_db():
+def init_db(paralelismo: int | None = None, memoria_max_mb: float | None = None, bulk_load: bool = False, limpar_na_carga: bool = False):
     create_database_if_not_exists()
     create_tables_if_not_exist()
     cria_views_materializadas()
     cria_funcoes()
     builder = BuildDatabase(configure)
-    builder.buid_db()
-    builder.close_connection()
\ No newline at end of file
+    builder.buid_db(paralelismo=paralelismo, memoria_max_mb=memoria_max_mb, bulk_load=bulk_load, limpar_na_carga=limpar_na_carga)
+    builder.close_connection()
+
+
+def atualiza_mes(ano: int, mes: int, memoria_max_mb: float | None = None):
+    builder = BuildDatabase(configure)
+    for tipo in ('exp', 'imp'):
+        builder.registra_mes(ano, mes, tipo, memoria_max_mb=memoria_max_mb)
+    builder.atualizar_agregados_periodo(ano, mes)
+    builder.atualizar_tendencias()
+    builder.close_connection()
@@ -1,7 +1,13 @@
+import argparse
+
 from data_pipeline.models.pre_processamento_tendencias import PreProcessador
 
 
 if __name__ == "__main__":
-    proc = PreProcessador()
-    proc.salvar_dados_agregados()
-    
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Gera os dados agregados a partir das tabelas limpas")
+    parser.add_argument("--em-lotes", action="store_true", help="processa um ano por vez em vez de carregar todas as transações")
+    parser.add_argument("--linhas-por-lote", type=int, help="com --em-lotes, lê cada ano em lotes desse tamanho")
+    parser.add_argument("--workers", type=int, help="agregados gerados ao mesmo tempo (por padrão, um por CPU)")
+    args = parser.parse_args()
+    proc = PreProcessador(em_lotes=args.em_lotes, linhas_por_lote=args.linhas_por_lote)
+    proc.salvar_dados_agregados(args.workers)
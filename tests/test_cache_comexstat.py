@@ -0,0 +1,121 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from data_pipeline.models.cache_comexstat import CacheComexStat
+
+
+class Servidor:
+    '''
+        Servidor HTTP local que publica um único arquivo com ETag e responde 304 às requisições condicionais.
+    '''
+    def __init__(self):
+        self.conteudo = b'CO_PAIS;NO_PAIS\n1;Brasil\n'
+        self.etag = '"v1"'
+        self.requisicoes = []
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor.requisicoes.append(dict(self.headers))
+                if self.headers.get('If-None-Match') == servidor.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', servidor.etag)
+                self.send_header('Content-Length', str(len(servidor.conteudo)))
+                self.end_headers()
+                self.wfile.write(servidor.conteudo)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.http.server_port}/PAIS.csv'
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def servidor():
+    servidor = Servidor()
+    yield servidor
+    servidor.http.shutdown()
+    servidor.http.server_close()
+
+
+def _le(caminho:str) -> bytes:
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
+
+
+def test_primeiro_download(tmp_path, servidor):
+    cache = CacheComexStat(str(tmp_path))
+    caminho = cache.local(servidor.url)
+    assert _le(caminho) == servidor.conteudo
+    assert cache.le_indice()[servidor.url]['etag'] == '"v1"'
+    # Dentro do TTL o servidor não é consultado
+    assert cache.local(servidor.url) == caminho
+    assert len(servidor.requisicoes) == 1
+
+
+def test_revalidacao_304_apos_ttl(tmp_path, servidor):
+    cache = CacheComexStat(str(tmp_path), ttl=0)
+    caminho = cache.local(servidor.url)
+    verificado_em = cache.le_indice()[servidor.url]['verificado_em']
+    assert cache.local(servidor.url) == caminho
+    assert len(servidor.requisicoes) == 2
+    assert servidor.requisicoes[1]['If-None-Match'] == '"v1"'
+    assert cache.le_indice()[servidor.url]['verificado_em'] > verificado_em
+
+
+def test_etag_alterado_substitui_o_objeto(tmp_path, servidor):
+    cache = CacheComexStat(str(tmp_path), ttl=0)
+    antigo = cache.local(servidor.url)
+    servidor.conteudo = b'CO_PAIS;NO_PAIS\n1;Brasil\n2;Argentina\n'
+    servidor.etag = '"v2"'
+    novo = cache.local(servidor.url)
+    assert novo != antigo
+    assert _le(novo) == servidor.conteudo
+    assert cache.le_indice()[servidor.url]['etag'] == '"v2"'
+    # O objeto anterior não é mais referenciado, mas continua legível durante a carência
+    assert _le(antigo) == b'CO_PAIS;NO_PAIS\n1;Brasil\n'
+    assert cache.limpa_objetos(carencia=0) == 1
+    assert not os.path.exists(antigo)
+
+
+def test_ttl_expirado(tmp_path, servidor):
+    cache = CacheComexStat(str(tmp_path))
+    cache.local(servidor.url)
+    cache.ttl = 0
+    cache.local(servidor.url)
+    assert len(servidor.requisicoes) == 2
+
+
+def test_limpa_objetos_orfaos(tmp_path, servidor):
+    cache = CacheComexStat(str(tmp_path))
+    caminho = cache.local(servidor.url)
+    orfao = cache.caminho_objeto('0' * 64)
+    with open(orfao, 'wb') as arquivo:
+        arquivo.write(b'antigo')
+    assert cache.limpa_objetos() == 0
+    os.utime(orfao, (0, 0))
+    assert cache.limpa_objetos() == 1
+    assert not os.path.exists(orfao)
+    assert os.path.exists(caminho)
+
+
+def test_atualizacoes_concorrentes_do_indice(tmp_path):
+    cache = CacheComexStat(str(tmp_path))
+    urls = [f'http://exemplo/{i}.csv' for i in range(20)]
+    threads = [
+        threading.Thread(target=cache.atualiza_indice, args=(url, {'sha256': f'{i:064d}', 'verificado_em': 0}))
+        for i, url in enumerate(urls)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(cache.le_indice()) == set(urls)
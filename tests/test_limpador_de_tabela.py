@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from data_pipeline.models.limpador_de_tabela import LimpadorDeTabela, agrega_grao
+from data_pipeline.models.tabela_limpa import ler_tabela_limpa
+
+
+class TabelasLocais:
+    def __init__(self, caminho:str):
+        self.caminho = caminho
+
+    def local(self, url:str) -> str:
+        return self.caminho
+
+
+def _limpador(caminho:str) -> LimpadorDeTabela:
+    limpador = LimpadorDeTabela(agregar_grao=True)
+    limpador.tabelas_cs = TabelasLocais(caminho)
+    limpador.ano, limpador.tipo, limpador.nome_arquivo, limpador.url = 2020, 'exp', 'EXP_2020', 'EXP_2020.csv'
+    limpador.rotas_invalidas = np.zeros((20, 1000), dtype=bool)
+    return limpador
+
+
+def test_agregacao_no_grao_em_lotes_junta_grao_de_lotes_diferentes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    linhas = 1000
+    bruto = pd.DataFrame({
+        'CO_ANO': 2020,
+        'CO_MES': rng.integers(1, 3, linhas),
+        'CO_NCM': rng.integers(1, 4, linhas),
+        'CO_UNID': 10,
+        'CO_PAIS': 160,
+        'SG_UF_NCM': rng.choice(['SP', 'RJ'], linhas),
+        'CO_VIA': 1,
+        'CO_URF': 817600,
+        'QT_ESTAT': rng.integers(1, 10, linhas),
+        'KG_LIQUIDO': rng.integers(1, 10, linhas),
+        'VL_FOB': rng.integers(1, 100, linhas),
+    })
+    caminho = tmp_path / 'EXP_2020.csv'
+    bruto.to_csv(caminho, sep=';', index=False, encoding='latin1')
+
+    limpador = _limpador(str(caminho))
+    lotes = list(limpador.lotes_limpos(linhas_por_lote=70, salvar_excluidos=False))
+
+    grao = ['CO_MES', 'CO_NCM', 'SG_UF_NCM']
+    resultado = pd.concat(lotes, ignore_index=True)
+    assert not resultado.duplicated(grao).any()
+    assert limpador.linhas_agregadas == len(resultado) == 12
+    esperado = bruto.groupby(grao)['VL_FOB'].sum()
+    obtido = resultado.astype({'SG_UF_NCM': str}).groupby(grao)['VL_FOB'].sum()
+    pd.testing.assert_series_equal(obtido, esperado, check_dtype=False, check_index_type=False)
+
+    gravada = ler_tabela_limpa(2020, 'EXP_2020')
+    assert len(gravada) == 12
+    pd.testing.assert_frame_equal(gravada.reset_index(drop=True), agrega_grao(gravada).reset_index(drop=True))
+
+
+def test_sigla_desconhecida_vai_para_os_excluidos(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bruto = pd.DataFrame({
+        'CO_ANO': 2020, 'CO_MES': 1, 'CO_NCM': 1, 'CO_UNID': 10, 'CO_PAIS': 160,
+        'SG_UF_NCM': ['SP', 'XX', 'EX'], 'CO_VIA': 1, 'CO_URF': 817600,
+        'QT_ESTAT': 1, 'KG_LIQUIDO': 1, 'VL_FOB': 1,
+    })
+    caminho = tmp_path / 'EXP_2020.csv'
+    bruto.to_csv(caminho, sep=';', index=False, encoding='latin1')
+
+    limpador = _limpador(str(caminho))
+    limpador.agregar_grao = False
+    lotes = list(limpador.lotes_limpos(salvar_excluidos=False, salvar_limpa=False))
+
+    assert pd.concat(lotes)['SG_UF_NCM'].tolist() == ['SP']
+    assert limpador.contagem_motivos['estado_invalido'] == 2
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from data_pipeline.models.registros_excluidos import (
+    le_bits_motivos,
+    ler_registros_excluidos,
+    salvar_registros_excluidos,
+)
+
+
+def _excluidos(linhas:int, motivos:list[int], **colunas) -> pd.DataFrame:
+    return pd.DataFrame({
+        'CO_ANO': [2020] * linhas,
+        'CO_MES': list(range(1, linhas + 1)),
+        'CO_NCM': [1012100] * linhas,
+        'SG_UF_NCM': ['SP'] * linhas,
+        'VL_FOB': [100] * linhas,
+        **colunas,
+        'MOTIVOS': pd.Series(motivos, dtype='uint16'),
+    })
+
+
+@pytest.fixture
+def diretorio(tmp_path):
+    # A partição de exp foi gravada com uma ordem de REGRAS diferente da de imp,
+    # e só a de imp tem VL_FRETE e VL_SEGURO
+    exp = _excluidos(3, [1, 2, 3])
+    imp = _excluidos(2, [1, 2], VL_FRETE=[7, 8], VL_SEGURO=[1, 2])
+    salvar_registros_excluidos(exp, 2020, 'exp', {'rotas_absurdas': 1, 'via_invalida': 2}, str(tmp_path))
+    salvar_registros_excluidos(imp, 2020, 'imp', {'via_invalida': 1, 'rotas_absurdas': 2}, str(tmp_path))
+    return str(tmp_path)
+
+
+def test_colunas_exclusivas_de_imp_sao_mantidas(diretorio):
+    df = ler_registros_excluidos(diretorio=diretorio)
+    assert len(df) == 5
+    imp = df[df['tipo'] == 'imp']
+    assert imp['VL_FRETE'].tolist() == [7, 8]
+    assert imp['VL_SEGURO'].tolist() == [1, 2]
+    assert df.loc[df['tipo'] == 'exp', 'VL_FRETE'].isna().all()
+
+
+def test_filtro_de_tipo_le_apenas_a_particao(diretorio):
+    df = ler_registros_excluidos(tipos=['imp'], colunas=['CO_MES', 'VL_FRETE'], diretorio=diretorio)
+    assert df.columns.tolist() == ['CO_MES', 'VL_FRETE']
+    assert df['VL_FRETE'].dtype == 'int64'
+    assert df['VL_FRETE'].tolist() == [7, 8]
+
+
+def test_motivos_usam_os_bits_de_cada_particao(diretorio):
+    assert le_bits_motivos(diretorio)[(2020, 'imp')] == {'via_invalida': 1, 'rotas_absurdas': 2}
+    df = ler_registros_excluidos(['rotas_absurdas'], colunas=['tipo', 'CO_MES'], diretorio=diretorio)
+    assert sorted(map(tuple, df.values.tolist())) == [('exp', 1), ('exp', 3), ('imp', 2)]
+
+
+def test_motivo_desconhecido(diretorio):
+    with pytest.raises(ValueError):
+        ler_registros_excluidos(['inexistente'], diretorio=diretorio)